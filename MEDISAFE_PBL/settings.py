@@ -12,10 +12,14 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test`
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -51,17 +55,22 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for serving static/media on Render
+    'myapp.middleware.RequestMetricsMiddleware',  # Query/template timing, Server-Timing header
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.middleware.ProfilingMiddleware',  # ?__profile=1 for super-admins (after sessions)
+    'myapp.middleware.MemoryMiddleware',  # Sampled peak allocation of MEMORY_PEAK_VIEWS
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 # Authentication settings
+# ProfileModelBackend is Django's ModelBackend, but loads the user and their
+# profile in a single query.
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'myapp.features.auth.backends.ProfileModelBackend',
 ]
 
 LOGIN_URL = 'homepage2'
@@ -120,6 +129,26 @@ DATABASES = {
 }
 
 
+# Cache
+# Set REDIS_URL (e.g. redis://localhost:6379/0) to share the cache between
+# gunicorn workers; this also switches the site activity ring buffer to a
+# Redis list. Without it each worker uses its own local-memory cache.
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+# Cached groups that must be invalidated in every worker (doctor directory,
+# slot bitmaps) carry a database version in their keys; workers re-read the
+# versions after this many seconds (myapp.utils.cache_versions)
+CACHE_VERSION_TTL = int(os.getenv('CACHE_VERSION_TTL', '5'))
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+
 # Custom User Model
 AUTH_USER_MODEL = 'myapp.User'  
 
@@ -145,6 +174,28 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new and re-hashed passwords: 'argon2'
+# (default), 'bcrypt' or 'pbkdf2'. Hashes made with another hasher keep
+# working and are upgraded transparently on the user's next login.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'argon2').lower()
+
+_PASSWORD_HASHERS = {
+    'argon2': 'myapp.features.auth.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'myapp.features.auth.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+_preferred_hasher = _PASSWORD_HASHERS.get(PASSWORD_HASHER, _PASSWORD_HASHERS['argon2'])
+PASSWORD_HASHERS = [_preferred_hasher] + [
+    h for h in _PASSWORD_HASHERS.values() if h != _preferred_hasher
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -195,3 +246,104 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Audit log writer: entries are flushed with bulk_create once this many are
+# queued, or every AUDIT_LOG_FLUSH_SECONDS (0 disables time-based flushing).
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', '50'))
+# No timer thread under `manage.py test`: it would write outside the test's transaction
+AUDIT_LOG_FLUSH_SECONDS = 0 if TESTING else float(os.getenv('AUDIT_LOG_FLUSH_SECONDS', '5'))
+
+# Rate limiting for login, forgot_password and verify_account
+# (myapp.utils.rate_limit). Override per scope, e.g.
+# RATE_LIMITS = {'login': {'ip': '30/m', 'username': '10/5m'}}
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('1', 'true', 'yes', 'on')
+# Behind Render's proxy the client address is the X-Forwarded-For entry the
+# proxy appended. RATE_LIMIT_TRUSTED_PROXIES is the number of trusted proxies
+# in front of the app; entries further left are client-supplied and ignored.
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = bool(os.getenv('RENDER')) or os.getenv('RATE_LIMIT_TRUST_X_FORWARDED_FOR', '').lower() in ('1', 'true', 'yes', 'on')
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '1'))
+RATE_LIMITS = {}
+
+# Appointment reminders (manage.py send_reminders) go out this many hours ahead
+REMINDER_LEAD_HOURS = int(os.getenv('REMINDER_LEAD_HOURS', '24'))
+
+# Push channels for myapp.utils.notify: dotted paths to callables that
+# receive the list of Notification objects created by each fan-out
+NOTIFICATION_CHANNELS = []
+
+# Generated notifications (myapp.utils.notification_sync) are synced on a
+# background thread after the triggering change commits. False syncs inline,
+# which tests do so that no thread outlives the test's transaction.
+NOTIFICATION_SYNC_ASYNC = (
+    os.getenv('NOTIFICATION_SYNC_ASYNC', 'True').lower() in ('1', 'true', 'yes', 'on') and not TESTING
+)
+
+# Notifications older than this are purged (cleanup_old_notifications /
+# notification_partitions) and hidden from notification lists
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '15'))
+
+# Per-request instrumentation (myapp.middleware.RequestMetricsMiddleware):
+# query count/time, template time and size are logged on `myapp.requests` at
+# INFO, shown with REQUEST_METRICS_LOG_LEVEL=INFO. Requests slower than
+# REQUEST_METRICS_SLOW_MS are logged at WARNING with their slowest SQL.
+# The Server-Timing header exposes query counts and DB time to any client,
+# so it is off unless REQUEST_METRICS_SERVER_TIMING is set.
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'True').lower() in ('1', 'true', 'yes', 'on')
+REQUEST_METRICS_SLOW_MS = int(os.getenv('REQUEST_METRICS_SLOW_MS', '500'))
+REQUEST_METRICS_TOP_SQL = int(os.getenv('REQUEST_METRICS_TOP_SQL', '5'))
+REQUEST_METRICS_SERVER_TIMING = os.getenv('REQUEST_METRICS_SERVER_TIMING', 'False').lower() in ('1', 'true', 'yes', 'on')
+
+# Prometheus /metrics (myapp.utils.metrics). Scrapes are allowed from these
+# addresses when no proxy is involved, or with "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Slow query archive (myapp.utils.slow_queries, `manage.py slow_queries`):
+# statements over SLOW_QUERY_MS are grouped by fingerprint into the
+# slow_queries table every SLOW_QUERY_FLUSH_SECONDS. Their plans are refreshed
+# at most every SLOW_QUERY_EXPLAIN_INTERVAL seconds, for a sampled share, and
+# cleared after SLOW_QUERY_PLAN_DAYS.
+SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'True').lower() in ('1', 'true', 'yes', 'on')
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_FLUSH_SECONDS = float(os.getenv('SLOW_QUERY_FLUSH_SECONDS', '30'))
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '3600'))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0.1'))
+SLOW_QUERY_PLAN_DAYS = int(os.getenv('SLOW_QUERY_PLAN_DAYS', '7'))
+
+# Profiling (myapp.utils.profiling): super-admins get a cProfile report of
+# any page with ?__profile=1 (folded stacks with ?__profile=folded); the
+# always-on sampler writes folded stacks per worker to PROFILING_DIR.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() in ('1', 'true', 'yes', 'on')
+PROFILING_DIR = os.getenv('PROFILING_DIR', '')
+PROFILING_SAMPLER_ENABLED = os.getenv('PROFILING_SAMPLER_ENABLED', '').lower() in ('1', 'true', 'yes', 'on')
+PROFILING_SAMPLER_INTERVAL = float(os.getenv('PROFILING_SAMPLER_INTERVAL', '0.01'))
+PROFILING_SAMPLER_FLUSH_SECONDS = float(os.getenv('PROFILING_SAMPLER_FLUSH_SECONDS', '60'))
+
+# Memory (myapp.utils.memory): admins drive tracemalloc through
+# /api/admin/memory/ (snapshots go to PROFILING_DIR/memory). The peak
+# allocation of MEMORY_PEAK_SAMPLE_RATE of the requests to MEMORY_PEAK_VIEWS
+# is logged and exported. gunicorn recycles a worker once its RSS passes
+# MEMORY_MAX_RSS_MB (env var read by gunicorn.conf.py; 0 disables).
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv('MEMORY_TRACEMALLOC_FRAMES', '1'))
+MEMORY_SNAPSHOTS_KEEP = int(os.getenv('MEMORY_SNAPSHOTS_KEEP', '10'))  # per worker
+MEMORY_PEAK_VIEWS = [
+    'download_lab_result', 'doctor_download_lab_result', 'admin_lab_result_download',
+    'prescription_download', 'download_prescription', 'admin_prescription_download',
+    'generate_prescription_pdf',
+]
+MEMORY_PEAK_SAMPLE_RATE = float(os.getenv('MEMORY_PEAK_SAMPLE_RATE', '0.1'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'myapp.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
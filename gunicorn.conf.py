@@ -0,0 +1,42 @@
+"""
+Gunicorn settings, picked up automatically from the working directory.
+
+Prometheus metrics (myapp.utils.metrics) are shared between workers through
+files in PROMETHEUS_MULTIPROC_DIR; it has to be set before the workers
+import prometheus_client and emptied on every start.
+
+With MEMORY_MAX_RSS_MB set, a worker whose RSS has grown past it exits after
+the request it is serving and is replaced.
+"""
+
+import glob
+import os
+import tempfile
+
+
+def on_starting(server):
+    path = os.environ.setdefault(
+        'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'medisafe-metrics')
+    )
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, '*.db')):
+        os.remove(stale)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# Retire a worker once its RSS passes this many MiB (0: never); see
+# myapp.utils.memory.recycle_if_bloated. Complements max_requests.
+MAX_RSS_MB = int(os.getenv('MEMORY_MAX_RSS_MB', '0'))
+
+
+def post_request(worker, req, environ, resp):
+    if MAX_RSS_MB:
+        from myapp.utils.memory import recycle_if_bloated
+        recycle_if_bloated(worker, MAX_RSS_MB)
@@ -8,6 +8,10 @@ class MyappConfig(AppConfig):
         # Import signal handlers to register them. Keeps activity logging in-memory (cache) without migrations.
         try:
             from .utils import activity_signals  # noqa: F401
+            from .utils import doctor_directory  # noqa: F401
+            from .utils import audit_log  # noqa: F401
+            from .utils import availability  # noqa: F401
+            from .utils import notification_sync  # noqa: F401
         except Exception:
             # Avoid breaking app startup if signals fail to import
             pass
@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.db.models import Count, Q, Avg, Max, Min, StdDev, Variance
+from django.db.models.functions import TruncMonth
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from datetime import datetime, timedelta
@@ -9,6 +10,86 @@ import csv
 import statistics
 from ...models import User, UserProfile, Patient, Doctor, Appointment, BookedService, LabResult
 
+
+def generate_caption(stats, data_type, role_dist=None):
+    """Generate adaptive, descriptive captions based on statistical data"""
+    if not stats:
+        return "Insufficient data for statistical analysis."
+
+    captions = []
+
+    # For roles - describe the distribution
+    if data_type == 'User Roles' and role_dist:
+        role_names = {
+            'admin': 'Administrators',
+            'doctor': 'Doctors',
+            'nurse': 'Nurses',
+            'lab_tech': 'Lab Technicians',
+            'patient': 'Patients'
+        }
+        total_users = sum(role_dist.values())
+        if total_users > 0:
+            role_parts = []
+            for role in ['admin', 'doctor', 'nurse', 'lab_tech', 'patient']:
+                count = role_dist.get(role, 0)
+                if count > 0:
+                    pct = (count / total_users) * 100
+                    role_parts.append(f"{role_names.get(role, role)}: {count} ({pct:.1f}%)")
+            if role_parts:
+                captions.append(f"User composition - {', '.join(role_parts)}. Total: {total_users} users.")
+        return " ".join(captions) if captions else ""
+
+    # Central tendency and summary statistics
+    if stats.get('mean') is not None:
+        mean_val = stats['mean']
+        max_val = stats.get('max', 0)
+        min_val = stats.get('min', 0)
+        captions.append(f"Average: {mean_val:.1f}, ranging from {min_val} to {max_val}.")
+
+    # Consistency analysis (without high variability warning)
+    if stats.get('std_dev', 0) > 0 and stats.get('mean', 0) > 0:
+        cv = (stats['std_dev'] / stats['mean']) * 100
+        if cv < 25:
+            captions.append(f"Consistent distribution (CV: {cv:.1f}%) indicates stable {data_type.lower()} patterns.")
+        else:
+            captions.append(f"Distribution shows variation (CV: {cv:.1f}%) across {data_type.lower()} categories.")
+
+    # Most common element
+    if stats.get('most_common'):
+        captions.append(f"Most common: {stats['most_common']} with {stats.get('max', 0)} entries.")
+
+    # Total information
+    if stats.get('total_roles'):
+        captions.append(f"{stats['total_roles']} distinct roles identified.")
+    if stats.get('total_statuses'):
+        captions.append(f"{stats['total_statuses']} different appointment statuses tracked.")
+    if stats.get('total_types'):
+        captions.append(f"{stats['total_types']} different lab result types recorded.")
+    if stats.get('total_doctors'):
+        captions.append(f"{stats['total_doctors']} doctors contributing to statistics.")
+
+    return " ".join(captions) if captions else f"Analysis of {data_type.lower()}"
+
+
+def calculate_stats(data_list):
+    """Mean, median, standard deviation, min and max of the numbers in data_list"""
+    if not data_list or len(data_list) == 0:
+        return {}
+    try:
+        values = [v for v in data_list if isinstance(v, (int, float))]
+        if not values:
+            return {}
+        return {
+            'mean': round(statistics.mean(values), 2),
+            'median': round(statistics.median(values), 2),
+            'std_dev': round(statistics.stdev(values), 2) if len(values) > 1 else 0,
+            'min': min(values),
+            'max': max(values),
+        }
+    except Exception:
+        return {}
+
+
 def analytics(request):
     """Analytics dashboard with comprehensive statistics and charts"""
     if request.session.get("is_admin"):
@@ -102,7 +183,7 @@ def analytics(request):
             })
         
         # Doctor performance (consultations per doctor)
-        doctor_performance_qs = Doctor.objects.select_related('user').annotate(
+        doctor_performance_qs = Doctor.objects.select_related('user__userprofile').annotate(
             consultation_count=Count('doctor_consultations', filter=Q(doctor_consultations__created_at__gte=timeframe_start))
         )
         
@@ -182,66 +263,6 @@ def analytics(request):
         
         approval_rate = (total_approved / (total_approved + total_rejected)) * 100 if (total_approved + total_rejected) > 0 else 0
         
-        # ===== HELPER FUNCTION FOR ADAPTIVE CAPTIONS (DEFINED EARLY TO AVOID SCOPE ISSUES) =====
-        def generate_caption(stats, data_type, role_dist=None):
-            """Generate adaptive, descriptive captions based on statistical data"""
-            if not stats:
-                return "Insufficient data for statistical analysis."
-            
-            captions = []
-            
-            # For roles - describe the distribution
-            if data_type == 'User Roles' and role_dist:
-                role_names = {
-                    'admin': 'Administrators',
-                    'doctor': 'Doctors',
-                    'nurse': 'Nurses',
-                    'lab_tech': 'Lab Technicians',
-                    'patient': 'Patients'
-                }
-                total_users = sum(role_dist.values())
-                if total_users > 0:
-                    role_parts = []
-                    for role in ['admin', 'doctor', 'nurse', 'lab_tech', 'patient']:
-                        count = role_dist.get(role, 0)
-                        if count > 0:
-                            pct = (count / total_users) * 100
-                            role_parts.append(f"{role_names.get(role, role)}: {count} ({pct:.1f}%)")
-                    if role_parts:
-                        captions.append(f"User composition - {', '.join(role_parts)}. Total: {total_users} users.")
-                return " ".join(captions) if captions else ""
-            
-            # Central tendency and summary statistics
-            if stats.get('mean') is not None:
-                mean_val = stats['mean']
-                max_val = stats.get('max', 0)
-                min_val = stats.get('min', 0)
-                captions.append(f"Average: {mean_val:.1f}, ranging from {min_val} to {max_val}.")
-            
-            # Consistency analysis (without high variability warning)
-            if stats.get('std_dev', 0) > 0 and stats.get('mean', 0) > 0:
-                cv = (stats['std_dev'] / stats['mean']) * 100
-                if cv < 25:
-                    captions.append(f"Consistent distribution (CV: {cv:.1f}%) indicates stable {data_type.lower()} patterns.")
-                else:
-                    captions.append(f"Distribution shows variation (CV: {cv:.1f}%) across {data_type.lower()} categories.")
-            
-            # Most common element
-            if stats.get('most_common'):
-                captions.append(f"Most common: {stats['most_common']} with {stats.get('max', 0)} entries.")
-            
-            # Total information
-            if stats.get('total_roles'):
-                captions.append(f"{stats['total_roles']} distinct roles identified.")
-            if stats.get('total_statuses'):
-                captions.append(f"{stats['total_statuses']} different appointment statuses tracked.")
-            if stats.get('total_types'):
-                captions.append(f"{stats['total_types']} different lab result types recorded.")
-            if stats.get('total_doctors'):
-                captions.append(f"{stats['total_doctors']} doctors contributing to statistics.")
-            
-            return " ".join(captions) if captions else f"Analysis of {data_type.lower()}"
-        
         # ===== DESCRIPTIVE STATISTICS =====
         # Calculate statistics for monthly consultations
         monthly_counts = [item['count'] for item in monthly_consultations]
@@ -539,9 +560,9 @@ def analytics_api(request):
         # Role distribution - Include all roles, even if count is 0
         all_roles = ['admin', 'doctor', 'nurse', 'lab_tech', 'patient']
         role_distribution = {}
+        role_counts = dict(User.objects.values_list('role').annotate(count=Count('pk')).order_by())
         for role in all_roles:
-            count = User.objects.filter(role=role).count()
-            role_distribution[role] = count
+            role_distribution[role] = role_counts.get(role, 0)
         
         # Consultation status
         consultation_status_list = list(
@@ -551,16 +572,17 @@ def analytics_api(request):
         )
         
         # Monthly consultations
-        monthly_consultations = list(
-            Appointment.objects.filter(created_at__gte=timeframe_start)
-            .extra(select={'month': "DATE_FORMAT(created_at, '%%Y-%%m')"})
+        monthly_consultations = [
+            {'month': item['month'].strftime('%Y-%m'), 'count': item['count']}
+            for item in Appointment.objects.filter(created_at__gte=timeframe_start)
+            .annotate(month=TruncMonth('created_at'))
             .values('month')
             .annotate(count=Count('consultation_id'))
             .order_by('month')
-        )
+        ]
         
         # Doctor performance
-        doctor_performance_qs = Doctor.objects.select_related('user').annotate(
+        doctor_performance_qs = Doctor.objects.select_related('user__userprofile').annotate(
             consultation_count=Count('doctor_consultations', filter=Q(doctor_consultations__created_at__gte=timeframe_start))
         )
         
@@ -754,7 +776,7 @@ def get_dynamic_statistics(request):
             }]
         
         # Doctor performance
-        doctor_performance_qs = Doctor.objects.select_related('user').annotate(
+        doctor_performance_qs = Doctor.objects.select_related('user__userprofile').annotate(
             consultation_count=Count('doctor_consultations', filter=Q(doctor_consultations__created_at__gte=period_start, doctor_consultations__created_at__lt=period_end))
         ).order_by('-consultation_count')[:10]
         
@@ -768,24 +790,6 @@ def get_dynamic_statistics(request):
             for d in doctor_performance_qs
         ]
         
-        # Statistics calculations
-        def calculate_stats(data_list):
-            if not data_list or len(data_list) == 0:
-                return {}
-            try:
-                values = [v for v in data_list if isinstance(v, (int, float))]
-                if not values:
-                    return {}
-                return {
-                    'mean': round(statistics.mean(values), 2),
-                    'median': round(statistics.median(values), 2),
-                    'std_dev': round(statistics.stdev(values), 2) if len(values) > 1 else 0,
-                    'min': min(values),
-                    'max': max(values),
-                }
-            except Exception:
-                return {}
-        
         # Role stats
         role_counts = list(role_distribution.values())
         role_stats = calculate_stats(role_counts)
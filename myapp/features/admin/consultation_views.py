@@ -7,7 +7,10 @@ from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Q
 import json
-from ...models import User, Appointment, Notification
+from ...models import User, Appointment, SlotConflict
+from ...utils.audit_log import log_action
+from ...utils.notify import notify
+from ...utils.display_numbers import next_number
 from django.forms.models import model_to_dict
 
 def mod_consultations(request):
@@ -127,13 +130,17 @@ def update_consultation_status(request):
 
         consultation.updated_at = timezone.now()
         consultation.save()
+        log_action(
+            request, 'complete' if is_completion else 'status', 'Appointment', consultation.consultation_id,
+            summary=f"Appointment {status.lower()}", detail=f"{consultation.consultation_date} {consultation.consultation_time}"
+        )
 
-        # Create patient-facing notifications based on status change
+        # Notify the patient about the status change
         try:
-            patient_user = consultation.patient
+            recipients = [consultation.patient_id]
             if is_completion and status == 'Completed':
-                Notification.objects.create(
-                    user=patient_user,
+                notify(
+                    recipients,
                     title="Appointment Completed",
                     message=f"Your appointment with Dr. {consultation.doctor.user.get_full_name()} on {consultation.consultation_date} has been marked completed.",
                     notification_type='appointment',
@@ -142,8 +149,8 @@ def update_consultation_status(request):
                 )
             elif not is_completion:
                 if status == 'Approved':
-                    Notification.objects.create(
-                        user=patient_user,
+                    notify(
+                        recipients,
                         title="Appointment Approved",
                         message=f"Your appointment on {consultation.consultation_date} at {consultation.consultation_time} has been approved.",
                         notification_type='appointment',
@@ -151,8 +158,8 @@ def update_consultation_status(request):
                         related_id=consultation.consultation_id
                     )
                 elif status == 'Rejected':
-                    Notification.objects.create(
-                        user=patient_user,
+                    notify(
+                        recipients,
                         title="Appointment Rejected",
                         message=f"Your appointment on {consultation.consultation_date} was rejected and set to Cancelled.",
                         notification_type='urgent',
@@ -160,8 +167,8 @@ def update_consultation_status(request):
                         related_id=consultation.consultation_id
                     )
                 elif status == 'Pending':
-                    Notification.objects.create(
-                        user=patient_user,
+                    notify(
+                        recipients,
                         title="Appointment Pending",
                         message=f"Your appointment on {consultation.consultation_date} is pending review.",
                         notification_type='appointment',
@@ -179,6 +186,8 @@ def update_consultation_status(request):
 
     except Appointment.DoesNotExist:
         return JsonResponse({"error": "Appointment not found"}, status=404)
+    except SlotConflict:
+        return JsonResponse({"error": "The doctor already has an appointment at that time"}, status=409)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -253,11 +262,9 @@ def save_consultation(request):
 
         # Approve if requested
         if data.get('approve'):
-            # Require appointment number when approving
-            provided_appt_no = (data.get('appointment_number') or '').strip()
-            existing_appt_no = appt.appointment_number or ''
-            if not (provided_appt_no or existing_appt_no):
-                return JsonResponse({"error": "Appointment number is required to approve an appointment."}, status=400)
+            # Approved appointments always carry a number; allocate one if none was given
+            if not appt.appointment_number:
+                appt.appointment_number = next_number('appointment')
 
             appt.approval_status = 'Approved'
             appt.approved_at = timezone.now()
@@ -273,18 +280,22 @@ def save_consultation(request):
 
         # Return appropriate message
         if data.get('approve'):
-            message = "Appointment approved successfully"
+            action, message = 'approve', "Appointment approved successfully"
         elif data.get('reject'):
-            message = "Appointment rejected successfully"
+            action, message = 'reject', "Appointment rejected successfully"
         else:
-            message = "Appointment saved successfully"
+            action, message = 'update', "Appointment saved successfully"
+        log_action(
+            request, action, 'Appointment', appt.consultation_id,
+            summary=message.replace(' successfully', ''), detail=f"{appt.consultation_date} {appt.consultation_time}"
+        )
 
-        # Create notifications for the patient user
+        # Notify the patient
         try:
-            patient_user = appt.patient
+            recipients = [appt.patient_id]
             if data.get('approve'):
-                Notification.objects.create(
-                    user=patient_user,
+                notify(
+                    recipients,
                     title="Appointment Approved",
                     message=f"Your appointment on {appt.consultation_date} at {appt.consultation_time} has been approved.",
                     notification_type='appointment',
@@ -292,8 +303,8 @@ def save_consultation(request):
                     related_id=appt.consultation_id
                 )
             elif data.get('reject'):
-                Notification.objects.create(
-                    user=patient_user,
+                notify(
+                    recipients,
                     title="Appointment Rejected",
                     message=f"Your appointment on {appt.consultation_date} was rejected and set to Cancelled.",
                     notification_type='urgent',
@@ -301,8 +312,8 @@ def save_consultation(request):
                     related_id=appt.consultation_id
                 )
             else:
-                Notification.objects.create(
-                    user=patient_user,
+                notify(
+                    recipients,
                     title="Appointment Updated",
                     message=f"Your appointment details for {appt.consultation_date} may have changed.",
                     notification_type='appointment',
@@ -315,6 +326,8 @@ def save_consultation(request):
         return JsonResponse({"success": True, "message": message})
     except Appointment.DoesNotExist:
         return JsonResponse({"error": "Appointment not found"}, status=404)
+    except SlotConflict:
+        return JsonResponse({"error": "The doctor already has an appointment at that time"}, status=409)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -339,6 +352,7 @@ def delete_consultation(request):
         try:
             consultation = Appointment.objects.get(consultation_id=consultation_id)
             consultation.delete()
+            log_action(request, 'delete', 'Appointment', consultation_id, summary="Appointment deleted")
             return JsonResponse({
                 "success": True,
                 "message": "Appointment deleted successfully",
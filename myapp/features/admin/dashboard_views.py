@@ -3,7 +3,11 @@ from django.contrib import messages
 from django.utils import timezone
 from datetime import date, timedelta
 from ...models import User, UserProfile, Patient, LabResult, Appointment, BookedService, RolePermission
-from django.core.cache import cache
+from ...utils.activity_store import read_events, clear_events
+from ...utils.audit_log import recent_entries
+from ...utils.rate_limit import throttle_counters
+from ...utils import memory
+from django.db.models import Count
 from django.http import JsonResponse
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
@@ -11,19 +15,71 @@ from django.views.decorators.http import require_http_methods
 import json
 import datetime
 
+RECENT_ACTIVITY_LIMIT = 8
 
-def _display_name_of_user(user):
-    if not user:
-        return None
+
+def _recent_activities():
+    """Merge the newest audit log entries with recent login/logout events."""
+    recent_activities = []
     try:
-        full = getattr(user, 'get_full_name', None)
-        if callable(full):
-            name = full()
-            if name:
-                return name
+        for ev in read_events(limit=RECENT_ACTIVITY_LIMIT):
+            recent_activities.append({
+                'type': 'Auth',
+                'summary': ev.get('summary'),
+                'detail': ev.get('detail'),
+                'link': ev.get('link') or 'mod_users',
+                'date': ev.get('date')
+            })
     except Exception:
+        # activity store may be unavailable in some environments
         pass
-    return getattr(user, 'username', str(user))
+
+    for entry in recent_entries(limit=RECENT_ACTIVITY_LIMIT):
+        actor = entry.actor_label or (f"User #{entry.actor_id}" if entry.actor_id else '')
+        detail = entry.detail
+        if actor:
+            detail = f"{detail} ({actor})" if detail else actor
+        recent_activities.append({
+            'type': entry.target_type,
+            'summary': entry.summary,
+            'detail': detail,
+            'link': entry.link or 'moddashboard',
+            'date': entry.created_at
+        })
+
+    return sorted([r for r in recent_activities if r.get('date')], key=lambda x: x['date'], reverse=True)[:RECENT_ACTIVITY_LIMIT]
+
+
+def _schedule_summary(today, days=14):
+    """Appointment and booked service counts for each of the next `days` days."""
+    try:
+        end = today + timedelta(days=days - 1)
+        appt_counts = dict(
+            Appointment.objects.filter(consultation_date__range=(today, end))
+            .values_list('consultation_date').annotate(n=Count('pk')).order_by()
+        )
+        lab_counts = dict(
+            BookedService.objects.filter(booking_date__range=(today, end))
+            .values_list('booking_date').annotate(n=Count('pk')).order_by()
+        )
+        appt_base = reverse('mod_consultations')
+        lab_base = reverse('labresults')
+        summary = []
+        for i in range(days):
+            d = today + timedelta(days=i)
+            summary.append({
+                'date': d,
+                'date_str': d.strftime('%a %b %d'),
+                'iso': d.isoformat(),
+                'appt_count': appt_counts.get(d, 0),
+                'lab_count': lab_counts.get(d, 0),
+                'appt_link': appt_base + f'?date={d.isoformat()}',
+                'lab_link': lab_base + f'?date={d.isoformat()}',
+            })
+        return summary
+    except Exception:
+        return []
+
 
 def moddashboard(request):
     """Admin dashboard view"""
@@ -49,102 +105,11 @@ def moddashboard(request):
         today_booked_services = BookedService.objects.filter(booking_date=today).select_related('user','user__userprofile').order_by('booking_time')
         
         latest_accounts = User.objects.order_by('-date_joined')[:5]
-        latest_lab_results = LabResult.objects.select_related('user','uploaded_by').order_by('-upload_date')[:5]
+        latest_lab_results = LabResult.objects.select_related('user','uploaded_by__userprofile').defer('result_file').order_by('-upload_date')[:5]
         latest_appointments = Appointment.objects.select_related('doctor','doctor__user','patient','patient__userprofile').order_by('-created_at')[:5]
-        # Collect cached auth events (login/logout) from in-memory cache
-        recent_activities = []
-        try:
-            cached_events = cache.get('site_recent_activity_events', [])
-            for ev in cached_events:
-                recent_activities.append({
-                    'type': 'Auth',
-                    'summary': ev.get('summary'),
-                    'detail': ev.get('detail'),
-                    'link': ev.get('link', 'mod_users'),
-                    'date': ev.get('date')
-                })
-        except Exception:
-            # cache may be unavailable in some environments
-            pass
-
-        # Build a unified recent activity list from appointments, lab results and booked services
-        for appt in latest_appointments:
-            try:
-                dt = getattr(appt, 'created_at', None)
-            except Exception:
-                dt = None
-            # Resolve doctor name safely
-            doctor_name = None
-            try:
-                if getattr(appt, 'doctor', None) and getattr(appt.doctor, 'user', None):
-                    doctor_name = _display_name_of_user(appt.doctor.user)
-            except Exception:
-                doctor_name = None
-            patient_name = None
-            try:
-                if getattr(appt, 'patient', None):
-                    patient_name = _display_name_of_user(appt.patient)
-            except Exception:
-                patient_name = None
-            summary = 'Appointment'
-            if doctor_name:
-                summary = f"Appointment: Dr. {doctor_name}"
-            elif patient_name:
-                summary = f"Appointment: {patient_name}"
-            recent_activities.append({
-                'type': 'Appointment',
-                'summary': summary,
-                'detail': getattr(appt, 'consultation_type', ''),
-                'link': 'mod_consultations',
-                'date': dt
-            })
-
-        for lr in latest_lab_results:
-            user_obj = getattr(lr, 'user', None)
-            user_name = _display_name_of_user(user_obj) if user_obj else ''
-            recent_activities.append({
-                'type': 'LabResult',
-                'summary': f"Lab: {getattr(lr, 'lab_type', 'Result')}",
-                'detail': user_name,
-                'link': 'mod_records',
-                'date': getattr(lr, 'upload_date', None)
-            })
+        recent_activities = _recent_activities()
 
-        latest_bookings = BookedService.objects.select_related('user').order_by('-created_at')[:5]
-        for b in latest_bookings:
-            user_name = _display_name_of_user(getattr(b, 'user', None))
-            recent_activities.append({
-                'type': 'ServiceBooking',
-                'summary': f"Service: {getattr(b, 'service_name', 'Service')} {f'({user_name})' if user_name else ''}",
-                'detail': getattr(b, 'status', ''),
-                'link': 'mod_consultations',
-                'date': getattr(b, 'created_at', None)
-            })
-
-        # Sort activities by date desc and take latest 8
-        recent_activities = sorted([r for r in recent_activities if r.get('date')], key=lambda x: x['date'], reverse=True)[:8]
-
-        # Build schedule summary for next 14 days (appointments and booked services counts)
-        schedule_summary = []
-        try:
-            base = today
-            for i in range(0, 14):
-                d = base + timedelta(days=i)
-                appt_count = Appointment.objects.filter(consultation_date=d).count()
-                lab_count = BookedService.objects.filter(booking_date=d).count()
-                appt_link = reverse('mod_consultations') + f'?date={d.isoformat()}'
-                lab_link = reverse('labresults') + f'?date={d.isoformat()}'
-                schedule_summary.append({
-                    'date': d,
-                    'date_str': d.strftime('%a %b %d'),
-                    'iso': d.isoformat(),
-                    'appt_count': appt_count,
-                    'lab_count': lab_count,
-                    'appt_link': appt_link,
-                    'lab_link': lab_link,
-                })
-        except Exception:
-            schedule_summary = []
+        schedule_summary = _schedule_summary(today)
         
         # Ensure user is in context - use request.user if authenticated, otherwise use an existing admin user
         # This prevents template errors when accessing user variable
@@ -235,91 +200,10 @@ def moddashboard(request):
         today_booked_services = BookedService.objects.filter(booking_date=today).select_related('user','user__userprofile').order_by('booking_time')
         
         latest_accounts = User.objects.order_by('-date_joined')[:5]
-        latest_lab_results = LabResult.objects.select_related('user','uploaded_by').order_by('-upload_date')[:5]
+        latest_lab_results = LabResult.objects.select_related('user','uploaded_by__userprofile').defer('result_file').order_by('-upload_date')[:5]
         latest_appointments = Appointment.objects.select_related('doctor','doctor__user','patient','patient__userprofile').order_by('-created_at')[:5]
-        # Include cached auth events for non-secret path as well
-        recent_activities = []
-        try:
-            cached_events = cache.get('site_recent_activity_events', [])
-            for ev in cached_events:
-                recent_activities.append({
-                    'type': 'Auth',
-                    'summary': ev.get('summary'),
-                    'detail': ev.get('detail'),
-                    'link': ev.get('link', 'mod_users'),
-                    'date': ev.get('date')
-                })
-        except Exception:
-            pass
-        for appt in latest_appointments:
-            doctor_name = None
-            try:
-                if getattr(appt, 'doctor', None) and getattr(appt.doctor, 'user', None):
-                    doctor_name = _display_name_of_user(appt.doctor.user)
-            except Exception:
-                doctor_name = None
-            patient_name = None
-            try:
-                if getattr(appt, 'patient', None):
-                    patient_name = _display_name_of_user(appt.patient)
-            except Exception:
-                patient_name = None
-            summary = 'Appointment'
-            if doctor_name:
-                summary = f"Appointment: Dr. {doctor_name}"
-            elif patient_name:
-                summary = f"Appointment: {patient_name}"
-            recent_activities.append({
-                'type': 'Appointment',
-                'summary': summary,
-                'detail': getattr(appt, 'consultation_type', ''),
-                'link': 'mod_consultations',
-                'date': getattr(appt, 'created_at', None)
-            })
-
-        for lr in latest_lab_results:
-            user_obj = getattr(lr, 'user', None)
-            user_name = _display_name_of_user(user_obj) if user_obj else ''
-            recent_activities.append({
-                'type': 'LabResult',
-                'summary': f"Lab: {getattr(lr, 'lab_type', 'Result')}",
-                'detail': user_name,
-                'link': 'mod_records',
-                'date': getattr(lr, 'upload_date', None)
-            })
-
-        latest_bookings = BookedService.objects.select_related('user').order_by('-created_at')[:5]
-        for b in latest_bookings:
-            user_name = _display_name_of_user(getattr(b, 'user', None))
-            recent_activities.append({
-                'type': 'ServiceBooking',
-                'summary': f"Service: {getattr(b, 'service_name', 'Service')} {f'({user_name})' if user_name else ''}",
-                'detail': getattr(b, 'status', ''),
-                'link': 'mod_consultations',
-                'date': getattr(b, 'created_at', None)
-            })
-        recent_activities = sorted([r for r in recent_activities if r.get('date')], key=lambda x: x['date'], reverse=True)[:8]
-        # Build schedule summary for next 14 days (appointments and booked services counts)
-        schedule_summary = []
-        try:
-            base = today
-            for i in range(0, 14):
-                d = base + timedelta(days=i)
-                appt_count = Appointment.objects.filter(consultation_date=d).count()
-                lab_count = BookedService.objects.filter(booking_date=d).count()
-                appt_link = reverse('mod_consultations') + f'?date={d.isoformat()}'
-                lab_link = reverse('labresults') + f'?date={d.isoformat()}'
-                schedule_summary.append({
-                    'date': d,
-                    'date_str': d.strftime('%a %b %d'),
-                    'iso': d.isoformat(),
-                    'appt_count': appt_count,
-                    'lab_count': lab_count,
-                    'appt_link': appt_link,
-                    'lab_link': lab_link,
-                })
-        except Exception:
-            schedule_summary = []
+        recent_activities = _recent_activities()
+        schedule_summary = _schedule_summary(today)
 
         context = {
             "user_profiles": user_profiles,
@@ -352,29 +236,114 @@ def moddashboard(request):
         return redirect("homepage2")
 
 
-def clear_recent_activity(request):
-    """Admin endpoint to clear cached recent activity events (POST).
-    This avoids DB migrations and provides a quick admin control.
+def _is_admin_request(request):
+    try:
+        if request.session.get('is_admin'):
+            return True
+        return hasattr(request, 'user') and request.user.is_authenticated and getattr(request.user, 'role', None) == 'admin'
+    except Exception:
+        return False
+
+
+@require_http_methods(["GET"])
+def recent_activity_feed(request):
+    """Page through site activity events, newest first.
+
+    Pass the `next_cursor` of one response as `?cursor=` to get the next page.
+    """
+    if not _is_admin_request(request):
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+
+    try:
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'Invalid cursor or limit'}, status=400)
+
+    events = read_events(cursor=cursor, limit=limit)
+    return JsonResponse({
+        'ok': True,
+        'events': [
+            {
+                'id': ev.get('id'),
+                'type': ev.get('type'),
+                'action': ev.get('action'),
+                'summary': ev.get('summary'),
+                'detail': ev.get('detail'),
+                'link': ev.get('link'),
+                'date': ev['date'].isoformat() if ev.get('date') else None,
+            }
+            for ev in events
+        ],
+        'next_cursor': events[-1].get('id') if len(events) == limit else None,
+    })
+
+
+@require_http_methods(["GET"])
+def rate_limit_stats(request):
+    """Throttled-request counters for the rate-limited auth endpoints."""
+    if not _is_admin_request(request):
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    return JsonResponse({
+        'ok': True,
+        'throttled': throttle_counters(['login', 'forgot_password', 'verify_account']),
+    })
+
+
+@require_http_methods(["GET", "POST"])
+def memory_profile(request):
+    """tracemalloc for the worker that serves the request.
+
+    GET returns RSS, tracing state and the stored snapshots. POST takes a
+    JSON body {"action": ...}: "start" / "stop" tracing, "snapshot", or
+    "diff" with "base" and "target" snapshot names (optional "group_by":
+    "lineno" or "filename", and "limit").
     """
+    if not _is_admin_request(request):
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    if request.method == 'GET':
+        return JsonResponse({'ok': True, **memory.status()})
+
+    try:
+        data = json.loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'ok': False, 'error': 'Invalid JSON'}, status=400)
+    action = data.get('action')
+    if action == 'start':
+        return JsonResponse({'ok': True, 'started': memory.start_tracing(), **memory.status()})
+    if action == 'stop':
+        return JsonResponse({'ok': True, 'stopped': memory.stop_tracing(), **memory.status()})
+    if action == 'snapshot':
+        name = memory.take_snapshot()
+        if name is None:
+            return JsonResponse({'ok': False, 'error': 'Tracing is not started', **memory.status()}, status=409)
+        return JsonResponse({'ok': True, 'snapshot': name, **memory.status()})
+    if action == 'diff':
+        group_by = data.get('group_by', 'lineno')
+        if group_by not in ('lineno', 'filename'):
+            return JsonResponse({'ok': False, 'error': 'group_by must be lineno or filename'}, status=400)
+        try:
+            limit = int(data.get('limit', 25))
+            rows = memory.diff_snapshots(data.get('base'), data.get('target'), group_by, limit)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        except LookupError as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=404)
+        return JsonResponse({'ok': True, 'base': data.get('base'), 'target': data.get('target'), 'diff': rows})
+    return JsonResponse({'ok': False, 'error': 'Unknown action'}, status=400)
+
+
+def clear_recent_activity(request):
+    """Admin endpoint to clear recent site activity events (POST)."""
     # Only allow via POST and only for admins
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'error': 'POST required'}, status=400)
 
-    # Check admin session or user role
-    is_admin = False
-    try:
-        if request.session.get('is_admin'):
-            is_admin = True
-        elif hasattr(request, 'user') and request.user.is_authenticated and getattr(request.user, 'role', None) == 'admin':
-            is_admin = True
-    except Exception:
-        is_admin = False
-
-    if not is_admin:
+    if not _is_admin_request(request):
         return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
 
     try:
-        cache.delete('site_recent_activity_events')
+        clear_events()
         return JsonResponse({'ok': True})
     except Exception:
         return JsonResponse({'ok': False, 'error': 'Failed to clear'}, status=500)
@@ -461,7 +430,7 @@ def get_password_reset_notifications(request):
         from ...models import Notification
         
         # Get password reset notifications
-        notifications = Notification.objects.filter(
+        notifications = Notification.objects.live().filter(
             notification_type='password_reset'
         ).order_by('-created_at')[:50]
         
@@ -7,6 +7,8 @@ from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 import json
 from ...models import User, UserProfile, Doctor, Appointment, Prescription, Patient
+from ...utils.doctor_directory import get_doctor_cards
+from ...utils.audit_log import log_action
 
 def mod_doctors(request):
     """Doctor management view"""
@@ -34,6 +36,8 @@ def mod_doctors(request):
                 # Update the user's role and delete them
                 user.delete()  # This will cascade delete the UserProfile as well
 
+            log_action(request, 'delete', 'Doctor', doctor_id, summary=f"Doctor removed: {user.username}")
+
             return JsonResponse({
                 "success": True,
                 "message": "Doctor deleted successfully"
@@ -52,8 +56,8 @@ def mod_doctors(request):
             years_of_experience = request.POST.get('years_of_experience')
             availability = {
                 'days': request.POST.getlist('availability_days[]'),
-                'start': request.POST.get('availability_start'),
-                'end': request.POST.get('availability_end')
+                'start': request.POST.get('availability_start') or request.POST.get('availability_start[]'),
+                'end': request.POST.get('availability_end') or request.POST.get('availability_end[]')
             }
             contact_info = request.POST.get('contact_info')
 
@@ -74,6 +78,7 @@ def mod_doctors(request):
                 availability=availability,
                 contact_info=contact_info
             )
+            log_action(request, 'create', 'Doctor', doctor.doctor_id, summary=f"Doctor added: {user.get_full_name()}", detail=specialization)
 
             return JsonResponse({
                 "success": True,
@@ -102,7 +107,7 @@ def mod_doctors(request):
     
     if request.session.get("is_admin"):
         # For secret admin login
-        doctors = Doctor.objects.select_related('user').all()
+        doctors = get_doctor_cards()
         # Get all users who are not already doctors or team members
         available_users = User.objects.exclude(
             Q(user_id__in=Doctor.objects.values_list('user__user_id', flat=True)) |
@@ -125,7 +130,7 @@ def mod_doctors(request):
     
     try:
         admin_user = User.objects.get(user_id=user_id, role="admin")
-        doctors = Doctor.objects.select_related('user').all()
+        doctors = get_doctor_cards()
         # Get all users who are not already doctors or team members
         available_users = User.objects.exclude(
             Q(user_id__in=Doctor.objects.values_list('user__user_id', flat=True)) |
@@ -226,6 +231,14 @@ def edit_doctor(request, doctor_id):
             # Non-fatal: allow doctor update to continue even if profile save fails
             pass
 
+        changed = [f for f in ('specialization', 'license_number', 'years_of_experience', 'contact_info') if f in request.POST]
+        if 'photo' in request.FILES:
+            changed.append('photo')
+        log_action(
+            request, 'update', 'Doctor', doctor.doctor_id,
+            summary=f"Doctor updated: {doctor.user.get_full_name()}", detail=', '.join(changed)
+        )
+
         return JsonResponse({
             "success": True,
             "doctor": {
@@ -285,7 +298,7 @@ def get_doctor_patients(request, doctor_id):
         # Appointments of this doctor
         appointments = []
         try:
-            appt_qs = Appointment.objects.select_related('patient').filter(doctor=doctor).order_by('-consultation_date', '-consultation_time')
+            appt_qs = Appointment.objects.select_related('patient__userprofile').filter(doctor=doctor).order_by('-consultation_date', '-consultation_time')
             for a in appt_qs:
                 appointments.append({
                     'appointment_id': getattr(a, 'consultation_id', None),
@@ -304,7 +317,7 @@ def get_doctor_patients(request, doctor_id):
         prescriptions = []
         try:
             # Include prescriptions either directly linked to the doctor or via the appointment
-            pres_qs = Prescription.objects.select_related('live_appointment__appointment__patient').filter(
+            pres_qs = Prescription.objects.select_related('live_appointment__appointment__patient__userprofile').filter(
                 Q(live_appointment__appointment__doctor=doctor) | Q(doctor=doctor)
             ).order_by('-created_at')
             for p in pres_qs:
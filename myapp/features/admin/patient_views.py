@@ -7,9 +7,10 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import datetime
 import json
-import random
-import base64
 from ...models import User, UserProfile, Patient, LabResult, BookedService, Prescription, Appointment, Notification
+from ...utils.audit_log import log_action
+from ...utils.patient_accounts import create_patient
+from ...utils.bulk_import import start_import, get_progress
 
 def mod_patients(request):
     """Patient management view - also handles mod_records"""
@@ -42,64 +43,26 @@ def mod_patients(request):
                 try:
                     client = User.objects.get(user_id=client_id, role='client', is_active=True)
 
-                    # Create username from first and last name
-                    base_username = f"{first_name.lower()}{last_name.lower()}"
-                    username = base_username
-                    counter = 1
-                    
-                    # Ensure unique username
-                    while User.objects.filter(username=username).exists():
-                        username = f"{base_username}{counter}"
-                        counter += 1
-
-                    # Create MRN (Medical Record Number)
-                    mrn = f"MRN{datetime.now().strftime('%Y%m')}{random.randint(1000, 9999)}"
-                    while Patient.objects.filter(medical_record_number=mrn).exists():
-                        mrn = f"MRN{datetime.now().strftime('%Y%m')}{random.randint(1000, 9999)}"
-
-                    # Create new patient user
-                    new_user = User.objects.create(
-                        username=username,
-                        email=f"{username}@healthcareplus.com",  # Temporary email
-                        role='patient',
-                        is_active=True
-                    )
-                    
-                    # Set a default password
-                    default_password = f"Patient@{username}"
-                    new_user.set_password(default_password)
-                    new_user.save()
-
-                    # Create UserProfile
-                    UserProfile.objects.create(
-                        user=new_user,
+                    # Username, MRN, profile and patient record in one transaction
+                    new_user, patient, default_password = create_patient(
+                        client=client,
                         first_name=first_name,
                         last_name=last_name,
                         sex=sex,
-                        birth_date=date_of_birth
-                    )
-
-                    # Create patient record
-                    Patient.objects.create(
-                        user=new_user,
-                        client=client,
-                        medical_record_number=mrn,
                         date_of_birth=date_of_birth,
-                        sex=sex,
                         blood_type=blood_type,
                         allergies=allergies,
                         conditions=conditions,
                         emergency_contact_name=emergency_contact_name,
-                        emergency_contact_phone=emergency_contact_phone
+                        emergency_contact_phone=emergency_contact_phone,
                     )
+                    username = new_user.username
                     
+                    log_action(request, 'create', 'Patient', new_user.user_id, summary=f"Patient added: {username}")
                     messages.success(request, f"Patient {username} added successfully! Default password: {default_password}")
                 except IntegrityError:
                     messages.error(request, "Username or email already exists")
                 except Exception as e:
-                    # Cleanup if any error occurs
-                    if 'new_user' in locals():
-                        new_user.delete()
                     messages.error(request, f"Error adding patient: {str(e)}")
 
             elif action == 'edit':
@@ -122,6 +85,7 @@ def mod_patients(request):
                     profile.sex = request.POST.get('sex', profile.sex)
                     profile.save()
 
+                    log_action(request, 'update', 'Patient', patient.user_id, summary=f"Patient updated: {patient.username}")
                     messages.success(request, f"Patient '{patient.username}' updated successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -140,6 +104,7 @@ def mod_patients(request):
                     patient = User.objects.get(user_id=patient_id, role='patient')
                     username = patient.username  # Store for success message
                     patient.delete()
+                    log_action(request, 'delete', 'Patient', patient_id, summary=f"Patient deleted: {username}")
                     messages.success(request, f"Patient '{username}' deleted successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -157,6 +122,7 @@ def mod_patients(request):
                     patient.is_active = not patient.is_active
                     patient.save()
                     status = "activated" if patient.is_active else "deactivated"
+                    log_action(request, 'update', 'Patient', patient.user_id, summary=f"Patient {status}: {patient.username}")
                     messages.success(request, f"Patient '{patient.username}' {status} successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -218,6 +184,7 @@ def mod_patients(request):
                     patient_name = lab_result.user.username
                     lab_type = lab_result.lab_type
                     lab_result.delete()
+                    log_action(request, 'delete', 'LabResult', lab_result_id, summary=f"Lab deleted: {lab_type}", detail=patient_name)
                     messages.success(request, f"Lab result '{lab_type}' for {patient_name} deleted successfully!")
                 except LabResult.DoesNotExist:
                     messages.error(request, "Lab result not found")
@@ -238,6 +205,7 @@ def mod_patients(request):
                     lab_result.lab_type = lab_type
                     lab_result.notes = notes
                     lab_result.save()
+                    log_action(request, 'update', 'LabResult', lab_result_id, summary=f"Lab updated: {lab_type}")
                     messages.success(request, f"Lab result updated successfully!")
                 except LabResult.DoesNotExist:
                     messages.error(request, "Lab result not found")
@@ -308,6 +276,7 @@ def mod_patients(request):
                         is_read=False,
                         priority='medium'
                     )
+                    log_action(request, 'send', 'Notification', recipient.user_id, summary=f"Message sent: {title}", detail=recipient.username)
                     messages.success(request, f"Message sent to {recipient.username}")
                 except User.DoesNotExist:
                     messages.error(request, "Recipient not found")
@@ -405,64 +374,26 @@ def mod_patients(request):
                 try:
                     client = User.objects.get(user_id=client_id, role='client', is_active=True)
 
-                    # Create username from first and last name
-                    base_username = f"{first_name.lower()}{last_name.lower()}"
-                    username = base_username
-                    counter = 1
-                    
-                    # Ensure unique username
-                    while User.objects.filter(username=username).exists():
-                        username = f"{base_username}{counter}"
-                        counter += 1
-
-                    # Create MRN (Medical Record Number)
-                    mrn = f"MRN{datetime.now().strftime('%Y%m')}{random.randint(1000, 9999)}"
-                    while Patient.objects.filter(medical_record_number=mrn).exists():
-                        mrn = f"MRN{datetime.now().strftime('%Y%m')}{random.randint(1000, 9999)}"
-
-                    # Create new patient user
-                    new_user = User.objects.create(
-                        username=username,
-                        email=f"{username}@healthcareplus.com",  # Temporary email
-                        role='patient',
-                        is_active=True
-                    )
-                    
-                    # Set a default password
-                    default_password = f"Patient@{username}"
-                    new_user.set_password(default_password)
-                    new_user.save()
-
-                    # Create UserProfile
-                    UserProfile.objects.create(
-                        user=new_user,
+                    # Username, MRN, profile and patient record in one transaction
+                    new_user, patient, default_password = create_patient(
+                        client=client,
                         first_name=first_name,
                         last_name=last_name,
                         sex=sex,
-                        birth_date=date_of_birth
-                    )
-
-                    # Create patient record
-                    Patient.objects.create(
-                        user=new_user,
-                        client=client,
-                        medical_record_number=mrn,
                         date_of_birth=date_of_birth,
-                        sex=sex,
                         blood_type=blood_type,
                         allergies=allergies,
                         conditions=conditions,
                         emergency_contact_name=emergency_contact_name,
-                        emergency_contact_phone=emergency_contact_phone
+                        emergency_contact_phone=emergency_contact_phone,
                     )
+                    username = new_user.username
                     
+                    log_action(request, 'create', 'Patient', new_user.user_id, summary=f"Patient added: {username}")
                     messages.success(request, f"Patient {username} added successfully! Default password: {default_password}")
                 except IntegrityError:
                     messages.error(request, "Username or email already exists")
                 except Exception as e:
-                    # Cleanup if any error occurs
-                    if 'new_user' in locals():
-                        new_user.delete()
                     messages.error(request, f"Error adding patient: {str(e)}")
 
             elif action == 'edit':
@@ -485,6 +416,7 @@ def mod_patients(request):
                     profile.sex = request.POST.get('sex', profile.sex)
                     profile.save()
 
+                    log_action(request, 'update', 'Patient', patient.user_id, summary=f"Patient updated: {patient.username}")
                     messages.success(request, f"Patient '{patient.username}' updated successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -503,6 +435,7 @@ def mod_patients(request):
                     patient = User.objects.get(user_id=patient_id, role='patient')
                     username = patient.username  # Store for success message
                     patient.delete()
+                    log_action(request, 'delete', 'Patient', patient_id, summary=f"Patient deleted: {username}")
                     messages.success(request, f"Patient '{username}' deleted successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -520,6 +453,7 @@ def mod_patients(request):
                     patient.is_active = not patient.is_active
                     patient.save()
                     status = "activated" if patient.is_active else "deactivated"
+                    log_action(request, 'update', 'Patient', patient.user_id, summary=f"Patient {status}: {patient.username}")
                     messages.success(request, f"Patient '{patient.username}' {status} successfully!")
                 except User.DoesNotExist:
                     messages.error(request, "Patient not found")
@@ -581,6 +515,7 @@ def mod_patients(request):
                     patient_name = lab_result.user.username
                     lab_type = lab_result.lab_type
                     lab_result.delete()
+                    log_action(request, 'delete', 'LabResult', lab_result_id, summary=f"Lab deleted: {lab_type}", detail=patient_name)
                     messages.success(request, f"Lab result '{lab_type}' for {patient_name} deleted successfully!")
                 except LabResult.DoesNotExist:
                     messages.error(request, "Lab result not found")
@@ -680,6 +615,7 @@ def update_booked_service(request):
         
         booking.updated_at = timezone.now()
         booking.save()
+        log_action(request, 'update', 'ServiceBooking', booking_id, summary=f"Service updated: {booking.service_name}", detail=booking.status)
 
         return JsonResponse({
             "success": True,
@@ -713,6 +649,7 @@ def delete_booked_service(request):
         try:
             booking = BookedService.objects.get(booking_id=booking_id)
             booking.delete()
+            log_action(request, 'delete', 'ServiceBooking', booking_id, summary=f"Service deleted: {booking.service_name}")
             return JsonResponse({
                 "success": True,
                 "message": "Booked service deleted successfully",
@@ -740,7 +677,7 @@ def get_patient_stats(request, patient_id):
         appointments_count = Appointment.objects.filter(patient_id=patient_id).count()
         
         # Get booked services count
-        services_count = BookedService.objects.filter(patient_id=patient_id).count()
+        services_count = BookedService.objects.filter(user_id=patient_id).count()
         
         return JsonResponse({
             "appointments_count": appointments_count,
@@ -820,11 +757,7 @@ def admin_prescription_details(request, prescription_id):
         else:
             doctor_name = f"Dr. {doctor.user.username}"
         
-        # Get medicines summary
-        medicines_list = prescription.medicines if prescription.medicines else []
-        medicines_summary = ', '.join([
-            m.get('name', '') for m in medicines_list if isinstance(m, dict) and 'name' in m
-        ]) if medicines_list else ''
+        medicines_summary = prescription.medicines_summary()
 
         return JsonResponse({
             'success': True,
@@ -878,6 +811,7 @@ def delete_prescription(request, prescription_id):
         # Delete the prescription record
         prescription_number = prescription.prescription_number
         prescription.delete()
+        log_action(request, 'delete', 'Prescription', prescription_id, summary=f"Prescription deleted: {prescription_number}")
         
         return JsonResponse({
             'success': True,
@@ -901,9 +835,9 @@ def admin_lab_result_download(request, result_id):
     try:
         lab_result = LabResult.objects.get(lab_result_id=result_id)
         
-        # Decode the base64 file content
+        # Decode the stored file content
         try:
-            file_content = base64.b64decode(lab_result.result_file)
+            file_content = lab_result.read_file()
         except Exception as e:
             return JsonResponse({"error": f"Error decoding file: {str(e)}"}, status=500)
         
@@ -918,3 +852,54 @@ def admin_lab_result_download(request, result_id):
     except Exception as e:
         return JsonResponse({"error": f"Error downloading file: {str(e)}"}, status=500)
 
+
+
+@require_http_methods(["POST"])
+def import_patients(request):
+    """Start a bulk import of a patients CSV or onboarding ZIP (multipart `file`).
+
+    Runs on a thread of this worker; poll import_status with the returned
+    job_id. The import stops if the worker is restarted, and import_status
+    then reports it 'interrupted'; run large imports with
+    `manage.py import_patients` instead.
+    """
+    if not (request.session.get("is_admin") or 
+            User.objects.filter(user_id=request.session.get("user"), role="admin").exists()):
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({"error": "A CSV or ZIP file is required"}, status=400)
+
+    client = None
+    client_id = request.POST.get('client_id')
+    if client_id:
+        client = User.objects.filter(user_id=client_id).first()
+        if client is None:
+            return JsonResponse({"error": "Client not found"}, status=404)
+    uploaded_by = User.objects.filter(
+        user_id=request.session.get("user_id") or request.session.get("user")
+    ).first()
+
+    job_id = start_import(
+        upload,
+        client=client,
+        uploaded_by=uploaded_by,
+        set_passwords=request.POST.get('no_passwords') not in ('1', 'true', 'on'),
+        dry_run=request.POST.get('dry_run') in ('1', 'true', 'on'),
+    )
+    log_action(request, 'create', 'Patient', None, summary=f"Bulk import started: {upload.name}", detail=job_id)
+    return JsonResponse({"success": True, "job_id": job_id}, status=202)
+
+
+@require_http_methods(["GET"])
+def import_status(request, job_id):
+    """Progress, throughput and rejected rows of a bulk import."""
+    if not (request.session.get("is_admin") or 
+            User.objects.filter(user_id=request.session.get("user"), role="admin").exists()):
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    progress = get_progress(job_id)
+    if progress is None:
+        return JsonResponse({"error": "Import not found"}, status=404)
+    return JsonResponse({"success": True, **progress})
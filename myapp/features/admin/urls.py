@@ -4,6 +4,7 @@ from . import dashboard_views, analytics_views, patient_views, user_views, accou
 urlpatterns = [
     # Admin Dashboard
     path('moddashboard/', dashboard_views.moddashboard, name='moddashboard'),
+    path('moddashboard/activity/', dashboard_views.recent_activity_feed, name='recent_activity_feed'),
     path('moddashboard/clear-activity/', dashboard_views.clear_recent_activity, name='clear_recent_activity'),
     path('get_notification_file/<int:notification_id>/', dashboard_views.get_notification_file, name='get_notification_file'),
     path('api/admin/password-reset-notifications/', dashboard_views.get_password_reset_notifications, name='get_password_reset_notifications'),
@@ -51,6 +52,10 @@ urlpatterns = [
     path('api/delete-booked-service/', patient_views.delete_booked_service, name='delete_booked_service'),
     path('api/patient-stats/<str:patient_id>/', patient_views.get_patient_stats, name='get_patient_stats'),
     
+    # Bulk patient / lab result import
+    path('api/admin/import-patients/', patient_views.import_patients, name='import_patients'),
+    path('api/admin/import-patients/<str:job_id>/', patient_views.import_status, name='import_status'),
+    
     # Prescription Management APIs
     path('api/admin-prescription-download/<int:prescription_id>/', patient_views.admin_prescription_download, name='admin_prescription_download'),
     path('api/admin-prescription-details/<int:prescription_id>/', patient_views.admin_prescription_details, name='admin_prescription_details'),
@@ -61,6 +66,12 @@ urlpatterns = [
     # Send notification (admin -> user)
     path('api/send-notification/', patient_views.mod_patients, name='admin_send_notification'),
     
+    # Rate limiter counters
+    path('api/admin/rate-limits/', dashboard_views.rate_limit_stats, name='rate_limit_stats'),
+    
+    # tracemalloc snapshots and diffs of the serving worker
+    path('api/admin/memory/', dashboard_views.memory_profile, name='memory_profile'),
+    
     # Permission Management API
     path('api/admin/permissions/', dashboard_views.manage_permissions, name='manage_permissions'),
 ]
\ No newline at end of file
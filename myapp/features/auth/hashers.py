@@ -0,0 +1,20 @@
+"""
+Password hashers with cost parameters taken from settings.
+
+Changing ARGON2_TIME_COST / ARGON2_MEMORY_COST / ARGON2_PARALLELISM or
+BCRYPT_ROUNDS makes existing hashes "outdated"; they are upgraded on the
+user's next successful login.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, BCryptSHA256PasswordHasher
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+    memory_cost = getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+    parallelism = getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    rounds = getattr(settings, 'BCRYPT_ROUNDS', BCryptSHA256PasswordHasher.rounds)
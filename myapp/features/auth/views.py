@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
 from django.db import IntegrityError, transaction, connection
 from django.contrib.auth import login as auth_login, authenticate, logout as auth_logout
 from django.middleware.csrf import get_token
@@ -12,12 +13,30 @@ from django.utils import timezone
 import os
 import json
 import logging
+import time
 
-from ...models import User, UserProfile, Patient, Notification
+from ...models import User, UserProfile, Patient
+from ...utils.rate_limit import rate_limit
+from ...utils.notify import notify
 
 logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('myapp.auth.timing')
+
+def _with_login_timings(response, timings, started):
+    """Log per-phase login timings; also send them as Server-Timing when enabled."""
+    timings['total'] = time.perf_counter() - started
+    if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', False):
+        response['Server-Timing'] = ', '.join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+        )
+    timing_logger.info(
+        "login status=%s %s", response.status_code,
+        ' '.join(f"{name}_ms={seconds * 1000:.1f}" for name, seconds in timings.items())
+    )
+    return response
 
 @csrf_exempt
+@rate_limit('login', ip_rate='20/m', username_rate='10/5m', username_field='username')
 def login(request):
     if request.method == "POST":
         try:
@@ -39,8 +58,11 @@ def login(request):
                     "csrftoken": get_token(request)
                 })
             
-            # First try to authenticate the user
-            user = authenticate(username=username, password=password)
+            # First try to authenticate the user (user + profile in one query)
+            timings = {}
+            started = time.perf_counter()
+            user = authenticate(request, username=username, password=password)
+            timings['auth'] = time.perf_counter() - started
             if user is not None:
                 # Check if account is deactivated (status=False)
                 if not user.status:
@@ -53,16 +75,20 @@ def login(request):
                 
                 if user.is_active:
                     # User is valid, active and authenticated
+                    session_started = time.perf_counter()
                     auth_login(request, user)
                     
-                    # Set up the session
+                    # Set up the session (persisted once by the session middleware)
                     request.session.set_expiry(86400)  # 24 hours
-                    request.session['user'] = user.user_id
-                    request.session['user_id'] = user.user_id  # For admin views compatibility
-                    request.session['role'] = user.role
+                    request.session.update({
+                        'user': user.user_id,
+                        'user_id': user.user_id,  # For admin views compatibility
+                        'role': user.role,
+                    })
+                    timings['session'] = time.perf_counter() - session_started
                     
-                    # Get user's display name
-                    user_profile = UserProfile.objects.filter(user=user).first()
+                    # Get user's display name (profile was loaded by the auth backend)
+                    user_profile = getattr(user, 'userprofile', None)
                     display_name = user.username
                     if user_profile:
                         if user_profile.first_name:
@@ -81,18 +107,20 @@ def login(request):
                     else:
                         redirect_url = "/moddashboard"
 
-                    return JsonResponse({
+                    return _with_login_timings(JsonResponse({
                         "message": "Login successful",
                         "welcome_message": welcome_msg,
                         "user_name": display_name,
                         "user_role": user.role,
                         "redirect": redirect_url,
                         "csrftoken": get_token(request)
-                    })
+                    }), timings, started)
                 else:
                     return JsonResponse({"message": "Your account is not active. Please contact support."}, status=403)
             else:
-                return JsonResponse({"message": "Invalid username or password"}, status=401)
+                return _with_login_timings(
+                    JsonResponse({"message": "Invalid username or password"}, status=401), timings, started
+                )
         except Exception as e:
             return JsonResponse({"message": str(e)}, status=400)
                 
@@ -372,16 +400,23 @@ def super_admin_login(request):
     return JsonResponse({"message": "Method not allowed"}, status=405)
 
 
+def is_super_admin(request):
+    """
+    Whether the session is in Super Admin mode (see super_admin_login).
+    """
+    return bool(request.session.get("is_super_admin", False))
+
+
 @csrf_exempt
 def check_super_admin_status(request):
     """
     Check if user is currently in Super Admin mode.
     """
-    is_super_admin = request.session.get("is_super_admin", False)
+    super_admin = is_super_admin(request)
     
     return JsonResponse({
-        "is_super_admin": is_super_admin,
-        "username": request.session.get("super_admin_username") if is_super_admin else None
+        "is_super_admin": super_admin,
+        "username": request.session.get("super_admin_username") if super_admin else None
     })
 
 
@@ -420,6 +455,7 @@ def exit_super_admin(request):
 
 
 @csrf_exempt
+@rate_limit('forgot_password', ip_rate='5/h', username_rate='3/h', username_field='username_or_email')
 def forgot_password(request):
     """Handle forgot password requests with ID photo verification"""
     if request.method != "POST":
@@ -484,22 +520,19 @@ def forgot_password(request):
                 "success": True
             })
         
+        client_success_message = "Password reset request submitted successfully! Expect a confirmation text message once we verify your ID."
+
         # Get all admin users (including super admin via session check)
-        admin_users = User.objects.filter(role='admin', status=True, is_active=True)
-        logger.info(f"Found {admin_users.count()} admin users to notify")
+        admin_ids = list(User.objects.filter(role='admin', status=True, is_active=True).values_list('user_id', flat=True))
+        logger.info(f"Found {len(admin_ids)} admin users to notify")
         
-        if not admin_users.exists():
+        if not admin_ids:
             logger.warning("No admin users found to send password reset notification")
             return JsonResponse({
                 "message": client_success_message,
                 "success": True
             })
         
-        # Store the file temporarily to be used for multiple notifications
-        from django.core.files.base import ContentFile
-        file_content = id_photo.read()
-        file_name = id_photo.name
-        
         # Prepare contact method display (locked to SMS for now)
         contact_method_map = {
             'sms': 'SMS (Mobile Message)',
@@ -532,29 +565,18 @@ def forgot_password(request):
             f"<strong>Requested at:</strong> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>"
             f"Patient expects an SMS confirmation only. Please verify their ID photo and assist with password recovery."
         )
-        
-        client_success_message = "Password reset request submitted successfully! Expect a confirmation text message once we verify your ID."
 
-        # Create notification for each admin
-        notification_count = 0
-        for admin_user in admin_users:
-            try:
-                # Create a new ContentFile for each notification to avoid "file already read" error
-                notification_file = ContentFile(file_content, name=file_name)
-                notification = Notification.objects.create(
-                    user=admin_user,
-                    title=f"Password Reset Request - {full_name}",
-                    message=notification_message,
-                    notification_type='password_reset',
-                    priority='high',
-                    file=notification_file,
-                    related_id=user.user_id  # Store the requesting user's ID
-                )
-                notification_count += 1
-                logger.info(f"Created notification {notification.notification_id} for admin {admin_user.user_id} with related_id={user.user_id}")
-            except Exception as e:
-                logger.error(f"Error creating notification for admin {admin_user.user_id}: {str(e)}")
-                continue
+        # One stored copy of the ID photo shared by every admin's notification
+        notifications = notify(
+            admin_ids,
+            title=f"Password Reset Request - {full_name}",
+            message=notification_message,
+            notification_type='password_reset',
+            priority='high',
+            related_id=user.user_id,  # Store the requesting user's ID
+            attachment=id_photo,
+        )
+        notification_count = len(notifications)
         
         logger.info(f"Successfully created {notification_count} notification(s) for password reset request from user {user.user_id}")
         
@@ -573,6 +595,7 @@ def forgot_password(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('verify_account', ip_rate='10/m', username_rate='5/m', username_field='username_or_email')
 def verify_account(request):
     """Verify if an account exists for password reset"""
     try:
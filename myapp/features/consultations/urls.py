@@ -8,4 +8,6 @@ urlpatterns = [
     path('api/create-appointment/', views.create_appointment, name='create_appointment'),
     path('api/cancel-consultation/', views.cancel_consultation, name='cancel_consultation'),
     path('api/get-consultation-details/<int:consultation_id>/', views.get_consultation_details, name='get_consultation_details'),
+    path('doctors/<int:doctor_id>/slots/', views.doctor_slots, name='doctor_slots'),
+    path('api/doctors/slots/', views.all_doctor_slots, name='all_doctor_slots'),
 ]
\ No newline at end of file
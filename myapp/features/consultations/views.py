@@ -4,13 +4,16 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import F, Count
-from datetime import datetime
+from django.db import transaction
+from django.db.models import F
+from datetime import datetime, timedelta
 import json
 import logging
 from django.utils import timezone
 
-from ...models import User, Doctor, UserProfile, Appointment, Notification
+from ...models import User, Doctor, UserProfile, Appointment, Notification, SlotConflict
+from ...utils.doctor_directory import get_doctor_cards, get_doctor_card
+from ...utils.availability import free_slots, SLOT_MINUTES, MAX_RANGE_DAYS
 
 logger = logging.getLogger(__name__)
 
@@ -21,34 +24,8 @@ def consultations(request):
     is_logged_in = user_id is not None
     
     try:
-        # Get all doctors with their user profiles and appointment counts (optimized query)
-        doctors_qs = Doctor.objects.select_related(
-            'user',
-            'user__userprofile'
-        ).prefetch_related(
-            'doctor_consultations'  # Prefetch to avoid N+1
-        ).all().annotate(
-            appointment_count=Count('doctor_consultations')
-        )
-        
-        # Convert to list and manually add photo URLs
-        doctors = []
-        for doctor in doctors_qs:
-            doctor_dict = {
-                'doctor_id': doctor.doctor_id,
-                'years_of_experience': doctor.years_of_experience,
-                'specialization': doctor.specialization,
-                'user_id': doctor.user_id,
-                'user__user_id': doctor.user.user_id,
-                'user__username': doctor.user.username,
-                'user__role': doctor.user.role,
-                'first_name': doctor.user.userprofile.first_name if doctor.user.userprofile else '',
-                'last_name': doctor.user.userprofile.last_name if doctor.user.userprofile else '',
-                'appointment_count': doctor.appointment_count,
-                # Get photo URL - ImageField.url property gives us the proper path
-                'photo_url': doctor.user.userprofile.photo_url.url if doctor.user.userprofile and doctor.user.userprofile.photo_url else ''
-            }
-            doctors.append(doctor_dict)
+        # Doctor cards come from the cached directory (one query on a cold cache)
+        doctors = get_doctor_cards()
         
         if is_logged_in:
             # User is logged in - show full functionality
@@ -148,35 +125,25 @@ def book_consultation(request):
                 'message': 'Doctor not found'
             }, status=404)
 
-        # Check for conflicting appointments
-        conflicting_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            consultation_date=consultation_date,
-            consultation_time=consultation_time,
-            status__in=['Scheduled', 'Approved']
-        )
-        
-        if conflicting_appointments.exists():
-            logger.warning(f"Conflicting appointment found for {consultation_date} {consultation_time}")
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Doctor is not available at the requested time'
-            }, status=400)
-
-        # Create the appointment
+        # Create the appointment; overlapping bookings are rejected by the
+        # appointment_slots unique constraint (see AppointmentSlot)
         logger.info(f"Creating appointment for user {user.username}")
-        consultation = Appointment.objects.create(
-            patient=user,
-            doctor=doctor,
-            consultation_type=consultation_type,
-            consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
-            consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
-            notes=notes,
-            approval_status='Pending',
-            status='Scheduled',
-            duration_minutes=30,  # Default 30 minutes
-            reminder_sent=False
-        )
+        try:
+            consultation = Appointment.objects.create(
+                patient=user,
+                doctor=doctor,
+                consultation_type=consultation_type,
+                consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
+                consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
+                notes=notes,
+                approval_status='Pending',
+                status='Scheduled',
+                duration_minutes=30,  # Default 30 minutes
+                reminder_sent=False
+            )
+        except SlotConflict:
+            logger.warning(f"Conflicting appointment found for {consultation_date} {consultation_time}")
+            return _slot_taken_response()
         logger.info(f"Appointment created successfully: {consultation.consultation_id}")
 
         # Create notification for doctor
@@ -215,6 +182,12 @@ def book_consultation(request):
             'message': f'An error occurred while booking the appointment: {str(e)}'
         }, status=500)
 
+def _slot_taken_response():
+    return JsonResponse({
+        'status': 'error',
+        'message': 'Doctor is not available at the requested time'
+    }, status=409)
+
 @login_required(login_url='homepage2')
 @require_http_methods(["POST"])
 def cancel_consultation(request):
@@ -303,59 +276,63 @@ def book_consultation_guest(request):
                 'message': 'Invalid consultation type'
             }, status=400)
 
-        # Get the doctor
-        try:
-            doctor = Doctor.objects.select_related('user', 'user__userprofile').get(doctor_id=doctor_id)
-        except Doctor.DoesNotExist:
+        # Get the doctor from the cached directory
+        doctor = get_doctor_card(doctor_id)
+        if doctor is None:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Doctor not found'
             }, status=404)
 
-        # Create a temporary user for the appointment with "no account" indication
-        temp_username = f"guest_no_account_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Create user account for the guest
-        guest_user = User.objects.create(
-            username=temp_username,
-            email=email,
-            role='patient',
-            status=True
-        )
-        guest_user.set_password('temp_password')  # Temporary password
-        guest_user.save()
-        
-        # Create user profile
-        UserProfile.objects.create(
-            user=guest_user,
-            first_name=first_name,
-            middle_name=middle_name,
-            last_name=last_name,
-            birthday=datetime.strptime(birthday, '%Y-%m-%d').date(),
-            email=email,
-            phone_number=phone_number,
-            address=address,
-            contact_person=emergency_contact,
-            contact_number=emergency_phone
-        )
+        # The guest account only exists if the slot could be booked
+        try:
+            with transaction.atomic():
+                # Create a temporary user for the appointment with "no account" indication
+                temp_username = f"guest_no_account_{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
-        # Create the appointment
-        consultation = Appointment.objects.create(
-            patient=guest_user,
-            doctor=doctor,
-            consultation_type=consultation_type,
-            consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
-            consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
-            notes=notes,
-            approval_status='Pending',
-            status='Scheduled',
-            duration_minutes=30,  # Default 30 minutes
-            reminder_sent=False
-        )
+                # Create user account for the guest
+                guest_user = User.objects.create(
+                    username=temp_username,
+                    email=email,
+                    role='patient',
+                    status=True
+                )
+                guest_user.set_password('temp_password')  # Temporary password
+                guest_user.save()
+
+                # Create user profile
+                UserProfile.objects.create(
+                    user=guest_user,
+                    first_name=first_name,
+                    middle_name=middle_name,
+                    last_name=last_name,
+                    birthday=datetime.strptime(birthday, '%Y-%m-%d').date(),
+                    email=email,
+                    phone_number=phone_number,
+                    address=address,
+                    contact_person=emergency_contact,
+                    contact_number=emergency_phone
+                )
+
+                # Create the appointment
+                consultation = Appointment.objects.create(
+                    patient=guest_user,
+                    doctor_id=doctor['doctor_id'],
+                    consultation_type=consultation_type,
+                    consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
+                    consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
+                    notes=notes,
+                    approval_status='Pending',
+                    status='Scheduled',
+                    duration_minutes=30,  # Default 30 minutes
+                    reminder_sent=False
+                )
+        except SlotConflict:
+            return _slot_taken_response()
 
         return JsonResponse({
             'status': 'success',
-            'message': f'Appointment booked successfully with Dr. {doctor.user.userprofile.first_name} {doctor.user.userprofile.last_name} for {consultation_date} at {consultation_time}. Please check your email for confirmation.',
+            'message': f'Appointment booked successfully with Dr. {doctor["first_name"]} {doctor["last_name"]} for {consultation_date} at {consultation_time}. Please check your email for confirmation.',
             'consultation_id': consultation.consultation_id,
             'username': temp_username,
             'login_message': 'Your account has been created! Please login with your email and the temporary password sent to your email.'
@@ -431,36 +408,26 @@ def create_appointment(request):
                 'message': 'Doctor not found'
             }, status=404)
         
-        # Check for conflicting appointments
-        conflicting_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
-            consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
-            status__in=['Scheduled', 'Approved']
-        )
-        
-        if conflicting_appointments.exists():
-            logger.warning(f"Conflicting appointment found")
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Doctor is not available at the requested time'
-            }, status=400)
-        
-        # Create the appointment
+        # Create the appointment; overlapping bookings are rejected by the
+        # appointment_slots unique constraint (see AppointmentSlot)
         logger.info(f"Creating appointment for user {user.username}")
-        consultation = Appointment.objects.create(
-            patient=user,
-            doctor=doctor,
-            consultation_type=consultation_type,
-            consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
-            consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
-            notes=notes,
-            reason_for_visit=reason_for_visit,
-            approval_status='Pending',
-            status='Scheduled',
-            duration_minutes=30,
-            reminder_sent=False
-        )
+        try:
+            consultation = Appointment.objects.create(
+                patient=user,
+                doctor=doctor,
+                consultation_type=consultation_type,
+                consultation_date=datetime.strptime(consultation_date, '%Y-%m-%d').date(),
+                consultation_time=datetime.strptime(consultation_time, '%H:%M').time(),
+                notes=notes,
+                reason_for_visit=reason_for_visit,
+                approval_status='Pending',
+                status='Scheduled',
+                duration_minutes=30,
+                reminder_sent=False
+            )
+        except SlotConflict:
+            logger.warning(f"Conflicting appointment found")
+            return _slot_taken_response()
         logger.info(f"Appointment created successfully: {consultation.consultation_id}")
         
         # Create notification for doctor
@@ -557,4 +524,57 @@ def get_consultation_details(request, consultation_id):
         return JsonResponse({'error': 'Appointment not found'}, status=404)
     except Exception as e:
         logger.error(f"Error fetching consultation details: {str(e)}", exc_info=True)
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _slot_range(request):
+    """Parse ?from=&to= (YYYY-MM-DD); defaults to the next 7 days."""
+    today = timezone.localdate()
+    start = request.GET.get('from')
+    end = request.GET.get('to')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else today
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else start + timedelta(days=6)
+    if end < start:
+        raise ValueError('"to" must not be before "from"')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'Range may span at most {MAX_RANGE_DAYS} days')
+    return start, end
+
+
+@require_http_methods(["GET"])
+def doctor_slots(request, doctor_id):
+    """Free appointment slots for one doctor between ?from= and ?to="""
+    if get_doctor_card(doctor_id) is None:
+        return JsonResponse({'status': 'error', 'message': 'Doctor not found'}, status=404)
+    try:
+        start, end = _slot_range(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    slots = free_slots(start, end, doctor_ids=[doctor_id])
+    return JsonResponse({
+        'status': 'success',
+        'doctor_id': doctor_id,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'slot_minutes': SLOT_MINUTES,
+        'slots': slots.get(doctor_id, {}),
+    })
+
+
+@require_http_methods(["GET"])
+def all_doctor_slots(request):
+    """Free appointment slots for every doctor between ?from= and ?to="""
+    try:
+        start, end = _slot_range(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    slots = free_slots(start, end)
+    return JsonResponse({
+        'status': 'success',
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'slot_minutes': SLOT_MINUTES,
+        'doctors': {str(doctor_id): days for doctor_id, days in slots.items()},
+    })
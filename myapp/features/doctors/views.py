@@ -4,7 +4,6 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponse
 from django.db import models
 from django.utils import timezone
-import base64
 import json
 
 from ...models import User, UserProfile, Doctor, Appointment, LabResult, LiveAppointment, Prescription
@@ -62,10 +61,8 @@ def doctor_panel(request):
             pid = getattr(appt.patient, 'user_id', None)
             if pid and pid not in seen_patient_ids:
                 seen_patient_ids.add(pid)
-                try:
-                    p_profile = UserProfile.objects.get(user=appt.patient)
-                except UserProfile.DoesNotExist:
-                    p_profile = None
+                # select_related above already loaded the profile
+                p_profile = getattr(appt.patient, 'userprofile', None)
                 patients_compiled.append({
                     'user': appt.patient,
                     'profile': p_profile,
@@ -77,6 +74,7 @@ def doctor_panel(request):
     latest_lab_results = (
         LabResult.objects
         .select_related('user', 'user__userprofile', 'uploaded_by')
+        .defer('result_file')
         .order_by('-upload_date')[:20]  # Get latest 20 lab results
     )
 
@@ -105,8 +103,8 @@ def doctor_panel(request):
         'latest_lab_results': latest_lab_results,
         'prescriptions': doctor_prescriptions,
         'today_appointments': today_appointments,
-        'notifications': Notification.objects.filter(user=user).order_by('-created_at')[:20],
-        'notif_unread_count': Notification.objects.filter(user=user, is_read=False).count(),
+        'notifications': Notification.objects.live().filter(user=user).order_by('-created_at')[:20],
+        'notif_unread_count': Notification.objects.live().filter(user=user, is_read=False).count(),
     }
 
     # Render existing static template; wire CSS/JS with correct static URLs inside template
@@ -264,6 +262,8 @@ def patient_lab_results(request, patient_id):
         lab_results = (
             LabResult.objects
             .filter(user=patient)
+            .select_related('uploaded_by')
+            .defer('result_file')
             .order_by('-upload_date')
         )
         
@@ -297,8 +297,8 @@ def download_lab_result(request, result_id):
         # Get the lab result
         lab_result = LabResult.objects.get(lab_result_id=result_id)
         
-        # Decode the base64 file content
-        file_content = base64.b64decode(lab_result.result_file)
+        # Decode the stored file content
+        file_content = lab_result.read_file()
         
         # Create HTTP response with file
         response = HttpResponse(file_content, content_type=lab_result.file_type)
@@ -825,11 +825,7 @@ def get_all_prescriptions(request):
                 else:
                     doctor_name = f"Dr. {doctor.user.username}"
                 
-                # Get medicines summary
-                medicines_list = rx.medicines if rx.medicines else []
-                medicines_summary = ', '.join([
-                    m.get('name', '') for m in medicines_list if isinstance(m, dict) and 'name' in m
-                ]) if medicines_list else ''
+                medicines_summary = rx.medicines_summary()
 
                 prescriptions_data.append({
                     'prescription_id': rx.prescription_id,
@@ -7,11 +7,12 @@ from django.views.decorators.http import require_POST
 from django.urls import reverse
 from django.utils.encoding import smart_str
 from datetime import date, datetime
-import base64
 import json
 import mimetypes
 import logging
 
+from ...utils.notification_sync import schedule_sync, PAGE_SYNC_INTERVAL
+
 logger = logging.getLogger(__name__)
 
 @csrf_protect
@@ -165,7 +166,9 @@ def lab_results(request):
         user_profile = UserProfile.objects.get(user=user)
         
         # Get all lab results for this user
-        lab_results = LabResult.objects.filter(user=user).order_by('-upload_date')
+        lab_results = LabResult.objects.filter(user=user).select_related(
+            'uploaded_by__userprofile'
+        ).defer('result_file').order_by('-upload_date')
         
         # Get all booked services for this user
         booked_services = BookedService.objects.filter(user=user).order_by('-booking_date', '-booking_time')
@@ -213,8 +216,8 @@ def download_lab_result(request, result_id):
         user = User.objects.get(user_id=user_id)
         lab_result = LabResult.objects.get(lab_result_id=result_id, user=user)
         
-        # Decode the base64 file content
-        file_content = base64.b64decode(lab_result.result_file)
+        # Decode the stored file content
+        file_content = lab_result.read_file()
         
         # Create HTTP response with file
         response = HttpResponse(file_content, content_type=lab_result.file_type)
@@ -269,7 +272,7 @@ def vitals(request):
     try:
         from ...models import User, UserProfile
         user = User.objects.get(user_id=user_id)
-        user_profile = UserProfile.objects.get(user=user)
+        user_profile = UserProfile.objects.filter(user=user).first()
     except Exception:
         user = None
         user_profile = None
@@ -315,7 +318,7 @@ def alertnotification(request):
         date_filter = request.GET.get('date', 'all')
         
         # Get all notifications for this user
-        notifications = Notification.objects.filter(user=user).order_by('-created_at')
+        notifications = Notification.objects.live().filter(user=user).order_by('-created_at')
         
         # Apply type filter
         if filter_type != 'all':
@@ -336,10 +339,9 @@ def alertnotification(request):
         appointments = Appointment.objects.filter(patient=user).order_by('-created_at')[:5]
         lab_results = LabResult.objects.filter(user=user).order_by('-upload_date')[:5]
         
-        # Generate notifications from database data if none exist yet
-        if not notifications.exists():
-            create_notifications_from_data(user, appointments, lab_results, user_profile)
-            notifications = Notification.objects.filter(user=user).order_by('-created_at')
+        # Generated notifications (appointment status, new lab results, ...)
+        # are materialised in the background; this only nudges a refresh
+        schedule_sync(user.user_id, min_interval=PAGE_SYNC_INTERVAL)
         
         # Count unread notifications
         unread_count = notifications.filter(is_read=False).count()
@@ -380,13 +382,15 @@ def mark_notification_read(request, notification_id):
     if not user_id:
         return JsonResponse({"error": "Not authenticated"}, status=401)
     
+    from ...models import User, Notification
     try:
-        from ...models import User, Notification
         user = User.objects.get(user_id=user_id)
         notification = Notification.objects.get(notification_id=notification_id, user=user)
         notification.is_read = True
         notification.save()
         return JsonResponse({"success": True})
+    except Notification.DoesNotExist:
+        return JsonResponse({"error": "Notification not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -396,112 +400,17 @@ def dismiss_notification(request, notification_id):
     if not user_id:
         return JsonResponse({"error": "Not authenticated"}, status=401)
     
+    from ...models import User, Notification
     try:
-        from ...models import User, Notification
         user = User.objects.get(user_id=user_id)
         notification = Notification.objects.get(notification_id=notification_id, user=user)
         notification.delete()
         return JsonResponse({"success": True})
+    except Notification.DoesNotExist:
+        return JsonResponse({"error": "Notification not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-def create_notifications_from_data(user, appointments, lab_results, user_profile=None):
-    """Create notifications based on database data"""
-    from ...models import Notification
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    now = timezone.now()
-    
-    # Create appointment notifications
-    for appointment in appointments:
-        if appointment.approval_status == 'Pending':
-            Notification.objects.get_or_create(
-                user=user,
-                title="Appointment Pending Approval",
-                message=f"Your {appointment.consultation_type} appointment with Dr. {appointment.doctor.user.get_full_name()} on {appointment.consultation_date} is pending approval.",
-                notification_type='appointment',
-                priority='medium',
-                related_id=appointment.consultation_id,
-                defaults={'is_read': False}
-            )
-        # Notify when an appointment is approved
-        if appointment.approval_status == 'Approved':
-            Notification.objects.get_or_create(
-                user=user,
-                title="Appointment Approved",
-                message=f"Your appointment with Dr. {appointment.doctor.user.get_full_name()} on {appointment.consultation_date} at {appointment.consultation_time} has been approved.",
-                notification_type='appointment',
-                priority='medium',
-                related_id=appointment.consultation_id,
-                defaults={'is_read': False}
-            )
-
-        if appointment.approval_status == 'Approved' and appointment.status == 'Scheduled':
-            # Check if appointment is today or tomorrow
-            days_until = (appointment.consultation_date - now.date()).days
-            if days_until == 0:
-                Notification.objects.get_or_create(
-                    user=user,
-                    title="Appointment Today",
-                    message=f"Your appointment with Dr. {appointment.doctor.user.get_full_name()} is scheduled for today at {appointment.consultation_time}.",
-                    notification_type='urgent',
-                    priority='high',
-                    related_id=appointment.consultation_id,
-                    defaults={'is_read': False}
-                )
-            elif days_until == 1:
-                Notification.objects.get_or_create(
-                    user=user,
-                    title="Appointment Tomorrow",
-                    message=f"Your appointment with Dr. {appointment.doctor.user.get_full_name()} is scheduled for tomorrow at {appointment.consultation_time}.",
-                    notification_type='appointment',
-                    priority='medium',
-                    related_id=appointment.consultation_id,
-                    defaults={'is_read': False}
-                )
-    
-    # Create lab result notifications
-    for lab_result in lab_results:
-        # Check if lab result was uploaded recently (within last 7 days)
-        if (now - lab_result.upload_date).days <= 7:
-            Notification.objects.get_or_create(
-                user=user,
-                title="New Lab Results Available",
-                message=f"Your {lab_result.lab_type} results are now available for review.",
-                notification_type='lab_result',
-                priority='medium',
-                related_id=lab_result.lab_result_id,
-                defaults={'is_read': False}
-            )
-    
-    # Create account security notifications
-    if user.last_login:
-        days_since_login = (now - user.last_login).days
-        if days_since_login > 30:
-            Notification.objects.get_or_create(
-                user=user,
-                title="Account Security Alert",
-                message="Your account hasn't been accessed in over 30 days. Please verify your account security.",
-                notification_type='account',
-                priority='high',
-                defaults={'is_read': False}
-            )
-    
-    # Create profile update notifications
-    if user_profile:
-        if not user_profile.emergency_contact or not user_profile.contact_number:
-            Notification.objects.get_or_create(
-                user=user,
-                title="Profile Update Required",
-                message="Please complete your emergency contact information for better care coordination.",
-                notification_type='account',
-                priority='medium',
-                defaults={'is_read': False}
-            )
-
-
-
 def get_notification_count(request):
     """Get unread notification count"""
     try:
@@ -511,7 +420,7 @@ def get_notification_count(request):
             return JsonResponse({'count': 0})
         
         from ...models import Notification
-        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        count = Notification.objects.live().filter(user_id=user_id, is_read=False).count()
         
         return JsonResponse({'count': count})
     except Exception as e:
@@ -539,7 +448,8 @@ def prescriptions(request):
             live_appointment__appointment__patient=user
         ).select_related(
             'live_appointment',
-            'live_appointment__appointment'
+            'live_appointment__appointment',
+            'live_appointment__appointment__doctor__user__userprofile'
         ).order_by('-created_at')
         
         # Get consultation_id from query parameter for highlighting
@@ -1065,7 +975,7 @@ def get_unread_notifications(request):
         } for n in unread_notifs]
         
         return JsonResponse({
-            'unread_count': Notification.objects.filter(user=user, is_read=False).count(),
+            'unread_count': Notification.objects.live().filter(user=user, is_read=False).count(),
             'notifications': notif_list
         })
     except Exception as e:
@@ -1091,7 +1001,7 @@ def api_mark_notification_read(request, notification_id):
         notification.save()
         
         # Get updated unread count
-        unread_count = Notification.objects.filter(user=user, is_read=False).count()
+        unread_count = Notification.objects.live().filter(user=user, is_read=False).count()
         
         return JsonResponse({
             'success': True,
@@ -1120,7 +1030,7 @@ def get_password_reset_notifications(request):
             return JsonResponse({'count': 0, 'notifications': []}, status=200)
         
         # Get unread password reset notifications
-        password_reset_notifs = Notification.objects.filter(
+        password_reset_notifs = Notification.objects.live().filter(
             user=user,
             notification_type='password_reset',
             is_read=False
@@ -0,0 +1 @@
+# Monitoring feature
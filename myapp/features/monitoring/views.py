@@ -0,0 +1,31 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from ...utils import metrics as app_metrics
+
+
+def _may_scrape(request):
+    """Local scrapes (no proxy in between) or a matching METRICS_TOKEN."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(supplied, f'Bearer {token}'):
+            return True
+    return (
+        request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+        and 'HTTP_X_FORWARDED_FOR' not in request.META
+    )
+
+
+@require_GET
+def metrics(request):
+    """Prometheus text exposition of myapp.utils.metrics, merged across workers."""
+    if not _may_scrape(request):
+        return HttpResponseForbidden('Forbidden')
+    if not app_metrics.enabled():
+        return HttpResponse('prometheus_client is not installed\n', status=503, content_type='text/plain')
+    body, content_type = app_metrics.render_latest()
+    return HttpResponse(body, content_type=content_type)
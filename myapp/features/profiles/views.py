@@ -30,7 +30,7 @@ def userprofile(request):
         user_profile = UserProfile.objects.get(user=user)
         patient_record = Patient.objects.filter(user=user).first()
 
-        appointments_qs = Appointment.objects.filter(patient=user).select_related('doctor__user').order_by('-consultation_date', '-consultation_time')
+        appointments_qs = Appointment.objects.filter(patient=user).select_related('doctor__user__userprofile').order_by('-consultation_date', '-consultation_time')
         recent_appointments = list(appointments_qs[:5])
         completed_consultations = appointments_qs.filter(status='Completed').count()
         upcoming_appointments = appointments_qs.filter(status='Scheduled').count()
@@ -38,9 +38,11 @@ def userprofile(request):
 
         prescription_qs = Prescription.objects.filter(live_appointment__appointment__patient=user).order_by('-created_at')
         prescription_count = prescription_qs.count()
-        recent_prescriptions = list(prescription_qs[:3])
+        recent_prescriptions = list(
+            prescription_qs.select_related('live_appointment__appointment__doctor__user__userprofile')[:3]
+        )
 
-        unread_notifications_count = Notification.objects.filter(user=user, is_read=False).count()
+        unread_notifications_count = Notification.objects.live().filter(user=user, is_read=False).count()
 
         latest_session = LiveAppointment.objects.filter(appointment__patient=user).order_by('-created_at').first()
         vitals_raw = latest_session.vital_signs if (latest_session and latest_session.vital_signs) else {}
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from myapp.utils.benchmarks import DEFAULT_THRESHOLD, compare, load_baseline, run, save_baseline
+import json
+import os
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return f'{seconds * scale:.2f}{unit}'
+    return f'{seconds * 1e9:.0f}ns'
+
+
+class Command(BaseCommand):
+    help = ('Run the micro-benchmarks in myapp/utils/benchmarks.py and compare them with a stored '
+            'baseline; exits non-zero when a median is slower than the baseline by more than --threshold. '
+            'Timings depend on the machine, so the baseline is not committed: record one with --save on '
+            'the machine that compares against it (e.g. a CI job on the target branch, kept as an artifact).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', help='Only run benchmarks whose name contains this')
+        parser.add_argument('--rounds', type=int, default=7, help='Timed rounds per benchmark (default: 7)')
+        parser.add_argument('--min-time', type=float, default=0.05,
+                            help='Minimum seconds per round; sets the loop count (default: 0.05)')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'bench_baseline.json'),
+                            help='Baseline file (default: bench_baseline.json in the project root)')
+        parser.add_argument('--save', action='store_true',
+                            help='Write these results to --baseline instead of comparing')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Allowed slowdown of the median as a fraction (default: 0.25)')
+        parser.add_argument('--json', help='Also write the results as JSON here')
+
+    def handle(self, *args, **options):
+        if options['rounds'] < 1:
+            raise CommandError('--rounds must be at least 1')
+        results = run(options['filter'], rounds=options['rounds'], min_time=options['min_time'])
+        if not results:
+            raise CommandError(f"No benchmark matches {options['filter']!r}")
+
+        baseline = {}
+        if not options['save'] and os.path.exists(options['baseline']):
+            baseline = load_baseline(options['baseline'])
+
+        self.stdout.write(f"  {'benchmark':<38} {'median':>10} {'min':>10} {'stddev':>10} {'ops/s':>12} {'vs base':>8}")
+        for key, stats in results.items():
+            before = baseline.get(key, {}).get('median')
+            change = f"{(stats['median'] / before - 1) * 100:+.0f}%" if before else '-'
+            self.stdout.write(
+                f"  {key:<38} {_format_time(stats['median']):>10} {_format_time(stats['min']):>10} "
+                f"{_format_time(stats['stddev']):>10} {stats['ops']:>12,.0f} {change:>8}"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+
+        if options['save']:
+            # Keep entries of benchmarks that were filtered out of this run
+            merged = load_baseline(options['baseline']) if os.path.exists(options['baseline']) else {}
+            merged.update(results)
+            save_baseline(options['baseline'], merged)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        if not baseline:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {options['baseline']}; run with --save to record one."
+            ))
+            return
+
+        regressions = compare(results, baseline, options['threshold'])
+        for key, before, after, ratio in regressions:
+            self.stdout.write(self.style.ERROR(
+                f'  {key}: {_format_time(before)} -> {_format_time(after)} ({(ratio - 1) * 100:+.0f}%)'
+            ))
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} benchmark(s) regressed by more than {options["threshold"]:.0%}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {options["threshold"]:.0%}'))
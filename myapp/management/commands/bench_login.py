@@ -0,0 +1,108 @@
+import json
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+
+HASHER_CHOICES = ['argon2', 'bcrypt', 'pbkdf2']
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _parse_server_timing(header):
+    """'auth;dur=1.5, db;dur=2.0;desc="3 queries"' -> {'auth': 1.5, 'db': 2.0}."""
+    phases = {}
+    for part in (header or '').split(','):
+        name, *params = [p.strip() for p in part.split(';')]
+        for param in params:
+            key, _, value = param.partition('=')
+            if name and key == 'dur':
+                try:
+                    phases[name] = float(value)
+                except ValueError:
+                    pass
+    return phases
+
+
+class Command(BaseCommand):
+    help = 'Benchmark POST /login/ latency (p50/p99 per phase) for each password hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Logins per hasher (default: 30)')
+        parser.add_argument(
+            '--hasher',
+            action='append',
+            choices=HASHER_CHOICES,
+            help='Hasher(s) to benchmark; repeatable (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        from myapp.models import User, UserProfile
+
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations must be at least 1')
+        hashers = options['hasher'] or HASHER_CHOICES
+
+        configured = {
+            'argon2': 'myapp.features.auth.hashers.TunedArgon2PasswordHasher',
+            'bcrypt': 'myapp.features.auth.hashers.TunedBCryptSHA256PasswordHasher',
+            'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        }
+
+        for name in hashers:
+            preferred = configured[name]
+            hasher_list = [preferred] + [h for h in settings.PASSWORD_HASHERS if h != preferred]
+            try:
+                # The per-username login limit would throttle the benchmark loop;
+                # the per-phase timings come from the login Server-Timing header
+                with override_settings(PASSWORD_HASHERS=hasher_list, RATE_LIMIT_ENABLED=False,
+                                       REQUEST_METRICS_SERVER_TIMING=True), \
+                        transaction.atomic():
+                    self._bench(name, iterations, User, UserProfile)
+                    # Never keep the benchmark user
+                    transaction.set_rollback(True)
+            except ValueError as e:
+                # e.g. bcrypt/argon2 library not installed
+                self.stdout.write(self.style.WARNING(f'{name}: skipped ({e})'))
+
+    def _bench(self, name, iterations, User, UserProfile):
+        username = f'bench_{uuid.uuid4().hex[:10]}'
+        password = uuid.uuid4().hex
+        user = User(username=username, email=f'{username}@bench.invalid', role='patient')
+        user.password = make_password(password)
+        user.save()
+        UserProfile.objects.create(user=user, first_name='Bench', last_name='User')
+
+        client = Client()
+        body = json.dumps({'username': username, 'password': password})
+        totals = []
+        phases = {}
+        for _ in range(iterations):
+            client.cookies.clear()
+            started = time.perf_counter()
+            response = client.post('/login/', body, content_type='application/json')
+            totals.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{name}: login failed with status {response.status_code}')
+            for phase, dur in _parse_server_timing(response.get('Server-Timing')).items():
+                phases.setdefault(phase, []).append(dur)
+
+        self.stdout.write(self.style.SUCCESS(f'{name} ({iterations} logins)'))
+        rows = [('request', totals)] + sorted(phases.items())
+        for label, values in rows:
+            self.stdout.write(
+                f'  {label:<8} p50={_percentile(values, 50):8.1f}ms  '
+                f'p99={_percentile(values, 99):8.1f}ms  mean={statistics.mean(values):8.1f}ms'
+            )
@@ -1,69 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
 from django.utils import timezone
 from datetime import timedelta
 from myapp.models import Notification
+from myapp.utils.notify import delete_unreferenced_files
+from myapp.utils import notification_partitions as partitions
+from django.conf import settings
 import os
+import time
 
 
 class Command(BaseCommand):
-    help = 'Delete notifications older than 15 days'
+    help = ('Delete notifications older than 15 days. Whole months are dropped as partitions '
+            'where the table is partitioned; the rest goes in small keyset-ordered batches. '
+            'Interrupted runs resume where they stopped; --loop keeps it running as a daemon.')
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--days',
             type=int,
-            default=15,
-            help='Number of days to keep notifications (default: 15)',
+            default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 15),
+            help='Number of days to keep notifications (default: NOTIFICATION_RETENTION_DAYS, 15)',
         )
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Show what would be deleted without actually deleting',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches to limit load (default: 0.1)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Threads used to delete attachment files (default: 4)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=0,
+            help='Resume after this notification_id (printed on interrupt)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Run continuously at low CPU priority, purging every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=3600,
+            help='Seconds between purges in --loop mode (default: 3600)',
+        )
 
-    def handle(self, *args, **options):
-        days = options['days']
-        dry_run = options['dry_run']
-        
-        # Calculate cutoff date
-        cutoff_date = timezone.now() - timedelta(days=days)
-        
-        # Get notifications older than cutoff date
-        old_notifications = Notification.objects.filter(created_at__lt=cutoff_date)
+    def purge(self, cutoff, batch_size, pause, pool, start_after=0):
+        """Delete everything older than `cutoff`; returns (rows, files, seconds)."""
+        self.cursor = start_after
+        rows = files = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(
+                Notification.objects
+                .filter(created_at__lt=cutoff, notification_id__gt=self.cursor)
+                .order_by('notification_id')
+                .values_list('notification_id', 'file')[:batch_size]
+            )
+            if not batch:
+                break
+            ids = [notification_id for notification_id, _ in batch]
+            # One short transaction per batch keeps locks brief
+            with transaction.atomic():
+                deleted, _ = Notification.objects.filter(notification_id__in=ids).delete()
+            # Shared attachments (see myapp.utils.notify) go only when unreferenced
+            files += delete_unreferenced_files((name for _, name in batch), pool)
+            rows += deleted
+            self.cursor = ids[-1]
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  deleted {rows} row(s), {files} file(s) up to id {self.cursor} '
+                f'({rows / elapsed if elapsed else rows:.0f} rows/s)'
+            )
+            if len(batch) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return rows, files, time.perf_counter() - started
+
+    def dry_run(self, cutoff, days):
+        old_notifications = Notification.objects.filter(created_at__lt=cutoff)
         count = old_notifications.count()
-        
         if count == 0:
             self.stdout.write(self.style.SUCCESS(f'No notifications older than {days} days found.'))
             return
-        
-        if dry_run:
-            self.stdout.write(self.style.WARNING(f'DRY RUN: Would delete {count} notification(s) older than {days} days.'))
-            # Show some examples
-            for notif in old_notifications[:5]:
-                self.stdout.write(f'  - {notif.title} (created: {notif.created_at})')
-            if count > 5:
-                self.stdout.write(f'  ... and {count - 5} more')
+        self.stdout.write(self.style.WARNING(f'DRY RUN: Would delete {count} notification(s) older than {days} days.'))
+        # Show some examples
+        for notif in old_notifications.order_by('notification_id')[:5]:
+            self.stdout.write(f'  - {notif.title} (created: {notif.created_at})')
+        if count > 5:
+            self.stdout.write(f'  ... and {count - 5} more')
+
+    def run_once(self, options, pool, start_after=0):
+        days = options['days']
+        cutoff = timezone.now() - timedelta(days=days)
+        # Months entirely past retention go with DROP instead of row deletes
+        dropped, dropped_files = partitions.drop_partitions_before(cutoff.date())
+        if dropped:
+            removed = delete_unreferenced_files(dropped_files, pool)
+            self.stdout.write(self.style.SUCCESS(
+                f'Dropped partition(s) {", ".join(dropped)}; removed {removed} file(s).'
+            ))
+        rows, files, elapsed = self.purge(cutoff, options['batch_size'], options['sleep'], pool, start_after)
+        if rows == 0:
+            if not dropped:
+                self.stdout.write(self.style.SUCCESS(f'No notifications older than {days} days found.'))
             return
-        
-        # Delete associated files first
-        deleted_files = 0
-        for notification in old_notifications:
-            if notification.file:
-                try:
-                    file_path = notification.file.path
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        deleted_files += 1
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'Could not delete file for notification {notification.notification_id}: {e}'))
-        
-        # Delete notifications
-        old_notifications.delete()
-        
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully deleted {count} notification(s) older than {days} days. '
-                f'Removed {deleted_files} associated file(s).'
+                f'Successfully deleted {rows} notification(s) older than {days} days. '
+                f'Removed {files} associated file(s) in {elapsed:.1f}s '
+                f'({rows / elapsed if elapsed else rows:.0f} rows/s).'
             )
         )
 
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.dry_run(timezone.now() - timedelta(days=options['days']), options['days'])
+            return
+
+        self.cursor = options['start_after']
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            try:
+                if not options['loop']:
+                    self.run_once(options, pool, options['start_after'])
+                    return
+                if hasattr(os, 'nice'):
+                    os.nice(10)
+                start_after = options['start_after']
+                while True:
+                    close_old_connections()
+                    self.run_once(options, pool, start_after)
+                    # Later passes start from the oldest remaining row
+                    start_after = 0
+                    time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING(
+                    f'Interrupted. Resume with --start-after {self.cursor}'
+                ))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.models import User
+from myapp.utils.bulk_import import ImportReport, import_file
+import os
+
+
+class Command(BaseCommand):
+    help = ('Bulk-import patients (and lab results) from a CSV or an onboarding ZIP. '
+            'See myapp/utils/bulk_import.py for the file layout.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='patients.csv, or a ZIP with patients.csv, lab_results.csv and lab files')
+        parser.add_argument(
+            '--client',
+            type=int,
+            help='user_id of the client account the patients belong to',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows written per bulk insert (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Threads for password hashing and lab file uploads (default: 8)',
+        )
+        parser.add_argument(
+            '--no-passwords',
+            action='store_true',
+            help='Create accounts with unusable passwords instead of the default Patient@<username> '
+                 '(skips hashing, much faster for large imports)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate every row and report errors without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        client = None
+        if options['client']:
+            try:
+                client = User.objects.get(user_id=options['client'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user with id {options['client']}")
+
+        printed = [0]
+
+        def show(report):
+            # One line per ~chunk of progress
+            done = report.patients + report.lab_results
+            if report.state == 'running' and done - printed[0] < options['chunk_size']:
+                return
+            printed[0] = done
+            self.stdout.write(
+                f'  {report.patients} patient(s) ({report.rate(report.patients):.0f}/s), '
+                f'{report.lab_results} lab result(s) ({report.rate(report.lab_results):.0f}/s), '
+                f'{report.error_count} error(s)'
+            )
+
+        report = import_file(
+            path,
+            ImportReport(on_progress=show),
+            client=client,
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            set_passwords=not options['no_passwords'],
+            dry_run=options['dry_run'],
+        )
+
+        for source, line, message in report.errors:
+            self.stdout.write(self.style.WARNING(f'  {source}:{line}: {message}'))
+        if report.error_count > len(report.errors):
+            self.stdout.write(self.style.WARNING(f'  ... and {report.error_count - len(report.errors)} more'))
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        summary = (f'{verb} {report.patients} patient(s) and {report.lab_results} lab result(s) '
+                   f'in {report.elapsed:.1f}s ({report.rate(report.patients):.0f} patients/s); '
+                   f'{report.error_count} row(s) rejected.')
+        if report.state == 'failed':
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.utils.import_profile import BOOT_SCRIPTS, profile_boot
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = ('Boot a fresh interpreter under `python -X importtime` the way a gunicorn worker (or a '
+            'management command) does and report boot time, RSS and the slowest imports.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(BOOT_SCRIPTS), default='wsgi',
+                            help='wsgi: worker boot incl. URLconf and views (default); setup: django.setup()')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Boots to take the median time and RSS of (default: 3)')
+        parser.add_argument('--limit', type=int, default=25, help='Rows per table (default: 25)')
+        parser.add_argument('--module', help='Only show imports of this package (e.g. myapp, reportlab)')
+        parser.add_argument('--output', help='Write the full profile as JSON here')
+        parser.add_argument('--baseline', help='Earlier --output file to compare with')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        baseline = None
+        if options['baseline']:
+            if not os.path.exists(options['baseline']):
+                raise CommandError(f"No such file: {options['baseline']}")
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+        try:
+            profile = profile_boot(options['target'], runs=options['runs'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        imports = profile['imports']
+        if options['module']:
+            prefix = options['module']
+            imports = [row for row in imports if row['module'] == prefix or row['module'].startswith(prefix + '.')]
+
+        self.stdout.write(
+            f"{profile['target']} boot: {profile['boot_ms']:.0f}ms (median of {profile['runs']}), "
+            f"RSS {profile['rss_kb'] / 1024:.1f} MiB, {profile['modules']} modules, "
+            f"imports {profile['import_ms']:.0f}ms"
+        )
+        if baseline is not None:
+            for key, label, scale, unit in (('boot_ms', 'boot', 1, 'ms'), ('rss_kb', 'RSS', 1 / 1024, 'MiB'),
+                                            ('modules', 'modules', 1, ''), ('import_ms', 'imports', 1, 'ms')):
+                before, after = baseline[key] * scale, profile[key] * scale
+                change = (after - before) / before * 100 if before else 0.0
+                self.stdout.write(f'  {label:<8} {before:>8.1f}{unit} -> {after:>8.1f}{unit} ({change:+.0f}%)')
+
+        self.stdout.write('\nSlowest imports (cumulative, including what they import):')
+        for row in sorted(imports, key=lambda row: -row['cumulative_ms'])[:options['limit']]:
+            self.stdout.write(f"  {row['cumulative_ms']:>8.1f}ms {row['self_ms']:>7.1f}ms self  {row['module']}")
+        if not options['module']:
+            self.stdout.write('\nTime by top-level package (self times):')
+            for package, ms in list(profile['packages'].items())[:options['limit']]:
+                self.stdout.write(f'  {ms:>8.1f}ms  {package}')
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(profile, handle, indent=2)
+                handle.write('\n')
+            self.stdout.write(f"\nProfile written to {options['output']}")
@@ -0,0 +1,130 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.models import Appointment, User
+from myapp.utils.load_test import compare, dumps, run_load_test
+from datetime import datetime
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = ('Drive a running server (e.g. a local gunicorn) with scripted patient, doctor and admin '
+            'journeys and report throughput, p50/p95/p99 per endpoint and error rates. Accounts come '
+            'from seed_load_data; start the server with RATE_LIMIT_ENABLED=False for more than a few '
+            'users. See myapp/utils/load_test.py for the journeys.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?', default='http://127.0.0.1:8000',
+                            help='Server to load (default: http://127.0.0.1:8000)')
+        parser.add_argument('--patients', type=int, default=8, help='Patient virtual users (default: 8)')
+        parser.add_argument('--doctors', type=int, default=2, help='Doctor virtual users (default: 2)')
+        parser.add_argument('--admins', type=int, default=1, help='Admin virtual users (default: 1)')
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Seconds to run after ramp-up (default: 60)')
+        parser.add_argument('--ramp-up', type=float, default=5,
+                            help='Seconds over which virtual users start (default: 5)')
+        parser.add_argument('--think', type=float, default=1.0,
+                            help='Mean pause between requests in seconds; 0 for flat out (default: 1)')
+        parser.add_argument('--polls', type=int, default=3,
+                            help='Notification polls per patient journey (default: 3)')
+        parser.add_argument('--timeout', type=float, default=30, help='Request timeout in seconds (default: 30)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--prefix', default='load',
+                            help='Username prefix of the seed_load_data accounts (default: load)')
+        parser.add_argument('--password', default='loadtest',
+                            help='Password of the generated accounts (default: loadtest)')
+        parser.add_argument('--admin-username', help='Admin account for the admin journey')
+        parser.add_argument('--admin-password', help='Password of --admin-username')
+        parser.add_argument('--output',
+                            help='Write the results as JSON here (default: load-test-<timestamp>.json)')
+        parser.add_argument('--baseline', help='Earlier results file to compare against')
+
+    def accounts(self, role, count, options):
+        usernames = list(
+            User.objects.filter(role=role, username__startswith=f"{options['prefix']}_", is_active=True)
+            .order_by('user_id').values_list('username', flat=True)[:count]
+        )
+        if count and not usernames:
+            raise CommandError(f"No {role} accounts named {options['prefix']}_*; run seed_load_data first")
+        # Fewer accounts than users: several users share an account
+        return [usernames[i % len(usernames)] for i in range(count)]
+
+    def handle(self, *args, **options):
+        if options['admins'] and not (options['admin_username'] and options['admin_password']):
+            raise CommandError('--admin-username and --admin-password are needed for admin users (or --admins 0)')
+        baseline = None
+        if options['baseline']:
+            if not os.path.exists(options['baseline']):
+                raise CommandError(f"No such file: {options['baseline']}")
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+
+        users = [
+            {'role': 'patient', 'username': username, 'password': options['password']}
+            for username in self.accounts('patient', options['patients'], options)
+        ]
+        for username in self.accounts('doctor', options['doctors'], options):
+            # Scheduled appointments the doctor journey runs live consultations on
+            appointments = list(
+                Appointment.objects.filter(doctor__user__username=username, status='Scheduled')
+                .order_by('consultation_date', 'consultation_time')
+                .values_list('consultation_id', flat=True)[:200]
+            )
+            users.append({'role': 'doctor', 'username': username, 'password': options['password'],
+                          'appointments': appointments})
+        users += [
+            {'role': 'admin', 'username': options['admin_username'], 'password': options['admin_password']}
+            for _ in range(options['admins'])
+        ]
+        if not users:
+            raise CommandError('Nothing to run: all of --patients, --doctors and --admins are 0')
+
+        self.stdout.write(
+            f"Loading {options['base_url']} with {len(users)} user(s) for "
+            f"{options['ramp_up']:.0f}s ramp-up + {options['duration']:.0f}s ..."
+        )
+        document = run_load_test(
+            options['base_url'], users,
+            duration=options['duration'],
+            think=options['think'],
+            ramp_up=options['ramp_up'],
+            polls=options['polls'],
+            timeout=options['timeout'],
+            seed=options['seed'],
+        )
+        self.report(document, baseline)
+
+        output = options['output'] or f"load-test-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as handle:
+            handle.write(dumps(document))
+        self.stdout.write(f'Results written to {output}')
+
+    def report(self, document, baseline):
+        header = f"  {'endpoint':<28} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+        self.stdout.write(header)
+        rows = sorted(document['endpoints'].items()) + [('TOTAL', document['total'])]
+        for label, row in rows:
+            if not row.get('requests'):
+                self.stdout.write(f'  {label:<28} {0:>6}  (no responses: {row.get("failures")})')
+                continue
+            line = (f"  {label:<28} {row['requests']:>6} {row['rps']:>7.1f} {row['error_rate'] * 100:>5.1f}% "
+                    f"{row['p50_ms']:>6.0f}ms {row['p95_ms']:>6.0f}ms {row['p99_ms']:>6.0f}ms")
+            style = self.style.WARNING if row['errors'] or row.get('failures') else (lambda text: text)
+            self.stdout.write(style(line))
+
+        if document['endpoints'].get('login', {}).get('statuses', {}).get('429'):
+            self.stdout.write(self.style.WARNING(
+                'Logins were rate limited (429); restart the server with RATE_LIMIT_ENABLED=False.'
+            ))
+
+        if baseline is not None:
+            self.stdout.write(f"Compared with the run of {baseline.get('started_at')}:")
+            for label, metrics in compare(document, baseline).items():
+                (p95_before, p95_after) = metrics['p95_ms']
+                (rps_before, rps_after) = metrics['rps']
+                if p95_before is None or p95_after is None:
+                    self.stdout.write(f'  {label:<28} only in {"this run" if p95_before is None else "baseline"}')
+                    continue
+                change = (p95_after - p95_before) / p95_before * 100 if p95_before else 0.0
+                line = (f'  {label:<28} p95 {p95_before:>6.0f}ms -> {p95_after:>6.0f}ms ({change:+.0f}%)  '
+                        f'rps {rps_before:.1f} -> {rps_after:.1f}')
+                self.stdout.write(self.style.WARNING(line) if change > 10 else line)
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+from myapp.models import Notification, User
+from myapp.utils import notification_partitions as partitions
+from myapp.utils.notify import delete_unreferenced_files
+
+
+class Command(BaseCommand):
+    help = ('Maintain the monthly partitions of the notifications table (PostgreSQL): '
+            'create upcoming months and drop months past retention. Runs in the release step; '
+            'schedule it daily too (e.g. with --drop) so months are created between deploys.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=3,
+            help='Months to create ahead of the current one (default: 3)',
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop partitions entirely older than the retention window',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 15),
+            help='Retention window in days used with --drop (default: NOTIFICATION_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--drop-legacy',
+            action='store_true',
+            help='Drop notifications_legacy, the unpartitioned copy migration 0021 keeps as a backup',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print query plans of the notification list/count queries to check partition pruning',
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stdout.write(self.style.WARNING(
+                f'The notifications table is not partitioned on this database ({connection.vendor}); nothing to do.'
+            ))
+            return
+
+        created = partitions.ensure_partitions(options['ahead'])
+        self.stdout.write(self.style.SUCCESS(f'Partitions present through {created[-1]}.'))
+
+        if options['drop']:
+            cutoff = (timezone.now() - timedelta(days=options['days'])).date()
+            dropped, files = partitions.drop_partitions_before(cutoff)
+            removed = delete_unreferenced_files(files)
+            if dropped:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Dropped {len(dropped)} partition(s): {", ".join(dropped)}. Removed {removed} file(s).'
+                ))
+            else:
+                self.stdout.write('No partitions past retention.')
+
+        if options['drop_legacy']:
+            if partitions.drop_legacy_table():
+                self.stdout.write(self.style.SUCCESS(f'Dropped {partitions.LEGACY}.'))
+            else:
+                self.stdout.write(f'No {partitions.LEGACY} table.')
+
+        if options['explain']:
+            user = User.objects.order_by('user_id').first()
+            user_id = user.user_id if user else 0
+            queries = {
+                'notification list': Notification.objects.live().filter(user_id=user_id).order_by('-created_at')[:20],
+                'unread count': Notification.objects.live().filter(user_id=user_id, is_read=False).values('pk'),
+            }
+            for label, queryset in queries.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label}:'))
+                self.stdout.write(partitions.explain(queryset))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from myapp.utils.activity_store import get_activity_store, MAX_EVENTS
+
+
+class Command(BaseCommand):
+    help = ('Trim the site activity event buffer to the newest N events. Runs in the release step; '
+            'schedule it daily too so the table stays small between deploys.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=MAX_EVENTS,
+            help=f'Number of newest events to keep (default: {MAX_EVENTS})',
+        )
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        deleted = get_activity_store().prune(keep=keep)
+        self.stdout.write(self.style.SUCCESS(f'Kept the newest {keep} activity event(s); removed {deleted}.'))
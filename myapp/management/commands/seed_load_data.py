@@ -0,0 +1,313 @@
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+from myapp.models import (
+    User, UserProfile, Patient, Doctor, Appointment, AppointmentSlot, LiveAppointment,
+    Prescription, LabResult, BookedService, Notification,
+)
+from myapp.utils.availability import WEEKDAYS
+from myapp.utils.doctor_directory import invalidate_doctor_directory
+import base64
+import io
+import json
+import random
+import time as clock
+
+FIRST_NAMES = ['Maria', 'Jose', 'Ana', 'Juan', 'Rosa', 'Carlo', 'Liza', 'Mark', 'Grace', 'Paolo',
+               'Joy', 'Miguel', 'Camille', 'Rafael', 'Bea', 'Angelo', 'Kim', 'Noel', 'Ella', 'Ramon']
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza', 'Torres',
+              'Flores', 'Villanueva', 'Ramos', 'Aquino', 'Castillo', 'Rivera', 'Navarro', 'Dela Cruz']
+SPECIALIZATIONS = ['General Medicine', 'Pediatrics', 'Cardiology', 'Dermatology', 'OB-GYN',
+                   'Internal Medicine', 'ENT', 'Orthopedics']
+MEDICINES = [('Paracetamol', '500mg'), ('Amoxicillin', '500mg'), ('Losartan', '50mg'),
+             ('Metformin', '500mg'), ('Cetirizine', '10mg'), ('Omeprazole', '20mg'),
+             ('Amlodipine', '5mg'), ('Salbutamol', '2mg')]
+LAB_TYPES = ['CBC', 'Urinalysis', 'Lipid Profile', 'FBS', 'X-Ray', 'ECG']
+SERVICES = ['Annual Physical Exam', 'Laboratory Package', 'Vaccination', 'Dental Cleaning', 'Eye Exam']
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+SEXES = [('male', 'M'), ('female', 'F')]
+
+DAY_START = 8 * 60       # first appointment 08:00
+SLOTS_PER_DAY = 16       # 30-minute appointments until 16:00
+PAYLOAD_VARIANTS = 16    # distinct lab payloads per run; rows reuse them
+# live_appointment_number is <PREFIX><9 digits> in a 20-character column
+MAX_PREFIX = LiveAppointment._meta.get_field('live_appointment_number').max_length - 9
+
+
+class Command(BaseCommand):
+    help = ('Generate a deterministic synthetic data set for load testing: patients, doctors with '
+            'availability, appointments, live sessions, prescriptions, lab results, booked services '
+            'and notifications. Rows go in with bulk_create, or with COPY on PostgreSQL when --copy is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000, help='Patients to create (default: 1000)')
+        parser.add_argument('--doctors', type=int, default=20, help='Doctors to create (default: 20)')
+        parser.add_argument('--appointments', type=int, default=3,
+                            help='Appointments per patient (default: 3)')
+        parser.add_argument('--lab-results', type=int, default=1,
+                            help='Lab results per patient (default: 1)')
+        parser.add_argument('--lab-size', type=int, default=4096,
+                            help='Bytes of binary payload per lab result (default: 4096)')
+        parser.add_argument('--booked-services', type=int, default=1,
+                            help='Booked services per patient (default: 1)')
+        parser.add_argument('--notifications', type=int, default=5,
+                            help='Notifications per patient (default: 5)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                            help='Date appointments are spread around, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Patients generated and written per batch (default: 2000)')
+        parser.add_argument('--prefix', default='load',
+                            help=f'Username prefix of generated accounts, at most {MAX_PREFIX} characters '
+                                 f'(default: load)')
+        parser.add_argument('--copy', action='store_true',
+                            help='On PostgreSQL, write rows whose ids are not needed with COPY instead of bulk_create')
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete accounts with --prefix (and everything hanging off them) first')
+
+    # -- writing ---------------------------------------------------------
+
+    def insert(self, model, objs):
+        """Write rows nobody needs the ids of; COPY when available."""
+        if not objs:
+            return
+        self.rows += len(objs)
+        if self.use_copy:
+            self.copy(model, objs)
+        else:
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def create(self, model, objs):
+        """Write rows whose primary keys are needed afterwards."""
+        self.rows += len(objs)
+        return model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def copy(self, model, objs):
+        fields = [f for f in model._meta.concrete_fields if not isinstance(f, models.AutoField)]
+        buffer = io.StringIO()
+        for obj in objs:
+            buffer.write(','.join(_csv_value(field, field.pre_save(obj, True)) for field in fields))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    # -- generators ------------------------------------------------------
+
+    def make_doctors(self, count):
+        users = self.create(User, [
+            User(username=f'{self.prefix}_d{i}', email=f'{self.prefix}_d{i}@load.test', role='doctor',
+                 password=self.password)
+            for i in range(count)
+        ])
+        self.insert(UserProfile, [
+            UserProfile(user=user, first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES))
+            for user in users
+        ])
+        doctors = []
+        for i, user in enumerate(users):
+            days = sorted(self.rng.sample(WEEKDAYS[:6], self.rng.randint(3, 6)), key=WEEKDAYS.index)
+            doctors.append(Doctor(
+                user=user,
+                specialization=self.rng.choice(SPECIALIZATIONS),
+                license_number=f'{self.prefix.upper()}-LIC-{i:06d}',
+                years_of_experience=self.rng.randint(1, 35),
+                availability={'days': days, 'start': '08:00', 'end': '17:00'},
+                contact_info=f'09{self.rng.randint(100000000, 999999999)}',
+            ))
+        return self.create(Doctor, doctors)
+
+    def next_slot(self):
+        """(doctor, date, time) of the next free 30-minute slot, round-robin over doctors."""
+        index = self.slot_cursor
+        self.slot_cursor += 1
+        doctor = self.doctors[index % len(self.doctors)]
+        slot = index // len(self.doctors)
+        day = self.first_day + timedelta(days=slot // SLOTS_PER_DAY)
+        minute = DAY_START + (slot % SLOTS_PER_DAY) * 30
+        return doctor, day, time(minute // 60, minute % 60)
+
+    def make_patient_chunk(self, start, count, options):
+        rng = self.rng
+        users = self.create(User, [
+            User(username=f'{self.prefix}_p{i}', email=f'{self.prefix}_p{i}@load.test', role='patient',
+                 password=self.password)
+            for i in range(start, start + count)
+        ])
+        profiles, patients = [], []
+        for offset, user in enumerate(users):
+            sex, gender = rng.choice(SEXES)
+            birthday = date(rng.randint(1940, 2020), rng.randint(1, 12), rng.randint(1, 28))
+            profiles.append(UserProfile(
+                user=user, first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                sex=sex, birthday=birthday, phone_number=f'09{rng.randint(100000000, 999999999)}',
+            ))
+            patients.append(Patient(
+                user=user, medical_record_number=f'{self.prefix.upper()}-MRN-{start + offset:09d}',
+                date_of_birth=birthday, gender=gender, blood_type=rng.choice(BLOOD_TYPES),
+            ))
+        self.insert(UserProfile, profiles)
+        self.insert(Patient, patients)
+
+        appointments = []
+        for user in users:
+            for _ in range(options['appointments']):
+                doctor, day, start_time = self.next_slot()
+                if day < self.today:
+                    status = rng.choices(['Completed', 'Cancelled', 'Scheduled'], [80, 10, 10])[0]
+                else:
+                    status = rng.choices(['Scheduled', 'Cancelled'], [92, 8])[0]
+                approval = 'Approved' if status == 'Completed' else rng.choices(
+                    ['Approved', 'Pending', 'Rejected'], [70, 25, 5])[0]
+                appointments.append(Appointment(
+                    patient=user, doctor=doctor, consultation_type=rng.choice(['F2F', 'Tele']),
+                    consultation_date=day, consultation_time=start_time, approval_status=approval,
+                    status=status, duration_minutes=30, reason_for_visit='Synthetic load data',
+                    reminder_sent=day < self.today,
+                ))
+        appointments = self.create(Appointment, appointments)
+
+        slots = []
+        for appointment in appointments:
+            if appointment.blocks_schedule():
+                for minute in AppointmentSlot.minutes_for(appointment.consultation_time, appointment.duration_minutes):
+                    slots.append(AppointmentSlot(
+                        appointment=appointment, doctor_id=appointment.doctor_id,
+                        slot_date=appointment.consultation_date, slot_minute=minute,
+                    ))
+        self.insert(AppointmentSlot, slots)
+
+        completed = [a for a in appointments if a.status == 'Completed']
+        sessions = []
+        for appointment in completed:
+            self.live_cursor += 1
+            started = timezone.make_aware(datetime.combine(appointment.consultation_date, appointment.consultation_time))
+            sessions.append(LiveAppointment(
+                appointment=appointment, status='completed', started_at=started,
+                completed_at=started + timedelta(minutes=25), session_duration=25,
+                live_appointment_number=f'{self.prefix.upper()}{self.live_cursor:09d}',
+                vital_signs={'bp': f'{rng.randint(100, 150)}/{rng.randint(60, 95)}',
+                             'hr': rng.randint(55, 110), 'temp': round(rng.uniform(36.0, 38.5), 1)},
+                symptoms='Synthetic symptoms', diagnosis='Synthetic diagnosis',
+            ))
+        sessions = self.create(LiveAppointment, sessions)
+
+        prescriptions = []
+        for session, appointment in zip(sessions, completed):
+            self.prescription_cursor += 1
+            medicines = [
+                {'name': name, 'dosage': dosage, 'frequency': rng.choice(['1x a day', '2x a day', '3x a day']),
+                 'duration': f'{rng.randint(3, 30)} days', 'quantity': rng.randint(5, 60)}
+                for name, dosage in rng.sample(MEDICINES, rng.randint(1, 4))
+            ]
+            prescriptions.append(Prescription(
+                live_appointment=session, doctor_id=appointment.doctor_id, medicines=medicines,
+                prescription_number=f'RX-{self.prefix.upper()}-{self.prescription_cursor:09d}',
+                instructions='Take as directed', status=rng.choice(['draft', 'signed']),
+            ))
+        self.insert(Prescription, prescriptions)
+
+        labs, services, notifications = [], [], []
+        for user in users:
+            for _ in range(options['lab_results']):
+                labs.append(LabResult(
+                    user=user, lab_type=rng.choice(LAB_TYPES), result_file=rng.choice(self.payloads),
+                    file_type='application/octet-stream', file_name='result.bin',
+                ))
+            for _ in range(options['booked_services']):
+                services.append(BookedService(
+                    user=user, service_name=rng.choice(SERVICES),
+                    booking_date=self.today + timedelta(days=rng.randint(-90, 90)),
+                    booking_time=time(rng.randint(8, 16), rng.choice([0, 30])),
+                    status=rng.choice(['Pending', 'Confirmed', 'Completed', 'Cancelled']),
+                ))
+            for n in range(options['notifications']):
+                notifications.append(Notification(
+                    user=user, title='Synthetic notification', message=f'Load test message {n}',
+                    notification_type=rng.choice(['appointment', 'lab_result', 'system']),
+                    priority=rng.choice(['low', 'medium', 'high']), is_read=rng.random() < 0.6,
+                ))
+        self.insert(LabResult, labs)
+        self.insert(BookedService, services)
+        self.insert(Notification, notifications)
+
+    # -- entry point -----------------------------------------------------
+
+    def purge(self):
+        users = User.objects.filter(username__startswith=f'{self.prefix}_')
+        deleted, _ = users.delete()
+        self.stdout.write(f'Purged {deleted} row(s) of earlier {self.prefix}_* data.')
+
+    def handle(self, *args, **options):
+        if options['doctors'] < 1:
+            raise CommandError('--doctors must be at least 1')
+        if not 0 < len(options['prefix']) <= MAX_PREFIX:
+            raise CommandError(f'--prefix must be 1 to {MAX_PREFIX} characters long')
+        self.prefix = options['prefix']
+        self.rng = random.Random(options['seed'])
+        self.today = options['start_date'] or date.today()
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs PostgreSQL')
+        self.use_copy = options['copy']
+        self.batch_size = 1000
+        self.rows = 0
+        self.slot_cursor = self.live_cursor = self.prescription_cursor = 0
+        if options['purge']:
+            self.purge()
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'{self.prefix}_* accounts already exist; use --purge or another --prefix')
+
+        # One hash shared by every generated account (password: "loadtest")
+        self.password = make_password('loadtest')
+        self.payloads = [
+            base64.b64encode(self.rng.randbytes(options['lab_size'])).decode('ascii')
+            for _ in range(PAYLOAD_VARIANTS)
+        ]
+        # Appointments fill doctors' slots day by day, centred on --start-date
+        total_appointments = options['patients'] * options['appointments']
+        days_needed = -(-total_appointments // (options['doctors'] * SLOTS_PER_DAY))
+        self.first_day = self.today - timedelta(days=days_needed // 2)
+
+        started = clock.perf_counter()
+        with transaction.atomic():
+            self.doctors = self.make_doctors(options['doctors'])
+        chunk = max(options['chunk_size'], 1)
+        for start in range(0, options['patients'], chunk):
+            with transaction.atomic():
+                self.make_patient_chunk(start, min(chunk, options['patients'] - start), options)
+            elapsed = clock.perf_counter() - started
+            self.stdout.write(
+                f'  {min(start + chunk, options["patients"])}/{options["patients"]} patients, '
+                f'{self.rows} rows ({self.rows / elapsed:.0f} rows/s)'
+            )
+
+        # bulk_create sends no signals, so drop the cached doctor directory by hand
+        invalidate_doctor_directory(counts=True)
+
+        elapsed = clock.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:.0f} rows/s) '
+            f'using {"COPY" if self.use_copy else "bulk_create"}. '
+            f'Accounts are {self.prefix}_p<N> / {self.prefix}_d<N>, password "loadtest".'
+        ))
+
+
+def _csv_value(field, value):
+    """One value in PostgreSQL's CSV COPY format (unquoted empty = NULL)."""
+    if isinstance(field, models.FileField):
+        value = value.name if value else None
+    if value is None:
+        return ''
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
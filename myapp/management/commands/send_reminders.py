@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from myapp.models import Appointment, Notification
+from myapp.utils.notification_sync import claim_events
+import time
+
+
+def _full_name(first, last, fallback):
+    return f"{first or ''} {last or ''}".strip() or fallback
+
+
+class Command(BaseCommand):
+    help = ('Send reminders for approved appointments starting within the lead time. '
+            'Safe to run in several processes at once (rows are claimed with FOR UPDATE SKIP LOCKED).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lead-hours',
+            type=int,
+            default=getattr(settings, 'REMINDER_LEAD_HOURS', 24),
+            help='Remind about appointments starting within this many hours (default: 24)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Appointments claimed per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, polling for due appointments every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60,
+            help='Seconds between polls in --loop mode (default: 60)',
+        )
+
+    def due_filter(self, now, lead_hours):
+        """Approved, unreminded appointments starting between now and now + lead."""
+        now = timezone.localtime(now)
+        until = now + timedelta(hours=lead_hours)
+        not_started = Q(consultation_date__gt=now.date()) | Q(consultation_date=now.date(), consultation_time__gte=now.time())
+        within_lead = Q(consultation_date__lt=until.date()) | Q(consultation_date=until.date(), consultation_time__lte=until.time())
+        # The explicit date range lets idx_appointments_reminder_due do a range scan
+        return (Q(reminder_sent=False, consultation_date__range=(now.date(), until.date()),
+                  status='Scheduled', approval_status='Approved')
+                & not_started & within_lead)
+
+    def send_batch(self, lead_hours, batch_size):
+        """Claim, notify and mark one batch; returns the number of appointments reminded."""
+        now = timezone.now()
+        with transaction.atomic():
+            rows = list(
+                Appointment.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(self.due_filter(now, lead_hours))
+                .order_by('consultation_date', 'consultation_time')
+                .values(
+                    'consultation_id', 'consultation_type', 'consultation_date', 'consultation_time', 'meeting_link',
+                    'patient_id', 'patient__username', 'patient__userprofile__first_name', 'patient__userprofile__last_name',
+                    'doctor__user_id', 'doctor__user__username',
+                    'doctor__user__userprofile__first_name', 'doctor__user__userprofile__last_name',
+                )[:batch_size]
+            )
+            if not rows:
+                return 0
+
+            notifications = []
+            for row in rows:
+                when = f"{row['consultation_date']:%Y-%m-%d} at {row['consultation_time']:%H:%M}"
+                kind = 'tele-consultation' if row['consultation_type'] == 'Tele' else 'face-to-face consultation'
+                doctor_name = _full_name(row['doctor__user__userprofile__first_name'],
+                                         row['doctor__user__userprofile__last_name'], row['doctor__user__username'])
+                patient_name = _full_name(row['patient__userprofile__first_name'],
+                                          row['patient__userprofile__last_name'], row['patient__username'])
+                link = f" Meeting link: {row['meeting_link']}" if row['meeting_link'] else ''
+                notifications.append(Notification(
+                    user_id=row['patient_id'],
+                    title='Appointment Reminder',
+                    message=f"Reminder: your {kind} with Dr. {doctor_name} is on {when}.{link}",
+                    notification_type='appointment',
+                    priority='high',
+                    related_id=row['consultation_id'],
+                    event_key=f"appointment:{row['consultation_id']}:reminder",
+                ))
+                notifications.append(Notification(
+                    user_id=row['doctor__user_id'],
+                    title='Upcoming Appointment',
+                    message=f"Reminder: {kind} with {patient_name} on {when}.{link}",
+                    notification_type='appointment',
+                    priority='medium',
+                    related_id=row['consultation_id'],
+                    event_key=f"appointment:{row['consultation_id']}:reminder",
+                ))
+
+            claimed = claim_events((n.user_id, n.event_key) for n in notifications)
+            Notification.objects.bulk_create(
+                [n for n in notifications if (n.user_id, n.event_key) in claimed], batch_size=1000
+            )
+            Appointment.objects.filter(
+                consultation_id__in=[row['consultation_id'] for row in rows]
+            ).update(reminder_sent=True, reminder_sent_at=now)
+        return len(rows)
+
+    def run_once(self, lead_hours, batch_size):
+        total = 0
+        started = time.perf_counter()
+        while True:
+            sent = self.send_batch(lead_hours, batch_size)
+            total += sent
+            if sent < batch_size:
+                break
+        elapsed = time.perf_counter() - started
+        if total:
+            rate = total / elapsed if elapsed else total
+            self.stdout.write(self.style.SUCCESS(
+                f'Sent reminders for {total} appointment(s) in {elapsed:.2f}s ({rate:.0f}/s).'
+            ))
+        return total
+
+    def handle(self, *args, **options):
+        lead_hours = options['lead_hours']
+        batch_size = options['batch_size']
+
+        if not options['loop']:
+            if not self.run_once(lead_hours, batch_size):
+                self.stdout.write(self.style.SUCCESS('No appointments due for a reminder.'))
+            return
+
+        self.stdout.write(f'Polling every {options["interval"]}s for appointments due within {lead_hours}h...')
+        try:
+            while True:
+                close_old_connections()
+                self.run_once(lead_hours, batch_size)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
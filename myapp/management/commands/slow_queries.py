@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = ('Rank the statements in the slow query archive (myapp.utils.slow_queries) by total time, '
+            'with the view and line that issued them and, with --plans, their latest plan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Fingerprints to show (default: 20)')
+        parser.add_argument('--view', help='Only statements issued by this view (URL name)')
+        parser.add_argument('--order', choices=['total', 'count', 'max', 'mean'], default='total',
+                            help='Rank by total time (default), count, max time or mean time')
+        parser.add_argument('--plans', action='store_true', help='Print each plan under its statement')
+        parser.add_argument('--reset', action='store_true', help='Empty the archive and exit')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow query record(s)'))
+            return
+        if options['limit'] < 1:
+            raise CommandError('--limit must be at least 1')
+
+        rows = list(SlowQuery.objects.all() if not options['view']
+                    else SlowQuery.objects.filter(view=options['view']))
+        key = {
+            'total': lambda row: row.total_ms,
+            'count': lambda row: row.count,
+            'max': lambda row: row.max_ms,
+            'mean': lambda row: row.total_ms / row.count if row.count else 0,
+        }[options['order']]
+        rows.sort(key=key, reverse=True)
+        if not rows:
+            self.stdout.write('No slow queries recorded.')
+            return
+
+        grand_total = sum(row.total_ms for row in rows)
+        self.stdout.write(f"  {'total':>10} {'share':>6} {'count':>7} {'mean':>9} {'max':>9}  view / call site / query")
+        for row in rows[:options['limit']]:
+            mean = row.total_ms / row.count if row.count else 0
+            share = row.total_ms / grand_total * 100 if grand_total else 0
+            self.stdout.write(
+                f'  {row.total_ms:>8.0f}ms {share:>5.1f}% {row.count:>7} {mean:>7.1f}ms {row.max_ms:>7.1f}ms  '
+                f'{row.view or "-"} {row.call_site or "-"}'
+            )
+            self.stdout.write(f'      {row.query[:300]}')
+            if options['plans']:
+                if row.plan:
+                    self.stdout.write(f'      plan ({row.plan_at:%Y-%m-%d %H:%M}):')
+                    for line in row.plan.splitlines():
+                        self.stdout.write(f'        {line}')
+                else:
+                    self.stdout.write('      (no plan yet)')
+        if len(rows) > options['limit']:
+            self.stdout.write(f'  ... {len(rows) - options["limit"]} more; use --limit')
@@ -1,49 +1,284 @@
 """
-Custom middleware for handling media files on Render.
-Ensures media files are accessible and properly configured.
+Per-request instrumentation.
+
+RequestMetricsMiddleware records, for every request that reaches Django
+(WhiteNoise answers static files before it), the number and total time of
+database queries, template render time, total time and response size. The
+numbers go out as a Server-Timing header (merged with one a view already
+set, e.g. login's per-phase timings), as one key=value log line on the
+`myapp.requests` logger and as Prometheus metrics (myapp.utils.metrics).
+
+Requests slower than REQUEST_METRICS_SLOW_MS additionally log their
+REQUEST_METRICS_TOP_SQL slowest statements with the project line that
+issued each one. Statements slower than SLOW_QUERY_MS go to the slow
+query archive (myapp.utils.slow_queries).
+
+Settings:
+    REQUEST_METRICS_ENABLED      (default True)
+    REQUEST_METRICS_SLOW_MS      (default 500)
+    REQUEST_METRICS_TOP_SQL      (default 5)
+    REQUEST_METRICS_SERVER_TIMING  send the header (default False)
+
+ProfilingMiddleware serves on-demand request profiles to super-admins and
+feeds the optional always-on stack sampler (myapp.utils.profiling).
+MemoryMiddleware samples the peak allocation of requests to the views in
+MEMORY_PEAK_VIEWS (myapp.utils.memory).
 """
 
-from django.conf import settings
-from django.http import FileResponse
+import contextvars
+import logging
 import os
-import mimetypes
+import random
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+import django.db
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import Template as DjangoTemplate
+from django.urls import Resolver404, resolve
+
+from myapp.utils import memory, profiling, slow_queries
+from myapp.utils.metrics import record_peak_alloc, record_request
+
+logger = logging.getLogger('myapp.requests')
+
+SQL_PREVIEW_CHARS = 300
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_DJANGO_DB_DIR = os.path.dirname(os.path.abspath(django.db.__file__))
+
+
+class RequestMetrics:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self, request=None, slow_query_seconds=None):
+        self.request = request
+        self.slow_query_seconds = slow_query_seconds
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = []  # (seconds, sql, call site)
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._template_depth = 0
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    def slowest(self, n):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:n]
+
+
+def current_metrics():
+    """The RequestMetrics of the request being served, or None."""
+    return _current.get()
+
+
+def _short_path(filename):
+    for root in (os.path.dirname(_APP_DIR), os.path.dirname(os.path.dirname(_DJANGO_DB_DIR))):
+        if filename.startswith(root + os.sep):
+            return os.path.relpath(filename, root)
+    return filename
+
+
+def _call_site():
+    """file:line that issued a query: the innermost myapp frame, else the
+    innermost frame outside django.db (e.g. the session backend)."""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__:
+            if filename.startswith(_APP_DIR + os.sep):
+                return f"{_short_path(filename)}:{frame.f_lineno}"
+            if fallback is None and not filename.startswith(_DJANGO_DB_DIR + os.sep):
+                fallback = f"{_short_path(filename)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return fallback or '?'
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        site = _call_site()
+        metrics.db_time += elapsed
+        metrics.queries.append((elapsed, sql, site))
+        if metrics.slow_query_seconds is not None and elapsed >= metrics.slow_query_seconds:
+            slow_queries.observe(sql, params, many, elapsed, _view_name(metrics.request), site)
+
 
+def _instrument_templates():
+    """Time Django template renders; nested renders count once."""
+    if getattr(DjangoTemplate.render, '_request_metrics', False):
+        return
+    original = DjangoTemplate.render
 
-class MediaFileMiddleware:
-    """
-    Middleware to handle media file requests.
-    Falls back gracefully when media files don't exist on Render.
-    """
-    
+    @wraps(original)
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return original(self, context, request)
+        metrics._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            metrics._template_depth -= 1
+            if metrics._template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+
+    render._request_metrics = True
+    DjangoTemplate.render = render
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '-'
+    return match.view_name or match._func_path
+
+
+class RequestMetricsMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-        
+        self.enabled = getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+        self.slow_seconds = getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500) / 1000
+        self.top_sql = getattr(settings, 'REQUEST_METRICS_TOP_SQL', 5)
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', False)
+        self.slow_query_seconds = None
+        if getattr(settings, 'SLOW_QUERY_ENABLED', True):
+            self.slow_query_seconds = getattr(settings, 'SLOW_QUERY_MS', 100) / 1000
+        if self.enabled:
+            _instrument_templates()
+
     def __call__(self, request):
-        # Process request
-        response = self.get_response(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = RequestMetrics(request, self.slow_query_seconds)
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(_record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total = time.perf_counter() - metrics.started
+        request.metrics = metrics
+
+        if self.server_timing:
+            timings = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'app;dur={metrics.total * 1000:.1f}',
+            ])
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {timings}' if existing else timings
+
+        view = _view_name(request)
+        record_request(request, response, view, metrics.total, metrics.query_count)
+
+        size = '-' if response.streaming else len(response.content)
+        logger.info(
+            "request method=%s path=%s view=%s status=%s queries=%d db_ms=%.1f tpl_ms=%.1f total_ms=%.1f bytes=%s",
+            request.method, request.path, view, response.status_code,
+            metrics.query_count, metrics.db_time * 1000, metrics.template_time * 1000,
+            metrics.total * 1000, size,
+        )
+        if metrics.total >= self.slow_seconds:
+            lines = [
+                f"  {seconds * 1000:.1f}ms {site} {' '.join(sql.split())[:SQL_PREVIEW_CHARS]}"
+                for seconds, sql, site in metrics.slowest(self.top_sql)
+            ]
+            logger.warning(
+                "slow request method=%s path=%s view=%s total_ms=%.1f queries=%d db_ms=%.1f\n%s",
+                request.method, request.path, view, metrics.total * 1000,
+                metrics.query_count, metrics.db_time * 1000, '\n'.join(lines),
+            )
         return response
-    
-    def process_exception(self, request, exception):
-        """
-        Handle 404 errors for missing media files gracefully.
-        """
-        if request.path.startswith('/media/'):
-            # Return a placeholder or default image
-            # This prevents 404 errors from breaking the page
-            return None
-        return None
-
-
-class StaticAndMediaMiddleware:
-    """
-    Ensures static and media files are served correctly on Render.
-    Works alongside WhiteNoise to serve files reliably.
-    """
-    
+
+
+
+class ProfilingMiddleware:
+    """`?__profile=1` / `?__profile=folded` (or the X-Profile header) for
+    super-admins, and the always-on stack sampler; see myapp.utils.profiling.
+    Sits after the session middleware, which the super-admin check needs."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.on_demand = getattr(settings, 'PROFILING_ENABLED', True)
+        self.always_on = getattr(settings, 'PROFILING_SAMPLER_ENABLED', False)
+        if not (self.on_demand or self.always_on):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        mode = None
+        if self.on_demand:
+            mode = request.GET.get('__profile') or request.headers.get('X-Profile')
+            if mode:
+                from myapp.features.auth.views import is_super_admin
+            if mode and not is_super_admin(request):
+                mode = None
+        if not (mode or self.always_on):
+            return self.get_response(request)
+
+        # Looked up per request: a worker forked after __init__ needs its own
+        sampler = profiling.background_sampler() if self.always_on else None
+        ident = threading.get_ident()
+        if sampler is not None:
+            sampler.threads.add(ident)
+        try:
+            if not mode:
+                return self.get_response(request)
+            run = profiling.run_with_sampler if mode == 'folded' else profiling.run_with_cprofile
+            _, report, path = run(request.path, lambda: self.get_response(request))
+        finally:
+            if sampler is not None:
+                sampler.threads.discard(ident)
+        response = HttpResponse(report, content_type='text/plain; charset=utf-8')
+        response['X-Profile-File'] = os.path.basename(path)
+        return response
+
+
+class MemoryMiddleware:
+    """Peak allocation of a sampled share (MEMORY_PEAK_SAMPLE_RATE) of the
+    requests to the views in MEMORY_PEAK_VIEWS; see myapp.utils.memory."""
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.media_root = settings.MEDIA_ROOT
-        
+        self.views = set(getattr(settings, 'MEMORY_PEAK_VIEWS', ()))
+        self.sample_rate = getattr(settings, 'MEMORY_PEAK_SAMPLE_RATE', 0.1)
+        if not self.views or self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+
     def __call__(self, request):
-        response = self.get_response(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        try:
+            view = resolve(request.path_info).url_name
+        except Resolver404:
+            view = None
+        if view not in self.views:
+            return self.get_response(request)
+
+        response, peak = memory.measure_peak(lambda: self.get_response(request))
+        if peak is None:
+            return response
+        record_peak_alloc(view, peak)
+        logger.info("memory view=%s peak_kb=%.0f rss_kb=%s", view, peak / 1024, memory.rss_kb())
         return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_rolepermission_notification_file_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=30)),
+                ('action', models.CharField(blank=True, default='', max_length=30)),
+                ('summary', models.CharField(max_length=255)),
+                ('detail', models.CharField(blank=True, default='', max_length=255)),
+                ('link', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'activity_events',
+                'ordering': ['-event_id'],
+            },
+        ),
+    ]
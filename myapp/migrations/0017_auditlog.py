@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_activityevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('log_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('actor_label', models.CharField(blank=True, default='', max_length=100)),
+                ('action', models.CharField(max_length=50)),
+                ('target_type', models.CharField(max_length=50)),
+                ('target_id', models.CharField(blank=True, default='', max_length=50)),
+                ('summary', models.CharField(max_length=255)),
+                ('detail', models.TextField(blank=True, default='')),
+                ('link', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, db_column='actor_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'audit_logs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='idx_audit_logs_created'), models.Index(fields=['actor', 'created_at'], name='idx_audit_logs_actor_created'), models.Index(fields=['target_type', 'target_id'], name='idx_audit_logs_target')],
+            },
+        ),
+    ]
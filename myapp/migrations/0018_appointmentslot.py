@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+LOCK_MINUTES = 5
+
+
+def reserve_existing(apps, schema_editor):
+    """Lock the calendar time of every active appointment. Legacy overlaps
+    keep whichever booking came first (ignore_conflicts)."""
+    Appointment = apps.get_model('myapp', 'Appointment')
+    AppointmentSlot = apps.get_model('myapp', 'AppointmentSlot')
+    active = Appointment.objects.exclude(status='Cancelled').exclude(approval_status='Rejected').order_by('consultation_id')
+    rows = []
+    for appt in active.iterator():
+        start = appt.consultation_time.hour * 60 + appt.consultation_time.minute
+        end = min(start + max(appt.duration_minutes or 0, 1), 24 * 60)
+        for minute in range(start - start % LOCK_MINUTES, end, LOCK_MINUTES):
+            rows.append(AppointmentSlot(
+                appointment_id=appt.consultation_id,
+                doctor_id=appt.doctor_id,
+                slot_date=appt.consultation_date,
+                slot_minute=minute,
+            ))
+        if len(rows) >= 1000:
+            AppointmentSlot.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    if rows:
+        AppointmentSlot.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_auditlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSlot',
+            fields=[
+                ('slot_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('slot_date', models.DateField()),
+                ('slot_minute', models.SmallIntegerField()),
+                ('appointment', models.ForeignKey(db_column='appointment_id', on_delete=django.db.models.deletion.CASCADE, related_name='locked_slots', to='myapp.appointment')),
+                ('doctor', models.ForeignKey(db_column='doctor_id', on_delete=django.db.models.deletion.CASCADE, related_name='locked_slots', to='myapp.doctor')),
+            ],
+            options={
+                'db_table': 'appointment_slots',
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'slot_date', 'slot_minute'), name='uniq_appointment_slots_doctor_minute')],
+            },
+        ),
+        migrations.RunPython(reserve_existing, migrations.RunPython.noop),
+    ]
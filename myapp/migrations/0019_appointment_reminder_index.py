@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_appointmentslot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['reminder_sent', 'consultation_date', 'consultation_time'], name='idx_appointments_reminder_due'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:43
+
+from django.db import migrations, models
+
+# Titles written by the old per-page get_or_create generator
+LEGACY_KEYS = {
+    'Appointment Pending Approval': 'appointment:{}:pending',
+    'Appointment Approved': 'appointment:{}:approved',
+    'Appointment Today': 'appointment:{}:today',
+    'Appointment Tomorrow': 'appointment:{}:tomorrow',
+    'New Lab Results Available': 'lab_result:{}:available',
+    'Account Security Alert': 'account:inactive',
+    'Profile Update Required': 'account:profile_incomplete',
+}
+
+
+def key_legacy_notifications(apps, schema_editor):
+    """Give already generated notifications their event_key so they are not
+    generated a second time; only the oldest of any duplicates is keyed."""
+    Notification = apps.get_model('myapp', 'Notification')
+    seen = set()
+    batch = []
+    rows = Notification.objects.filter(title__in=LEGACY_KEYS).order_by('notification_id').only('notification_id', 'user_id', 'title', 'related_id')
+    for row in rows.iterator():
+        key = LEGACY_KEYS[row.title].format(row.related_id)
+        if (row.user_id, key) in seen:
+            continue
+        seen.add((row.user_id, key))
+        row.event_key = key
+        batch.append(row)
+        if len(batch) >= 1000:
+            Notification.objects.bulk_update(batch, ['event_key'])
+            batch = []
+    if batch:
+        Notification.objects.bulk_update(batch, ['event_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_appointment_reminder_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(key_legacy_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_key__isnull', False)), fields=('user', 'event_key'), name='uniq_notifications_user_event'),
+        ),
+    ]
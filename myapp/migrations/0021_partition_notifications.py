@@ -0,0 +1,177 @@
+from datetime import date
+
+from django.db import migrations, models
+
+# Frozen copies of the helpers in myapp.utils.notification_partitions, so
+# later changes to that module don't change what this migration does.
+MONTHS_AHEAD = 3
+
+UNIQUE_EVENT = models.UniqueConstraint(
+    fields=['user', 'event_key'],
+    condition=models.Q(event_key__isnull=False),
+    name='uniq_notifications_user_event',
+)
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def create_month_partition(cursor, month):
+    start = month_start(month)
+    name = f"notifications_p{start.year:04d}{start.month:02d}"
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF notifications '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{next_month(start).isoformat()}')"
+    )
+    cursor.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_user_event" ON "{name}" (user_id, event_key) '
+        f"WHERE event_key IS NOT NULL"
+    )
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('notifications')")
+    return cursor.fetchone() is not None
+
+
+def move_sequence(cursor, source, target):
+    """Keep handing out ids after the copied ones. A serial column points at
+    the sequence of the table it was created on; an identity column of a
+    LIKE copy gets a new one."""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'notification_id')", [target])
+    sequence = cursor.fetchone()[0]
+    if sequence is None:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'notification_id')", [source])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {target}.notification_id")
+    cursor.execute(
+        f"SELECT setval(%s, COALESCE((SELECT max(notification_id) FROM {target}), 0) + 1, false)",
+        [sequence],
+    )
+
+
+def partition_notifications(apps, schema_editor):
+    """Rebuild `notifications` as a table partitioned by month on created_at.
+
+    PostgreSQL only. Rows are copied into monthly partitions covering the
+    oldest row through MONTHS_AHEAD months from now, and the id sequence is
+    carried over, all in the migration's transaction. The old table stays
+    behind as notifications_legacy, without its foreign keys and indexes,
+    as a backup until `manage.py notification_partitions --drop-legacy`
+    drops it.
+
+    Unique indexes on a partitioned table must include the partition key,
+    so uniq_notifications_user_event becomes one partial unique index per
+    partition, DEFAULT included. Other databases just drop the constraint.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.remove_constraint(apps.get_model('myapp', 'Notification'), UNIQUE_EVENT)
+        return
+
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+
+        cursor.execute("ALTER TABLE notifications RENAME TO notifications_legacy")
+        cursor.execute(
+            "CREATE TABLE notifications (LIKE notifications_legacy INCLUDING DEFAULTS INCLUDING IDENTITY) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        # The legacy copy keeps only its primary key: its foreign key would
+        # block deleting users, and its index names belong to the new table.
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = 'notifications_legacy'::regclass AND contype = 'f'"
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE notifications_legacy DROP CONSTRAINT "{name}"')
+        cursor.execute(
+            "SELECT indexrelid::regclass::text FROM pg_index "
+            "WHERE indrelid = 'notifications_legacy'::regclass AND NOT indisprimary"
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {name}")
+
+        # The partition key must be part of the primary key
+        cursor.execute(
+            "ALTER TABLE notifications ADD CONSTRAINT notifications_part_pkey PRIMARY KEY (notification_id, created_at)"
+        )
+        cursor.execute(
+            "ALTER TABLE notifications ADD CONSTRAINT notifications_part_user_fk FOREIGN KEY (user_id) "
+            "REFERENCES users (user_id) DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute("CREATE INDEX notifications_part_user_created ON notifications (user_id, created_at DESC)")
+        cursor.execute("CREATE TABLE notifications_default PARTITION OF notifications DEFAULT")
+        cursor.execute(
+            "CREATE UNIQUE INDEX notifications_default_user_event ON notifications_default (user_id, event_key) "
+            "WHERE event_key IS NOT NULL"
+        )
+
+        cursor.execute("SELECT min(created_at) FROM notifications_legacy")
+        oldest = cursor.fetchone()[0]
+        month = month_start(oldest.date() if oldest else date.today())
+        last = month_start(date.today())
+        for _ in range(MONTHS_AHEAD):
+            last = next_month(last)
+        while month <= last:
+            create_month_partition(cursor, month)
+            month = next_month(month)
+
+        cursor.execute("INSERT INTO notifications OVERRIDING SYSTEM VALUE SELECT * FROM notifications_legacy")
+        move_sequence(cursor, 'notifications_legacy', 'notifications')
+
+
+def unpartition_notifications(apps, schema_editor):
+    """Copy the rows back into a plain `notifications` table with the
+    pre-0021 keys and indexes, and drop the partitions and the legacy copy."""
+    connection = schema_editor.connection
+    Notification = apps.get_model('myapp', 'Notification')
+    if connection.vendor != 'postgresql':
+        schema_editor.add_constraint(Notification, UNIQUE_EVENT)
+        return
+
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        cursor.execute("DROP TABLE IF EXISTS notifications_legacy")
+        cursor.execute("CREATE TABLE notifications_plain (LIKE notifications INCLUDING DEFAULTS INCLUDING IDENTITY)")
+        cursor.execute("INSERT INTO notifications_plain OVERRIDING SYSTEM VALUE SELECT * FROM notifications")
+        move_sequence(cursor, 'notifications', 'notifications_plain')
+        cursor.execute("DROP TABLE notifications")
+        cursor.execute("ALTER TABLE notifications_plain RENAME TO notifications")
+        cursor.execute("ALTER TABLE notifications ADD CONSTRAINT notifications_pkey PRIMARY KEY (notification_id)")
+        # The identity sequence is named after the table it was created on
+        cursor.execute("SELECT pg_get_serial_sequence('notifications', 'notification_id')")
+        sequence = cursor.fetchone()[0]
+        if sequence.split('.')[-1] != 'notifications_notification_id_seq':
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO notifications_notification_id_seq")
+
+    # The foreign key, its index and the unique constraint, under the names
+    # Django gives them
+    user = Notification._meta.get_field('user')
+    schema_editor.execute(schema_editor._create_fk_sql(Notification, user, '_fk_%(to_table)s_%(to_column)s'))
+    schema_editor.execute(schema_editor._create_index_sql(Notification, fields=[user]))
+    schema_editor.add_constraint(Notification, UNIQUE_EVENT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_notification_event_key'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_notifications, unpartition_notifications),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(model_name='notification', name='uniq_notifications_user_event'),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+# series -> (model, field, prefix, width) as in myapp.utils.display_numbers.SERIES
+EXISTING = {
+    'live_appointment': ('LiveAppointment', 'live_appointment_number', 'LAP', 3),
+    'appointment': ('Appointment', 'appointment_number', 'APT', 6),
+    'mrn': ('Patient', 'medical_record_number', 'MRN', 8),
+}
+
+
+def seed_counters(apps, schema_editor):
+    """Start each counter after the highest number already in use.
+
+    Legacy values in another shape (e.g. the old random MRNYYYYMM#### codes,
+    which are longer than the new ones) cannot collide and are skipped.
+    """
+    DisplayCounter = apps.get_model('myapp', 'DisplayCounter')
+    for series, (model_name, field, prefix, width) in EXISTING.items():
+        model = apps.get_model('myapp', model_name)
+        highest = 0
+        values = model.objects.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+        for value in values.iterator():
+            suffix = value[len(prefix):]
+            if suffix.isdigit() and len(suffix) <= width:
+                highest = max(highest, int(suffix))
+        DisplayCounter.objects.update_or_create(name=series, defaults={'value': highest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0021_partition_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisplayCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'display_counters',
+            },
+        ),
+        migrations.AlterField(
+            model_name='liveappointment',
+            name='live_appointment_number',
+            field=models.CharField(blank=True, max_length=20, null=True, unique=True),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0022_display_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('fingerprint', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('query', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('view', models.CharField(blank=True, default='', max_length=200)),
+                ('call_site', models.CharField(blank=True, default='', max_length=255)),
+                ('plan', models.TextField(blank=True, default='')),
+                ('plan_at', models.DateTimeField(blank=True, null=True)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'slow_queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
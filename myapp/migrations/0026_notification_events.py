@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0025_import_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_key', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notification_events',
+                'constraints': [models.UniqueConstraint(fields=('user', 'event_key'), name='uniq_notification_events_user_key')],
+            },
+        ),
+        # Claim the keys of notifications generated so far
+        migrations.RunSQL(
+            "INSERT INTO notification_events (user_id, event_key, created_at) "
+            "SELECT user_id, event_key, MIN(created_at) FROM notifications "
+            "WHERE event_key IS NOT NULL GROUP BY user_id, event_key",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password, check_password, identify_hasher
+from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
 
 class UserManager(BaseUserManager):
     def create_user(self, username, email, password=None, **extra_fields):
@@ -63,10 +65,20 @@ class User(AbstractBaseUser):
     REQUIRED_FIELDS = ['email', 'role']
 
     def save(self, *args, **kwargs):
-        if not self.password.startswith(('pbkdf2_sha256$', 'bcrypt$', 'argon2')):
+        # Hash raw passwords assigned directly to the field. Anything a
+        # configured hasher recognises (argon2, bcrypt_sha256, pbkdf2, ...)
+        # is already hashed and must not be hashed twice.
+        if not self._has_hashed_password():
             self.password = make_password(self.password)
         super(User, self).save(*args, **kwargs)
 
+    def _has_hashed_password(self):
+        try:
+            identify_hasher(self.password)
+        except ValueError:
+            return False
+        return True
+
     def __str__(self):
         return self.username
 
@@ -154,6 +166,14 @@ class UserProfile(models.Model):
         """
         return self.birthday
 
+class NotificationQuerySet(models.QuerySet):
+    def live(self):
+        """Notifications inside the retention window. The created_at bound
+        also lets PostgreSQL prune the monthly partitions of the table."""
+        days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 15)
+        return self.filter(created_at__gte=timezone.now() - timedelta(days=days))
+
+
 class Notification(models.Model):
     notification_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -176,9 +196,15 @@ class Notification(models.Model):
     ], default='medium')
     related_id = models.IntegerField(null=True, blank=True)  # ID of related appointment, lab result, etc.
     file = models.FileField(upload_to='notifications/', null=True, blank=True)  # For ID photos and other attachments
+    # Identity of generated notifications, e.g. "appointment:42:approved";
+    # NULL for ad-hoc ones. Each (user, event_key) is claimed once in
+    # NotificationEvent before its notification is inserted.
+    event_key = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = NotificationQuerySet.as_manager()
+
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
@@ -186,6 +212,25 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.notification_type}: {self.title} - {self.user.username}"
 
+class NotificationEvent(models.Model):
+    """A (user, event_key) that has been notified. Kept apart from the
+    notifications table, which is partitioned by month on PostgreSQL and so
+    can only be unique per partition; the unique constraint here holds
+    across months and on every database. Claims outlive the notifications
+    purged by retention. See myapp.utils.notification_sync.claim_events."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_events')
+    event_key = models.CharField(max_length=100)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'notification_events'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event_key'], name='uniq_notification_events_user_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.event_key}"
+
 class Patient(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_profile')
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patients', limit_choices_to={'role': 'client'}, null=True, blank=True)
@@ -261,10 +306,115 @@ class Appointment(models.Model):
 
     class Meta:
         db_table = 'appointments'
+        indexes = [
+            # send_reminders: unreminded appointments ordered by start
+            models.Index(fields=['reminder_sent', 'consultation_date', 'consultation_time'], name='idx_appointments_reminder_due'),
+        ]
+
+    SLOT_FIELDS = ('doctor_id', 'consultation_date', 'consultation_time', 'duration_minutes', 'status', 'approval_status')
 
     def __str__(self):
         return f"{self.consultation_type} - {self.doctor.get_full_name()} with {self.patient.get_full_name()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in cls.SLOT_FIELDS):
+            instance._locked_slot_key = instance.slot_key()
+        return instance
+
+    def blocks_schedule(self):
+        return self.status != 'Cancelled' and self.approval_status != 'Rejected'
+
+    def slot_key(self):
+        """Everything that decides which AppointmentSlot rows this booking holds."""
+        get_field = self._meta.get_field
+        return (
+            self.doctor_id,
+            get_field('consultation_date').to_python(self.consultation_date),
+            get_field('consultation_time').to_python(self.consultation_time),
+            int(self.duration_minutes or 0),
+            self.blocks_schedule(),
+        )
+
+    def save(self, *args, **kwargs):
+        # Re-reserve slots only when doctor, time, duration or status changed;
+        # the row and its slots are written in one transaction so a conflict
+        # (SlotConflict) leaves nothing behind.
+        key = self.slot_key()
+        if key == getattr(self, '_locked_slot_key', None):
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            AppointmentSlot.reserve(self, key)
+        self._locked_slot_key = key
+
+
+class SlotConflict(IntegrityError):
+    """The appointment overlaps another booking of the same doctor."""
+
+
+class AppointmentSlot(models.Model):
+    """Time a booked appointment holds on its doctor's calendar.
+
+    One row per LOCK_MINUTES block between the appointment's start and
+    start + duration_minutes. The unique constraint on (doctor, slot_date,
+    slot_minute) lets the database reject overlapping bookings, including
+    ones made concurrently. Rows are maintained by Appointment.save() and
+    removed with the appointment (CASCADE) or when it is cancelled/rejected."""
+    LOCK_MINUTES = 5
+
+    slot_id = models.BigAutoField(primary_key=True)
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        db_column='appointment_id',
+        related_name='locked_slots'
+    )
+    doctor = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        db_column='doctor_id',
+        to_field='doctor_id',
+        related_name='locked_slots'
+    )
+    slot_date = models.DateField()
+    slot_minute = models.SmallIntegerField()  # minutes since midnight
+
+    class Meta:
+        db_table = 'appointment_slots'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'slot_date', 'slot_minute'], name='uniq_appointment_slots_doctor_minute'),
+        ]
+
+    @classmethod
+    def minutes_for(cls, start_time, duration_minutes):
+        start = start_time.hour * 60 + start_time.minute
+        end = min(start + max(duration_minutes, 1), 24 * 60)
+        first = start - start % cls.LOCK_MINUTES
+        return range(first, end, cls.LOCK_MINUTES)
+
+    @classmethod
+    def reserve(cls, appointment, key):
+        doctor_id, day, start_time, duration, blocking = key
+        cls.objects.filter(appointment=appointment).delete()
+        if not blocking:
+            return
+        rows = [
+            cls(appointment=appointment, doctor_id=doctor_id, slot_date=day, slot_minute=minute)
+            for minute in cls.minutes_for(start_time, duration)
+        ]
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(rows)
+        except IntegrityError:
+            raise SlotConflict(
+                f"Doctor {doctor_id} already has an appointment overlapping {day} {start_time:%H:%M}"
+            )
+
+    def __str__(self):
+        return f"Doctor {self.doctor_id} {self.slot_date} +{self.slot_minute}m (appointment {self.appointment_id})"
+
 class LabResult(models.Model):
     lab_result_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(
@@ -290,6 +440,10 @@ class LabResult(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(null=True, blank=True)
 
+    # result_file holds either base64 data (form uploads) or, for bulk
+    # imports, a storage name under this directory
+    STORAGE_DIR = 'lab_results'
+
     class Meta:
         db_table = 'lab_results'
         ordering = ['-upload_date']
@@ -297,6 +451,15 @@ class LabResult(models.Model):
     def __str__(self):
         return f"{self.lab_type} - {self.user.username} ({self.upload_date.strftime('%Y-%m-%d')})"
 
+    def read_file(self):
+        """The file's bytes, wherever result_file keeps them."""
+        if self.result_file.startswith(f"{self.STORAGE_DIR}/"):
+            from django.core.files.storage import default_storage
+            with default_storage.open(self.result_file, 'rb') as handle:
+                return handle.read()
+        import base64
+        return base64.b64decode(self.result_file)
+
 class LiveAppointment(models.Model):
     """Live consultation session linked to an appointment"""
     live_appointment_id = models.AutoField(primary_key=True)
@@ -319,7 +482,7 @@ class LiveAppointment(models.Model):
     # Human-friendly display ID (e.g. LAP001). Generated when the
     # live appointment is created/started. Kept separate from the
     # AutoField primary key to preserve DB integrity.
-    live_appointment_number = models.CharField(max_length=6, unique=True, null=True, blank=True)
+    live_appointment_number = models.CharField(max_length=20, unique=True, null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     session_duration = models.IntegerField(null=True, blank=True)  # Duration in minutes
     
@@ -354,36 +517,15 @@ class LiveAppointment(models.Model):
         return None
 
     def generate_live_appointment_number(self):
-        """Generate a unique LAP### code (LAP + zero-padded 3-digit number).
-        Uses existing records to pick the next number. This is simple and
-        sufficient for low-concurrency environments; if you need strong
-        guarantees under heavy concurrent creation, replace with a DB-side
-        sequence or locking.
-        """
-        prefix = 'LAP'
-        from django.db.models import Max
-        # Find max numeric suffix among existing LAP codes
-        vals = LiveAppointment.objects.filter(live_appointment_number__startswith=prefix).values_list('live_appointment_number', flat=True)
-        max_num = 0
-        for v in vals:
-            try:
-                num = int(v[len(prefix):])
-                if num > max_num:
-                    max_num = num
-            except Exception:
-                continue
-        next_num = max_num + 1
-        return f"{prefix}{str(next_num).zfill(3)}"
+        """Allocate the next LAP code (LAP + zero-padded number) from the
+        'live_appointment' counter; see myapp.utils.display_numbers."""
+        from myapp.utils.display_numbers import next_number
+        return next_number('live_appointment')
 
     def save(self, *args, **kwargs):
         # Ensure a live_appointment_number exists
         if not self.live_appointment_number:
-            # Try generating until unique (guard against rare collisions)
-            for _ in range(5):
-                candidate = self.generate_live_appointment_number()
-                if not LiveAppointment.objects.filter(live_appointment_number=candidate).exists():
-                    self.live_appointment_number = candidate
-                    break
+            self.live_appointment_number = self.generate_live_appointment_number()
         super().save(*args, **kwargs)
 
 class Prescription(models.Model):
@@ -450,6 +592,12 @@ class Prescription(models.Model):
         import uuid
         return f"RX{str(uuid.uuid4())[:8].upper()}"
     
+    def medicines_summary(self):
+        """Comma-separated names of the prescribed medicines."""
+        return ', '.join(
+            m.get('name', '') for m in self.medicines or [] if isinstance(m, dict) and 'name' in m
+        )
+
     def save(self, *args, **kwargs):
         if not self.prescription_number:
             self.prescription_number = self.generate_prescription_number()
@@ -509,3 +657,134 @@ class RolePermission(models.Model):
 
     def __str__(self):
         return f"{self.role}: {'Enabled' if self.is_enabled else 'Disabled'}"
+
+
+class ActivityEvent(models.Model):
+    """Site activity event (login/logout etc.) used as the database-backed
+    ring buffer when Redis is not configured. Kept bounded by the
+    `prune_activity_events` command."""
+    event_id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=30)
+    action = models.CharField(max_length=30, blank=True, default='')
+    summary = models.CharField(max_length=255)
+    detail = models.CharField(max_length=255, blank=True, default='')
+    link = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'activity_events'
+        ordering = ['-event_id']
+
+    def __str__(self):
+        return f"{self.event_type}: {self.summary}"
+
+
+class AuditLog(models.Model):
+    """Append-only record of admin and clinical actions.
+
+    Rows are written in batches by myapp.utils.audit_log; never update or
+    delete them from views."""
+    log_id = models.BigAutoField(primary_key=True)
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='actor_id',
+        to_field='user_id',
+        related_name='audit_logs'
+    )
+    actor_label = models.CharField(max_length=100, blank=True, default='')
+    action = models.CharField(max_length=50)
+    target_type = models.CharField(max_length=50)
+    target_id = models.CharField(max_length=50, blank=True, default='')
+    summary = models.CharField(max_length=255)
+    detail = models.TextField(blank=True, default='')
+    link = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'audit_logs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='idx_audit_logs_created'),
+            models.Index(fields=['actor', 'created_at'], name='idx_audit_logs_actor_created'),
+            models.Index(fields=['target_type', 'target_id'], name='idx_audit_logs_target'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.target_type}#{self.target_id} by {self.actor_label or self.actor_id}"
+
+
+class DisplayCounter(models.Model):
+    """Last number handed out for a human-facing identifier series.
+
+    One row per series (live appointments, appointment numbers, MRNs). Rows
+    are advanced with a single UPDATE ... RETURNING, see
+    myapp.utils.display_numbers."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'display_counters'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class CacheVersion(models.Model):
+    """Generation of a group of cached entries (the doctor directory, one
+    doctor's slot bitmaps). Bumped when the underlying rows change; the
+    version is part of the cache keys, so every worker stops reading the
+    old entries. See myapp.utils.cache_versions."""
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'cache_versions'
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class ImportJob(models.Model):
+    """State and progress of a bulk import started from the admin upload
+    endpoint. The import thread (myapp.utils.bulk_import) rewrites the row as
+    it goes, so any worker can answer import_status, and `updated_at` tells
+    a finished import from one whose worker died."""
+    job_id = models.CharField(max_length=32, primary_key=True)
+    file_name = models.CharField(max_length=255, blank=True, default='')
+    state = models.CharField(max_length=20, default='running')
+    progress = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'import_jobs'
+
+    def __str__(self):
+        return f"{self.job_id} {self.state}"
+
+
+class SlowQuery(models.Model):
+    """One normalized SQL statement that has run slower than SLOW_QUERY_MS,
+    with running totals and its latest plan. Written by
+    myapp.utils.slow_queries; read with `manage.py slow_queries`."""
+    fingerprint = models.CharField(max_length=40, primary_key=True)
+    query = models.TextField()
+    count = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    view = models.CharField(max_length=200, blank=True, default='')
+    call_site = models.CharField(max_length=255, blank=True, default='')
+    plan = models.TextField(blank=True, default='')
+    plan_at = models.DateTimeField(null=True, blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'slow_queries'
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return f"{self.count}x {self.total_ms:.0f}ms {self.query[:60]}"
@@ -0,0 +1,1138 @@
+import importlib
+import logging
+import os
+import tempfile
+import threading
+import zipfile
+from io import StringIO
+from time import sleep
+from unittest import mock
+from datetime import date, time, timedelta
+
+from django.apps import apps as global_apps
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction, OperationalError
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from .management.commands.bench_login import _parse_server_timing
+from .models import (
+    User, UserProfile, Doctor, Patient, ActivityEvent, AuditLog, ImportJob, LabResult, Appointment, AppointmentSlot, SlotConflict, DisplayCounter,
+    LiveAppointment, Prescription, Notification, NotificationEvent, BookedService, SlowQuery, CacheVersion,
+)
+from .utils.audit_log import BufferedAuditWriter
+from .utils.availability import weekly_masks
+from .utils.display_numbers import allocate, next_number, seed
+from .utils.doctor_directory import get_doctor_card
+from .utils.patient_accounts import create_patient, create_patients
+from .utils.bulk_import import get_progress, import_file
+from .utils.import_profile import parse_importtime, profile_boot
+from .utils.load_test import run_load_test
+from .utils.notification_sync import sync_notifications
+from .utils.notify import delete_unreferenced_files, notify, store_attachment
+from .utils import activity_store, benchmarks, doctor_directory, memory, profiling, rate_limit, slow_queries
+from .utils import notification_partitions as partitions
+from .utils import patient_accounts
+
+
+def _make_doctor(username='doc'):
+    user = User.objects.create(username=username, email=f'{username}@example.com', role='doctor', password='x')
+    return Doctor.objects.create(user=user, specialization='General', license_number=username, years_of_experience=1)
+
+
+def _make_patient(username):
+    return User.objects.create(username=username, email=f'{username}@example.com', role='patient', password='x')
+
+
+def _book(patient, doctor, day, start, duration=30):
+    return Appointment.objects.create(
+        patient=patient, doctor=doctor, consultation_type='F2F',
+        consultation_date=day, consultation_time=start, duration_minutes=duration,
+    )
+
+
+class AppointmentConflictTests(TestCase):
+    def setUp(self):
+        self.doctor = _make_doctor()
+        self.patient = _make_patient('pat')
+        self.day = date.today() + timedelta(days=7)
+
+    def test_overlapping_durations_conflict(self):
+        _book(self.patient, self.doctor, self.day, time(9, 0), duration=60)
+        with self.assertRaises(SlotConflict):
+            _book(self.patient, self.doctor, self.day, time(9, 30))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_adjacent_appointments_do_not_conflict(self):
+        _book(self.patient, self.doctor, self.day, time(9, 0), duration=30)
+        _book(self.patient, self.doctor, self.day, time(9, 30), duration=60)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_cancelling_releases_the_slot(self):
+        first = _book(self.patient, self.doctor, self.day, time(10, 0))
+        first.status = 'Cancelled'
+        first.save()
+        self.assertFalse(AppointmentSlot.objects.filter(appointment=first).exists())
+        _book(self.patient, self.doctor, self.day, time(10, 0))
+
+    def test_moving_into_a_taken_slot_is_rolled_back(self):
+        _book(self.patient, self.doctor, self.day, time(11, 0))
+        other = _book(self.patient, self.doctor, self.day, time(14, 0))
+        other.consultation_time = time(11, 15)
+        with self.assertRaises(SlotConflict):
+            other.save()
+        other.refresh_from_db()
+        self.assertEqual(other.consultation_time, time(14, 0))
+        self.assertEqual(AppointmentSlot.objects.filter(appointment=other).count(), 6)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """N threads race for the same slot; exactly one booking may win."""
+    THREADS = 8
+
+    def test_one_winner_per_slot(self):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            self.skipTest('needs a database shared between threads')
+        doctor = _make_doctor()
+        patients = [_make_patient(f'p{i}') for i in range(self.THREADS)]
+        day = date.today() + timedelta(days=3)
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+        lock = threading.Lock()
+
+        def attempt(patient, minute):
+            try:
+                barrier.wait()
+                _book(patient, doctor, day, time(9, minute), duration=30)
+                result = 'won'
+            except SlotConflict:
+                result = 'conflict'
+            except OperationalError:
+                # SQLite serialises writers with "database is locked"
+                result = 'locked'
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes.append(result)
+
+        # Start times 09:00-09:14 all overlap each other's 30 minutes
+        threads = [threading.Thread(target=attempt, args=(p, i * 2)) for i, p in enumerate(patients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('won'), 1, outcomes)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor).count(), 1)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(outcomes.count('conflict'), self.THREADS - 1)
+
+
+class DisplayNumberTests(TransactionTestCase):
+    def test_numbers_are_sequential_and_formatted(self):
+        self.assertEqual(next_number('live_appointment'), 'LAP001')
+        self.assertEqual(next_number('live_appointment'), 'LAP002')
+        seed('live_appointment', 999)
+        self.assertEqual(next_number('live_appointment'), 'LAP1000')
+        self.assertEqual(next_number('mrn'), 'MRN00000001')
+
+    def test_parallel_allocation_never_repeats(self):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            self.skipTest('needs a database shared between threads')
+        allocate('appointment')  # create the counter row up front
+        values = []
+        lock = threading.Lock()
+
+        def worker():
+            mine = []
+            try:
+                for _ in range(25):
+                    try:
+                        mine.append(allocate('appointment'))
+                    except OperationalError:
+                        pass  # SQLite: "database is locked"
+            finally:
+                connections.close_all()
+            with lock:
+                values.extend(mine)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(values), len(set(values)))
+        self.assertEqual(DisplayCounter.objects.get(name='appointment').value, len(values) + 1)
+
+
+class PatientAccountTests(TestCase):
+    def test_usernames_continue_after_existing_ones(self):
+        _make_patient('johnsmith')
+        _make_patient('johnsmith1')
+        user, patient, password = create_patient(first_name='John', last_name='Smith', sex='male', date_of_birth='1990-01-02')
+        self.assertEqual(user.username, 'johnsmith2')
+        self.assertEqual(password, 'Patient@johnsmith2')
+        self.assertTrue(user.check_password(password))
+        self.assertEqual(patient.gender, 'M')
+        self.assertEqual(user.userprofile.last_name, 'Smith')
+
+    def test_bulk_creation_allocates_distinct_names_and_mrns(self):
+        rows = [{'first_name': 'Ana', 'last_name': 'Cruz'} for _ in range(50)]
+        rows += [{'first_name': f'Pat{i}', 'last_name': 'Lee'} for i in range(50)]
+        created = create_patients(rows, workers=2)
+        usernames = [user.username for user, _, _ in created]
+        self.assertEqual(len(set(usernames)), 100)
+        self.assertEqual(usernames[:3], ['anacruz', 'anacruz1', 'anacruz2'])
+        mrns = set(Patient.objects.values_list('medical_record_number', flat=True))
+        self.assertEqual(len(mrns), 100)
+
+
+
+class PatientAllocationRaceTests(TransactionTestCase):
+    def test_username_registered_after_the_check_is_skipped(self):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            self.skipTest('needs a database shared between threads')
+        real_next_numbers = patient_accounts.next_numbers
+        calls = []
+
+        def register(username):
+            try:
+                _make_patient(username)
+            finally:
+                connections.close_all()
+
+        def racing_next_numbers(series, count):
+            # Someone registers "johnsmith" by hand once it has been checked
+            calls.append(series)
+            if len(calls) == 1:
+                thread = threading.Thread(target=register, args=('johnsmith',))
+                thread.start()
+                thread.join()
+            return real_next_numbers(series, count)
+
+        with mock.patch('myapp.utils.patient_accounts.next_numbers', side_effect=racing_next_numbers):
+            user, patient, _ = create_patient(first_name='John', last_name='Smith')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(user.username, 'johnsmith1')
+        # The failed attempt's MRN went back to the counter
+        self.assertEqual(patient.medical_record_number, 'MRN00000001')
+        self.assertEqual(User.objects.filter(username__startswith='johnsmith').count(), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DoctorDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = _make_doctor('dirdoc')
+
+    def _card(self):
+        return get_doctor_card(self.doctor.doctor_id)
+
+    def test_editing_a_doctor_rebuilds_the_cards(self):
+        self.assertEqual(self._card()['specialization'], 'General')
+        self.doctor.specialization = 'Cardiology'
+        self.doctor.save()
+        self.assertEqual(self._card()['specialization'], 'Cardiology')
+
+    @override_settings(CACHE_VERSION_TTL=0)
+    def test_version_bumped_by_another_worker_is_picked_up(self):
+        self._card()
+        # Another worker saved the doctor: new row values and a new version
+        Doctor.objects.filter(pk=self.doctor.pk).update(specialization='Neurology')
+        CacheVersion.objects.update_or_create(name=doctor_directory.CARDS_VERSION, defaults={'version': 99})
+        self.assertEqual(self._card()['specialization'], 'Neurology')
+
+    def test_booking_and_deleting_bump_the_count(self):
+        patient = _make_patient('dirpat')
+        self.assertEqual(self._card()['appointment_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = _book(patient, self.doctor, date.today() + timedelta(days=1), time(9))
+        self.assertEqual(self._card()['appointment_count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertEqual(self._card()['appointment_count'], 0)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = _make_doctor('slotdoc')
+        self.doctor.availability = {'days': ['Monday'], 'start': '09:00', 'end': '11:00'}
+        self.doctor.save()
+        self.day = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())  # next Monday
+
+    def _slots(self):
+        response = self.client.get(
+            reverse('doctor_slots', args=[self.doctor.doctor_id]), {'from': self.day, 'to': self.day}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['slots'][self.day.isoformat()]
+
+    def test_weekly_masks_keep_whole_slots_of_every_schedule(self):
+        masks = weekly_masks({'schedules': [
+            {'days': ['Monday', 'friday '], 'start': '09:15', 'end': '11:00'},
+            {'days': ['Monday'], 'start': '14:00', 'end': '14:30'},
+            {'days': ['Tuesday'], 'start': '12:00', 'end': '11:00'},
+            {'days': ['Someday'], 'start': '08:00', 'end': '09:00'},
+        ]})
+        self.assertEqual(masks, {0: 0b111 << 19 | 1 << 28, 4: 0b111 << 19})
+        self.assertEqual(weekly_masks(None), {})
+
+    def test_booked_slots_are_not_offered(self):
+        self.assertEqual(self._slots(), ['09:00', '09:30', '10:00', '10:30'])
+        _book(_make_patient('slotpat'), self.doctor, self.day, time(9, 30), duration=60)
+        self.assertEqual(self._slots(), ['09:00', '10:30'])
+
+    def test_range_is_validated(self):
+        response = self.client.get(reverse('all_doctor_slots'), {'from': self.day, 'to': self.day - timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CACHE_VERSION_TTL=0)
+    def test_booking_in_another_worker_invalidates_the_bitmap(self):
+        self._slots()
+        # Another worker booked and bumped the doctor's version; this
+        # worker's cached bitmap is left behind
+        Appointment.objects.bulk_create([Appointment(
+            patient=_make_patient('slotpat'), doctor=self.doctor, consultation_type='F2F',
+            consultation_date=self.day, consultation_time=time(10), duration_minutes=30,
+        )])
+        CacheVersion.objects.update_or_create(name=f'doctor_slots:{self.doctor.doctor_id}', defaults={'version': 99})
+        self.assertEqual(self._slots(), ['09:00', '09:30', '10:30'])
+
+
+class NotificationSyncTests(TestCase):
+    def test_missing_notifications_are_inserted_once(self):
+        doctor = _make_doctor('syncdoc')
+        patient = _make_patient('syncpat')
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        appointment = _book(patient, doctor, tomorrow, time(9))
+        Appointment.objects.filter(pk=appointment.pk).update(approval_status='Approved', status='Scheduled')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sync_notifications(patient.user_id), 2)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "notifications"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(Notification.objects.filter(user=patient).values_list('event_key', flat=True)),
+            {f'appointment:{appointment.pk}:approved', f'appointment:{appointment.pk}:tomorrow'},
+        )
+
+        self.assertEqual(sync_notifications(patient.user_id), 0)
+        self.assertEqual(Notification.objects.filter(user=patient).count(), 2)
+
+    def test_sync_after_month_rollover_adds_no_duplicates(self):
+        patient = _make_patient('rollpat')
+        patient.last_login = timezone.now() - timedelta(days=60)
+        patient.save(update_fields=['last_login'])
+        self.assertEqual(sync_notifications(patient.user_id), 1)
+        # The first notification now lives in last month's partition
+        Notification.objects.filter(user=patient).update(created_at=timezone.now() - timedelta(days=35))
+        self.assertEqual(sync_notifications(patient.user_id), 0)
+        self.assertEqual(Notification.objects.filter(user=patient, event_key='account:inactive').count(), 1)
+
+    def test_key_claimed_after_the_lookup_is_skipped(self):
+        patient = _make_patient('racepat')
+        patient.last_login = timezone.now() - timedelta(days=60)
+        patient.save(update_fields=['last_login'])
+        real_filter = NotificationEvent.objects.filter
+        lookups = []
+
+        def stale_filter(*args, **kwargs):
+            # The first lookup misses the claim another worker commits meanwhile
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                NotificationEvent.objects.create(user=patient, event_key='account:inactive')
+                return NotificationEvent.objects.none()
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(NotificationEvent.objects, 'filter', side_effect=stale_filter):
+            self.assertEqual(sync_notifications(patient.user_id), 0)
+        self.assertEqual(len(lookups), 2)
+        self.assertFalse(Notification.objects.filter(user=patient).exists())
+
+
+class SendRemindersTests(TestCase):
+    def test_reminders_are_sent_once(self):
+        doctor = _make_doctor()
+        soon = timezone.localtime() + timedelta(hours=2)
+        due = [
+            Appointment.objects.create(
+                patient=_make_patient(f'pat{n}'), doctor=doctor, consultation_type='F2F',
+                consultation_date=soon.date(), consultation_time=time(soon.hour, n * 10), duration_minutes=10,
+                status='Scheduled', approval_status='Approved',
+            )
+            for n in range(3)
+        ]
+        # Pending approval: no reminder
+        _book(_make_patient('pending'), doctor, soon.date(), time(soon.hour, 45))
+
+        call_command('send_reminders', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(Appointment.objects.filter(reminder_sent=True).count(), 3)
+        self.assertFalse(Appointment.objects.filter(reminder_sent=True, reminder_sent_at__isnull=True).exists())
+        self.assertEqual(Notification.objects.filter(title='Appointment Reminder').count(), 3)
+        self.assertEqual(Notification.objects.filter(title='Upcoming Appointment', user=doctor.user).count(), 3)
+
+        out = StringIO()
+        call_command('send_reminders', stdout=out)
+        self.assertIn('No appointments due', out.getvalue())
+        self.assertEqual(Notification.objects.filter(related_id__in=[a.pk for a in due]).count(), 6)
+
+
+class ActivityStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _event(self, n, **extra):
+        return dict({'type': 'Auth', 'action': 'login', 'summary': f'Login: user{n}', 'detail': 'x', 'link': 'mod_users'}, **extra)
+
+    def test_push_and_read_newest_first(self):
+        for n in range(5):
+            self.assertTrue(activity_store.push_event(self._event(n)))
+        events = activity_store.read_events(limit=3)
+        self.assertEqual([event['summary'] for event in events], ['Login: user4', 'Login: user3', 'Login: user2'])
+        older = activity_store.read_events(cursor=events[-1]['id'], limit=3)
+        self.assertEqual([event['summary'] for event in older], ['Login: user1', 'Login: user0'])
+
+    def test_duplicates_are_dropped(self):
+        self.assertTrue(activity_store.push_event(self._event(1)))
+        self.assertFalse(activity_store.push_event(self._event(1, detail='other')))
+        self.assertTrue(activity_store.push_event(self._event(1, action='logout')))
+        self.assertEqual(ActivityEvent.objects.count(), 2)
+        # The marker expires after DEDUPE_SECONDS
+        cache.delete(activity_store._dedupe_key(self._event(1)))
+        self.assertTrue(activity_store.push_event(self._event(1)))
+
+    def test_prune_keeps_newest(self):
+        for n in range(10):
+            activity_store.push_event(self._event(n))
+        out = StringIO()
+        call_command('prune_activity_events', '--keep', '4', stdout=out)
+        self.assertIn('removed 6', out.getvalue())
+        self.assertEqual([event['summary'] for event in activity_store.read_events()],
+                         [f'Login: user{n}' for n in range(9, 5, -1)])
+        self.assertEqual(activity_store.get_activity_store().prune(keep=4), 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class NotificationCleanupTests(TestCase):
+    def setUp(self):
+        self.users = [_make_patient(f'pat{n}') for n in range(3)]
+
+    def test_purge_keeps_attachments_still_in_use(self):
+        shared = notify(self.users, 'Lab result', 'Ready', attachment=b'shared', attachment_name='result.pdf')
+        single = notify(self.users[:1], 'Invoice', 'Paid', attachment=b'single', attachment_name='invoice.pdf')
+        old = timezone.now() - timedelta(days=30)
+        Notification.objects.filter(pk__in=[shared[0].pk, shared[1].pk, single[0].pk]).update(created_at=old)
+
+        call_command('cleanup_old_notifications', '--sleep', '0', stdout=StringIO())
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [shared[2].pk])
+        self.assertTrue(default_storage.exists(shared[2].file.name))
+        self.assertFalse(default_storage.exists(single[0].file.name))
+
+    def test_files_are_checked_again_before_delete(self):
+        reused = notify(self.users[:1], 'Lab result', 'Ready', attachment=b'shared', attachment_name='result.pdf')[0]
+        orphan = store_attachment(b'orphan', 'orphan.pdf')
+        self.assertEqual(delete_unreferenced_files([reused.file.name, orphan]), 1)
+        self.assertTrue(default_storage.exists(reused.file.name))
+        self.assertFalse(default_storage.exists(orphan))
+
+    def test_notify_restores_attachment_removed_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notify(self.users, 'Lab result', 'Ready', attachment=b'shared', attachment_name='result.pdf')
+            # A purge that checked before these rows existed removes the file
+            default_storage.delete(created[0].file.name)
+        self.assertTrue(default_storage.exists(created[0].file.name))
+
+
+
+class NotificationPartitionMigrationTests(TransactionTestCase):
+    """Migration 0021 forwards and backwards on a table holding rows."""
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('notifications are only partitioned on PostgreSQL')
+        self.migration = importlib.import_module('myapp.migrations.0021_partition_notifications')
+
+    def _run(self, function):
+        with connection.schema_editor() as schema_editor:
+            function(global_apps, schema_editor)
+
+    def _table_exists(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            return cursor.fetchone()[0] is not None
+
+    def _notify(self, user, days_ago=0, key=None):
+        notification = Notification.objects.create(user=user, title='t', message='m',
+                                                   notification_type='system', event_key=key)
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return notification.pk
+
+    def test_partition_and_unpartition_keep_rows_and_ids(self):
+        started_partitioned = partitions.is_partitioned()
+        if started_partitioned:
+            self._run(self.migration.unpartition_notifications)
+        user = _make_patient('partpat')
+        ids = [self._notify(user, days_ago=days, key=f'k{days}') for days in (0, 40, 100)]
+
+        self._run(self.migration.partition_notifications)
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(sorted(Notification.objects.values_list('pk', flat=True)), ids)
+        oldest = (timezone.now() - timedelta(days=100)).date()
+        self.assertTrue(self._table_exists(partitions.partition_name(oldest)))
+        self.assertTrue(self._table_exists(partitions.LEGACY))
+        ids.append(self._notify(user))
+        self.assertGreater(ids[-1], ids[-2])
+
+        out = StringIO()
+        call_command('notification_partitions', '--drop-legacy', stdout=out)
+        self.assertIn('Dropped notifications_legacy', out.getvalue())
+        self.assertFalse(self._table_exists(partitions.LEGACY))
+
+        self._run(self.migration.unpartition_notifications)
+        self.assertFalse(partitions.is_partitioned())
+        self.assertEqual(sorted(Notification.objects.values_list('pk', flat=True)), ids)
+        self.assertTrue(self._table_exists('uniq_notifications_user_event'))
+        ids.append(self._notify(user))
+        self.assertGreater(ids[-1], ids[-2])
+        user.delete()
+        self.assertFalse(Notification.objects.exists())
+
+        if started_partitioned:
+            self._run(self.migration.partition_notifications)
+            partitions.drop_legacy_table()
+
+
+class AuditLogWriterTests(TestCase):
+    def _entry(self, **fields):
+        return AuditLog(**dict({'action': 'create', 'target_type': 'Appointment', 'summary': 'booked'}, **fields))
+
+    def test_flushes_when_the_batch_is_full(self):
+        writer = BufferedAuditWriter(batch_size=3, flush_interval=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.add(self._entry())
+            writer.add(self._entry())
+        self.assertEqual((writer.pending(), AuditLog.objects.count()), (2, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.add(self._entry())
+            # Not inside the caller's transaction
+            self.assertEqual((writer.pending(), AuditLog.objects.count()), (3, 0))
+        self.assertEqual((writer.pending(), AuditLog.objects.count()), (0, 3))
+
+    def test_flushes_when_the_interval_has_passed(self):
+        writer = BufferedAuditWriter(batch_size=50, flush_interval=3600)
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.add(self._entry())
+        self.assertEqual(AuditLog.objects.count(), 0)
+        writer._last_flush -= 3600
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.add(self._entry())
+        self.assertEqual((writer.pending(), AuditLog.objects.count()), (0, 2))
+
+    def test_rolled_back_caller_does_not_lose_queued_entries(self):
+        writer = BufferedAuditWriter(batch_size=2, flush_interval=0)
+        writer.add(self._entry())
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    writer.add(self._entry())
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual((writer.pending(), AuditLog.objects.count()), (2, 0))
+        self.assertEqual(writer.flush(), 2)
+
+    def test_creations_are_logged_only_once_committed(self):
+        patient = _make_patient('auditpat')
+        with mock.patch('myapp.utils.audit_log.log_action') as log_action:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        BookedService.objects.create(user=patient, service_name='CBC', booking_date=date.today(),
+                                                     booking_time=time(9))
+                        raise ValueError
+                except ValueError:
+                    pass
+            log_action.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                BookedService.objects.create(user=patient, service_name='X-ray', booking_date=date.today(),
+                                             booking_time=time(10))
+            self.assertEqual(log_action.call_args.kwargs['summary'], 'Service: X-ray')
+
+    def test_bad_entries_do_not_lose_the_batch(self):
+        writer = BufferedAuditWriter(batch_size=50, flush_interval=0)
+        actor = _make_patient('auditactor')
+        for entry in (self._entry(actor_id=actor.user_id), self._entry(actor_id=actor.user_id + 1000),
+                      self._entry(summary=None), self._entry()):
+            writer.add(entry)
+        with self.assertLogs('myapp.utils.audit_log', 'ERROR'):
+            self.assertEqual(writer.flush(), 3)
+        self.assertCountEqual(
+            AuditLog.objects.values_list('actor_id', 'actor_label'),
+            [(actor.user_id, ''), (None, f'User #{actor.user_id + 1000} (deleted)'), (None, '')],
+        )
+
+
+class LoginBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='pat', email='pat@example.com', role='patient', password='s3cret-pass')
+        UserProfile.objects.create(user=self.user, first_name='Pat', last_name='Ient')
+
+    def _login(self, password='s3cret-pass'):
+        return self.client.post(reverse('login'), {'username': 'pat', 'password': password},
+                                content_type='application/json')
+
+    def test_login_loads_profile_with_user(self):
+        user = authenticate(None, username='pat', password='s3cret-pass')
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.userprofile.first_name, 'Pat')
+        self.assertIsNone(authenticate(None, username='pat', password='wrong'))
+        self.assertIsNone(authenticate(None, username='nobody', password='s3cret-pass'))
+
+        response = self._login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_name'], 'Pat Ient')
+        self.assertEqual(self.client.session['role'], 'patient')
+        self.assertEqual(self._login('wrong').status_code, 401)
+
+    def test_login_timings_are_sent_only_when_enabled(self):
+        self.assertNotIn('Server-Timing', self._login('wrong'))
+        with self.settings(REQUEST_METRICS_SERVER_TIMING=True):
+            self.assertIn('auth;dur=', self._login()['Server-Timing'])
+
+    def test_login_upgrades_pbkdf2_hash_to_argon2(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('s3cret-pass', hasher='pbkdf2_sha256'))
+        self.assertEqual(self._login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertTrue(self.user.check_password('s3cret-pass'))
+
+    def test_save_hashes_raw_passwords_only(self):
+        self.assertEqual(identify_hasher(self.user.password).algorithm, 'argon2')
+        self.assertTrue(self.user.check_password('s3cret-pass'))
+
+        for hashed in (make_password('other', hasher='pbkdf2_sha256'),
+                       'bcrypt_sha256$$2b$12$abcdefghijklmnopqrstuuJ1vNSqXUsIsrV3F4WQVnX4cBjO6Lh1q'):
+            self.user.password = hashed
+            self.user.save()
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.password, hashed)
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'login': {'ip': '2/m', 'username': '10/m'}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _login(self, **extra):
+        return self.client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'},
+                                content_type='application/json', **extra)
+
+    def test_requests_over_the_limit_get_429(self):
+        self.assertNotEqual(self._login().status_code, 429)
+        self.assertNotEqual(self._login().status_code, 429)
+        response = self._login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Another client still gets through
+        self.assertNotEqual(self._login(REMOTE_ADDR='10.0.0.9').status_code, 429)
+
+    def test_window_expires(self):
+        self.assertEqual(rate_limit.hit('test', 'expiry', 1, 1), 0)
+        self.assertGreater(rate_limit.hit('test', 'expiry', 1, 1), 0)
+        sleep(2.1)  # the current and the previous one-second window are over
+        self.assertEqual(rate_limit.hit('test', 'expiry', 1, 1), 0)
+
+    def test_forwarded_for_is_trusted_only_when_configured(self):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.5, 10.0.0.1')
+        with self.settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=False):
+            self.assertEqual(rate_limit.client_ip(request), '10.0.0.1')
+        with self.settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=True):
+            self.assertEqual(rate_limit.client_ip(request), '10.0.0.1')
+            with self.settings(RATE_LIMIT_TRUSTED_PROXIES=2):
+                self.assertEqual(rate_limit.client_ip(request), '203.0.113.5')
+            self._login(HTTP_X_FORWARDED_FOR='203.0.113.5')
+            self._login(HTTP_X_FORWARDED_FOR='203.0.113.5')
+            self.assertEqual(self._login(HTTP_X_FORWARDED_FOR='203.0.113.5').status_code, 429)
+            # A spoofed leftmost entry does not change the proxy-appended address
+            spoofed = self._login(HTTP_X_FORWARDED_FOR='198.51.100.7, 203.0.113.5')
+            self.assertEqual(spoofed.status_code, 429)
+            self.assertNotEqual(self._login(HTTP_X_FORWARDED_FOR='203.0.113.6').status_code, 429)
+
+    def test_bench_login_is_not_throttled(self):
+        out = StringIO()
+        call_command('bench_login', iterations=12, stdout=out)
+        self.assertIn('pbkdf2 (12 logins)', out.getvalue())
+
+    def test_bench_login_ignores_server_timing_descriptions(self):
+        header = 'auth;dur=12.5, session;dur=1.0, db;dur=3.2;desc="4 queries", app;dur=20.0'
+        self.assertEqual(_parse_server_timing(header),
+                         {'auth': 12.5, 'session': 1.0, 'db': 3.2, 'app': 20.0})
+        self.assertEqual(_parse_server_timing('db;desc="no duration", tpl;dur=x'), {})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BulkImportTests(TestCase):
+    def _archive(self):
+        path = tempfile.NamedTemporaryFile(suffix='.zip', delete=False).name
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('patients.csv', (
+                'first_name,last_name,sex,date_of_birth,external_id\n'
+                'Ana,Cruz,female,1990-04-01,A1\n'
+                'Ben,Reyes,male,1985-13-01,B1\n'
+                'Carl,Santos,other,,C1\n'
+            ))
+            archive.writestr('lab_results.csv', (
+                'patient,lab_type,file,notes\n'
+                'A1,CBC,cbc.pdf,fasting\n'
+                'B1,CBC,cbc.pdf,\n'
+                'C1,Urinalysis,missing.pdf,\n'
+            ))
+            archive.writestr('cbc.pdf', b'%PDF-1.4 test')
+        return path
+
+    def test_valid_rows_are_imported_and_bad_rows_reported(self):
+        report = import_file(self._archive(), chunk_size=2, set_passwords=False)
+        self.assertEqual(report.state, 'done')
+        self.assertEqual((report.patients, report.lab_results), (2, 1))
+        self.assertEqual([(source, line) for source, line, _ in report.errors],
+                         [('patients.csv', 3), ('lab_results.csv', 3), ('lab_results.csv', 4)])
+        result = LabResult.objects.get()
+        self.assertEqual(result.user.username, 'anacruz')
+        self.assertEqual(result.read_file(), b'%PDF-1.4 test')
+
+    def test_job_state_is_read_from_the_database(self):
+        ImportJob.objects.create(job_id='live', progress={'patients': 5})
+        ImportJob.objects.create(job_id='dead', updated_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(get_progress('live'), {'patients': 5, 'state': 'running'})
+        self.assertEqual(get_progress('dead')['state'], 'interrupted')
+        self.assertIsNone(get_progress('missing'))
+
+
+class RequestMetricsTests(TestCase):
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=True)
+    def test_server_timing_reports_queries(self):
+        patient = _make_patient('timed')
+        session = self.client.session
+        session['user_id'] = patient.user_id
+        session.save()
+        with self.assertLogs('myapp.requests', 'INFO') as logs:
+            response = self.client.get('/dashboard/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertRegex(logs.output[0], r'view=dashboard status=200 queries=\d+ ')
+
+    def test_server_timing_is_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/dashboard/'))
+
+
+class MetricsEndpointTests(TestCase):
+    def test_local_scrape_sees_request_metrics(self):
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'medisafe_request_duration_seconds_bucket', response.content)
+
+    def test_proxied_scrape_is_refused(self):
+        response = self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        admin = User.objects.create(username='padmin', email='padmin@example.com', role='admin', password='x')
+        self.client.force_login(admin)
+        session = self.client.session
+        session['user'] = session['user_id'] = admin.user_id
+        session['role'] = 'admin'
+        session['is_admin'] = True
+        session.save()
+
+    def _super_admin(self):
+        session = self.client.session
+        session['is_super_admin'] = True
+        session.save()
+
+    def test_parameter_is_ignored_for_plain_admins(self):
+        with self.settings(PROFILING_DIR=self.directory):
+            response = self.client.get(reverse('mod_analytics') + '?__profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+
+    def test_super_admin_gets_cprofile_report(self):
+        self._super_admin()
+        with self.settings(PROFILING_DIR=self.directory):
+            response = self.client.get(reverse('mod_analytics') + '?__profile=1')
+        self.assertIn(b'function calls', response.content)
+        self.assertIn(b'analytics_views.py', response.content)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, response['X-Profile-File'])))
+
+    def test_sampler_folds_a_busy_thread(self):
+        done = threading.Event()
+
+        def spin():
+            while not done.is_set():
+                sum(range(1000))
+        worker = threading.Thread(target=spin)
+        worker.start()
+        sampler = profiling.StackSampler({worker.ident}, interval=0.001).start()
+        try:
+            while not sampler.counts:
+                done.wait(0.01)
+        finally:
+            sampler.stop()
+            done.set()
+            worker.join()
+        stack, count = sampler.folded().splitlines()[0].rsplit(' ', 1)
+        self.assertIn('ProfilingTests.test_sampler_folds_a_busy_thread.<locals>.spin', stack)
+        self.assertGreater(int(count), 0)
+
+
+
+class SlowQueryTests(TestCase):
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(
+            slow_queries.normalize("SELECT * FROM users WHERE id IN (%s, %s) AND name = 'x' LIMIT 21"),
+            slow_queries.normalize('SELECT * FROM users\n WHERE id IN (%s) AND name = %s LIMIT 5'),
+        )
+        self.assertNotEqual(slow_queries.normalize('SELECT col1 FROM t2'), slow_queries.normalize('SELECT col2 FROM t2'))
+
+    def test_only_read_only_selects_are_analyzed(self):
+        self.assertTrue(slow_queries.is_read_only("SELECT * FROM users WHERE note = 'update; delete'"))
+        self.assertTrue(slow_queries.is_read_only('WITH recent AS (SELECT 1) SELECT * FROM recent'))
+        for sql in ('SELECT * FROM appointment_slots WHERE doctor_id = %s FOR UPDATE',
+                    'SELECT * FROM display_counters FOR NO KEY UPDATE SKIP LOCKED',
+                    'SELECT * FROM users FOR SHARE',
+                    'WITH moved AS (DELETE FROM t RETURNING *) SELECT * FROM moved',
+                    'UPDATE users SET role = %s'):
+            self.assertFalse(slow_queries.is_read_only(sql), sql)
+
+    def test_plans_are_redacted_and_expire(self):
+        self.assertEqual(slow_queries.redact("Filter: ((email)::text = 'ana@example.com'::text)"),
+                         "Filter: ((email)::text = '?'::text)")
+        SlowQuery.objects.create(fingerprint='old', query='SELECT ?', plan='Seq Scan',
+                                 plan_at=timezone.now() - timedelta(days=30))
+        slow_queries.observe('SELECT 1', (), False, 0.5, 'test', 'myapp/tests.py:1')
+        slow_queries.flush_slow_queries()
+        self.assertEqual(SlowQuery.objects.get(fingerprint='old').plan, '')
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_request_statements_are_archived_with_plan(self):
+        patient = _make_patient('slowpat')
+        session = self.client.session
+        session['user_id'] = patient.user_id
+        session.save()
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        self.assertGreater(slow_queries.flush_slow_queries(), 0)
+        # Statements issued by both requests are grouped into one row
+        row = SlowQuery.objects.filter(view='dashboard', call_site__startswith='myapp/', count=2).first()
+        self.assertIsNotNone(row)
+        self.assertTrue(row.plan and not row.plan.startswith('(not explained'), row.plan)
+
+        out = StringIO()
+        call_command('slow_queries', '--plans', stdout=out)
+        self.assertIn(row.call_site, out.getvalue())
+
+
+
+class ImportProfileTests(TestCase):
+    def test_parse_importtime_nesting(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   reportlab.lib\n'
+            'import time:        30 |        150 | reportlab\n'
+        )
+        self.assertEqual(parse_importtime(output), [('reportlab.lib', 1, 120, 120), ('reportlab', 0, 30, 150)])
+
+    def test_worker_boot_skips_heavy_optional_packages(self):
+        profile = profile_boot('wsgi', runs=1)
+        loaded = {row['module'].split('.')[0] for row in profile['imports']}
+        self.assertIn('myapp', loaded)
+        self.assertEqual(loaded & {'reportlab', 'supabase', 'redis', 'PIL'}, set())
+
+
+
+class MemoryProfilingTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='madmin', email='madmin@example.com', role='admin', password='x')
+        session = self.client.session
+        session['user'] = session['user_id'] = admin.user_id
+        session['is_admin'] = True
+        session.save()
+        self.settings_override = self.settings(PROFILING_DIR=tempfile.mkdtemp())
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.addCleanup(memory.stop_tracing)
+
+    def _post(self, **body):
+        return self.client.post(reverse('memory_profile'), body, content_type='application/json').json()
+
+    def test_snapshot_diff_points_at_the_allocating_line(self):
+        self.assertEqual(self._post(action='snapshot')['error'], 'Tracing is not started')
+        self.assertTrue(self._post(action='start')['tracing'])
+        base = self._post(action='snapshot')['snapshot']
+        hoard = [bytes(4096) for _ in range(256)]  # noqa: F841
+        target = self._post(action='snapshot')['snapshot']
+        rows = self._post(action='diff', base=base, target=target)['diff']
+        self.assertTrue(any(row['where'].startswith('myapp/tests.py:') and row['size_diff_kb'] >= 1000 for row in rows),
+                        rows)
+        self.assertEqual(self.client.get(reverse('memory_profile')).json()['snapshots'], [base, target])
+        self.assertEqual(self._post(action='diff', base='../x', target=target)['error'], "Invalid snapshot name: '../x'")
+
+    def test_non_admins_are_refused(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('memory_profile')).status_code, 403)
+
+    @override_settings(MEMORY_PEAK_VIEWS=['memory_profile'], MEMORY_PEAK_SAMPLE_RATE=1)
+    def test_flagged_view_peak_is_logged(self):
+        with self.assertLogs('myapp.requests', 'INFO') as logs:
+            self.client.get(reverse('memory_profile'))
+        self.assertTrue(any('memory view=memory_profile peak_kb=' in line for line in logs.output), logs.output)
+        self.assertFalse(memory.status()['tracing'])
+
+    def test_measuring_never_disturbs_other_tracing(self):
+        memory.start_tracing()
+        hoard = [bytes(4096) for _ in range(64)]  # noqa: F841
+        peak = memory.status()['traced_peak_kb']
+        self.assertEqual(memory.measure_peak(lambda: 'done'), ('done', None))
+        status = memory.status()
+        self.assertTrue(status['tracing'])
+        self.assertGreaterEqual(status['traced_peak_kb'], peak)
+        memory.stop_tracing()
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        measuring = threading.Thread(target=memory.measure_peak, args=(slow,))
+        measuring.start()
+        started.wait(5)
+        self.assertEqual(memory.measure_peak(lambda: 'done'), ('done', None))
+        release.set()
+        measuring.join(5)
+        self.assertFalse(memory.status()['tracing'])
+        result, peak = memory.measure_peak(lambda: bytes(1 << 20))
+        self.assertGreaterEqual(peak, 1 << 20)
+
+    @override_settings(MEMORY_SNAPSHOTS_KEEP=1)
+    def test_snapshot_retention_spares_other_workers(self):
+        other = f'{os.getpid() + 1}-1'
+        open(os.path.join(memory.snapshot_dir(), f'{other}.tracemalloc'), 'wb').close()
+        memory.start_tracing()
+        memory.take_snapshot()
+        newest = memory.take_snapshot()
+        self.assertCountEqual(memory.list_snapshots(), [other, newest])
+
+    def test_worker_is_recycled_over_the_rss_limit(self):
+        class Worker:
+            alive = True
+            pid = os.getpid()
+            log = logging.getLogger('gunicorn.error')
+
+        worker = Worker()
+        self.assertFalse(memory.recycle_if_bloated(worker, 1024 * 1024))
+        with self.assertLogs('gunicorn.error', 'WARNING'):
+            self.assertTrue(memory.recycle_if_bloated(worker, 1))
+        self.assertFalse(worker.alive)
+
+
+def _named_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _named_patterns(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern
+
+
+class ViewQueryCountTests(TestCase):
+    """GET every named URL as every role, at two dataset sizes.
+
+    Counts include the session and auth lookups every request makes. A view
+    whose count grows with the data has an N+1 query; a view over its
+    ceiling has gained queries that should be reviewed.
+    """
+    SMALL, LARGE = 2, 20
+    DEFAULT_CEILING = 10
+    CEILINGS = {
+        'mod_analytics': 45,
+        'analytics_api': 40,
+        'moddashboard': 28,
+        'userprofile': 18,
+        'mod_records': 16,
+        'get_dynamic_statistics': 16,
+        'admin_send_notification': 16,
+        'doctor_panel': 15,
+        'prescription_print': 15,
+        'mod_users': 14,
+        'prescription_download': 13,
+    }
+    # These end the client's session
+    SKIP = {'logout', 'exit_super_admin'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='qadmin', email='qadmin@example.com', role='admin', password='x')
+        cls.doctor = _make_doctor('qdoc')
+        UserProfile.objects.create(user=cls.doctor.user, first_name='Doc', last_name='Tor')
+        cls.patient = _make_patient('qpat')
+        UserProfile.objects.create(user=cls.patient, first_name='Pat', last_name='Ient')
+        Patient.objects.create(user=cls.patient, medical_record_number='Q-MRN')
+        cls.slots = 0
+
+    def _grow(self, count):
+        """Add `count` patients and doctors, each with appointments, lab results,
+        notifications and bookings shared with the tested patient and doctor."""
+        for _ in range(count):
+            n = User.objects.count()
+            other = _make_patient(f'qp{n}')
+            UserProfile.objects.create(user=other, first_name='Other', last_name=str(n))
+            Patient.objects.create(user=other, medical_record_number=f'Q-{n}')
+            other_doctor = _make_doctor(f'qd{n}')
+            UserProfile.objects.create(user=other_doctor.user, first_name='Other', last_name=f'Doc{n}')
+            for patient in (self.patient, other):
+                for doctor in (self.doctor, other_doctor):
+                    self.slots += 1
+                    day = date.today() + timedelta(days=self.slots // 16 - 30)
+                    minute = 8 * 60 + (self.slots % 16) * 30
+                    done = day < date.today()
+                    appointment = Appointment.objects.create(
+                        patient=patient, doctor=doctor, consultation_type='F2F', consultation_date=day,
+                        consultation_time=time(minute // 60, minute % 60), approval_status='Approved',
+                        status='Completed' if done else 'Scheduled',
+                    )
+                    if done:
+                        live = LiveAppointment.objects.create(
+                            appointment=appointment, status='completed',
+                            started_at=timezone.now(), completed_at=timezone.now(),
+                        )
+                        Prescription.objects.create(live_appointment=live, doctor=doctor,
+                                                    medicines=[{'name': 'Paracetamol', 'dosage': '500mg'}])
+                LabResult.objects.create(user=patient, lab_type='CBC', result_file='UERG', file_type='application/pdf',
+                                         file_name='cbc.pdf', uploaded_by=self.doctor.user)
+                Notification.objects.create(user=patient, title='Hello', message='m', notification_type='system')
+                BookedService.objects.create(user=patient, service_name='CBC', booking_date=date.today(),
+                                             booking_time=time(9))
+
+    def _url_kwargs(self):
+        appointment = Appointment.objects.filter(patient=self.patient, doctor=self.doctor).order_by('pk').first()
+        live = LiveAppointment.objects.filter(appointment__patient=self.patient, appointment__doctor=self.doctor).first()
+        return {
+            'consultation_id': appointment.pk,
+            'appointment_id': appointment.pk,
+            'doctor_id': self.doctor.pk,
+            'patient_id': self.patient.pk,
+            'user_id': self.patient.pk,
+            'result_id': LabResult.objects.filter(user=self.patient).first().pk,
+            'notification_id': Notification.objects.filter(user=self.patient).first().pk,
+            'prescription_id': Prescription.objects.filter(live_appointment=live).first().pk,
+            'live_session_id': live.pk,
+            'job_id': 'none',
+        }
+
+    def _login(self, role):
+        self.client.logout()
+        if role == 'anonymous':
+            return
+        user = {'patient': self.patient, 'doctor': self.doctor.user, 'admin': self.admin}[role]
+        self.client.force_login(user)
+        session = self.client.session
+        session['user'] = session['user_id'] = user.user_id
+        session['role'] = user.role
+        if role == 'admin':
+            session['is_admin'] = True
+        session.save()
+
+    def _measure(self):
+        """{(role, url name): (queries, status)}; views run in a rolled back
+        transaction so ones that change data on GET see the same rows each time."""
+        kwargs = self._url_kwargs()
+        counts = {}
+        for role in ('anonymous', 'patient', 'doctor', 'admin'):
+            self._login(role)
+            for pattern in _named_patterns(get_resolver('myapp.urls').url_patterns):
+                if pattern.name in self.SKIP:
+                    continue
+                url = reverse(pattern.name, kwargs={name: kwargs[name] for name in pattern.pattern.converters})
+                for _ in range(2):  # the first request warms caches
+                    with transaction.atomic():
+                        with CaptureQueriesContext(connection) as queries:
+                            status = self.client.get(url).status_code
+                        transaction.set_rollback(True)
+                counts[(role, pattern.name)] = (len(queries), status)
+        return counts
+
+    def test_query_counts_are_bounded_and_do_not_grow(self):
+        self._grow(self.SMALL)
+        small = self._measure()
+        self._grow(self.LARGE - self.SMALL)
+        large = self._measure()
+
+        problems = []
+        for (role, name), (count, status) in sorted(large.items()):
+            ceiling = self.CEILINGS.get(name, self.DEFAULT_CEILING)
+            if status >= 500:
+                problems.append(f'{role} {name}: status {status}')
+            if count > small[role, name][0]:
+                problems.append(f'{role} {name}: {small[role, name][0]} -> {count} queries with 10x data')
+            if count > ceiling:
+                problems.append(f'{role} {name}: {count} queries, ceiling {ceiling}')
+        self.assertEqual(problems, [])
+
+
+class SeedLoadDataTests(TestCase):
+    def test_seeds_with_longest_prefix(self):
+        call_command('seed_load_data', '--patients', '20', '--doctors', '2', '--prefix', 'abcdefghijk', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='abcdefghijk_p').count(), 20)
+        numbers = list(LiveAppointment.objects.values_list('live_appointment_number', flat=True))
+        self.assertTrue(numbers)
+        self.assertTrue(all(len(number) <= 20 for number in numbers), numbers)
+
+    def test_rejects_prefix_too_long_for_live_numbers(self):
+        with self.assertRaisesMessage(CommandError, '--prefix must be 1 to 11 characters long'):
+            call_command('seed_load_data', '--patients', '1', '--prefix', 'abcdefghijkl', stdout=StringIO())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class LoadTestHarnessTests(LiveServerTestCase):
+    def test_every_journey_runs_without_errors(self):
+        doctor = _make_doctor('ldoc')
+        patient = _make_patient('lpat')
+        User.objects.create(username='ladmin', email='ladmin@example.com', role='admin', password='x')
+        appointment = _book(patient, doctor, date.today() + timedelta(days=3), time(9, 0))
+        # One role at a time: the live server shares the test database connection
+        for user in (
+            {'role': 'patient', 'username': 'lpat', 'password': 'x'},
+            {'role': 'doctor', 'username': 'ldoc', 'password': 'x', 'appointments': [appointment.pk]},
+            {'role': 'admin', 'username': 'ladmin', 'password': 'x'},
+        ):
+            result = run_load_test(self.live_server_url, [user], duration=0.5, think=0, polls=1)
+            self.assertGreater(result['total']['requests'], 1, user['role'])
+            self.assertEqual(result['total']['errors'], 0, result['endpoints'])
+            self.assertEqual(result['total']['failures'], 0, result['endpoints'])
+        self.assertTrue(appointment.live_session.prescriptions.exists())
+
+
+class BenchmarkTests(TestCase):
+    def test_every_benchmark_runs(self):
+        results = benchmarks.run(rounds=2, min_time=0)
+        self.assertEqual(len(results), sum(len(cases) for _, cases in benchmarks.BENCHMARKS.values()))
+        self.assertTrue(all(stats['median'] > 0 for stats in results.values()))
+
+    def test_compare_flags_slower_medians_only(self):
+        baseline = {'fast[1]': {'median': 1.0}, 'slow[1]': {'median': 1.0}}
+        results = {'fast[1]': {'median': 1.2}, 'slow[1]': {'median': 1.5}, 'new[1]': {'median': 9.0}}
+        self.assertEqual([key for key, *_ in benchmarks.compare(results, baseline, 0.25)], ['slow[1]'])
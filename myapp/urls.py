@@ -34,5 +34,8 @@ urlpatterns = [
     # Admin feature (admin/employee panels)
     path('', include('myapp.features.admin.urls')),
     
+    # Monitoring feature (Prometheus /metrics)
+    path('', include('myapp.features.monitoring.urls')),
+    
     # Legacy API endpoints removed - use feature-specific endpoints instead
 ]
\ No newline at end of file
@@ -1,43 +1,14 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.utils import timezone
-from django.core.cache import cache
 
-CACHE_KEY = 'site_recent_activity_events'
-MAX_EVENTS = 200
+from .activity_store import push_event
 
 
 def _push_event(event: dict):
-    events = cache.get(CACHE_KEY, [])
-    try:
-        # Deduplicate recent identical events: if the newest event is the same
-        # type/action/summary and occurred within 2 seconds, skip adding it.
-        if events:
-            first = events[0]
-            t1 = first.get('type')
-            a1 = first.get('action')
-            s1 = first.get('summary')
-            d1 = first.get('date')
-            t2 = event.get('type')
-            a2 = event.get('action')
-            s2 = event.get('summary')
-            d2 = event.get('date')
-            if t1 == t2 and a1 == a2 and s1 == s2 and d1 and d2:
-                try:
-                    # total_seconds comparison; may raise if types unexpected
-                    if abs((d1 - d2).total_seconds()) < 2:
-                        return
-                except Exception:
-                    pass
-    except Exception:
-        # be defensive: if anything goes wrong with dedupe logic, continue
-        pass
-
-    events.insert(0, event)
-    # trim
-    if len(events) > MAX_EVENTS:
-        events = events[:MAX_EVENTS]
-    cache.set(CACHE_KEY, events, None)
+    # Deduplication (same type/action/summary within a couple of seconds)
+    # and bounding the buffer are handled atomically by the activity store.
+    push_event(event)
 
 
 @receiver(user_logged_in)
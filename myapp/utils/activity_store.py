@@ -0,0 +1,150 @@
+"""
+Append-only ring buffer for site activity events (logins, logouts, ...).
+
+Two backends share the same small API (push / read / clear / prune):
+
+- Redis, when settings.REDIS_URL is set and the `redis` package is
+  installed. Events are LPUSH'ed onto a list and LTRIM'ed to MAX_EVENTS in
+  one pipeline, so concurrent writers never lose events.
+- The `activity_events` table otherwise. Inserts are single-row and the
+  table is bounded by the `prune_activity_events` command, which runs in
+  the release step (Procfile) and should also be scheduled daily.
+
+Duplicate events (same type/action/summary within DEDUPE_SECONDS) are
+dropped using a keyed short-TTL marker instead of comparing against the
+stored list.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from myapp.models import ActivityEvent
+
+MAX_EVENTS = 200
+DEDUPE_SECONDS = 2
+LIST_KEY = 'site_activity_events'
+SEQ_KEY = 'site_activity_events:seq'
+DEDUPE_KEY = 'site_activity_dedupe:{}'
+
+
+def _dedupe_key(event):
+    raw = '|'.join(str(event.get(k) or '') for k in ('type', 'action', 'summary'))
+    return DEDUPE_KEY.format(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+class RedisActivityStore:
+    def __init__(self, url):
+        import redis  # ~70ms to import; only loaded when REDIS_URL is set
+        self.client = redis.Redis.from_url(url)
+
+    def push(self, event):
+        if not self.client.set(_dedupe_key(event), 1, nx=True, ex=DEDUPE_SECONDS):
+            return False
+        event = dict(event, id=self.client.incr(SEQ_KEY))
+        pipe = self.client.pipeline()
+        pipe.lpush(LIST_KEY, json.dumps(event, cls=DjangoJSONEncoder))
+        pipe.ltrim(LIST_KEY, 0, MAX_EVENTS - 1)
+        pipe.execute()
+        return True
+
+    def read(self, cursor=None, limit=20):
+        events = []
+        for raw in self.client.lrange(LIST_KEY, 0, MAX_EVENTS - 1):
+            event = json.loads(raw)
+            if cursor is not None and event['id'] >= cursor:
+                continue
+            event['date'] = parse_datetime(event['date']) if event.get('date') else None
+            events.append(event)
+            if len(events) >= limit:
+                break
+        return events
+
+    def clear(self):
+        self.client.delete(LIST_KEY)
+
+    def prune(self, keep=MAX_EVENTS):
+        # LTRIM already bounds the list on every push
+        self.client.ltrim(LIST_KEY, 0, keep - 1)
+        return 0
+
+
+class DatabaseActivityStore:
+    def push(self, event):
+        if not cache.add(_dedupe_key(event), 1, DEDUPE_SECONDS):
+            return False
+        ActivityEvent.objects.create(
+            event_type=event.get('type') or '',
+            action=event.get('action') or '',
+            summary=(event.get('summary') or '')[:255],
+            detail=(event.get('detail') or '')[:255],
+            link=event.get('link') or '',
+            created_at=event.get('date') or timezone.now(),
+        )
+        return True
+
+    def read(self, cursor=None, limit=20):
+        qs = ActivityEvent.objects.order_by('-event_id')
+        if cursor is not None:
+            qs = qs.filter(event_id__lt=cursor)
+        return [
+            {
+                'id': ev.event_id,
+                'type': ev.event_type,
+                'action': ev.action,
+                'summary': ev.summary,
+                'detail': ev.detail,
+                'link': ev.link,
+                'date': ev.created_at,
+            }
+            for ev in qs[:limit]
+        ]
+
+    def clear(self):
+        ActivityEvent.objects.all().delete()
+
+    def prune(self, keep=MAX_EVENTS):
+        """Delete everything older than the newest `keep` events."""
+        boundary = ActivityEvent.objects.order_by('-event_id').values_list('event_id', flat=True)[keep:keep + 1]
+        boundary = list(boundary)
+        if not boundary:
+            return 0
+        deleted, _ = ActivityEvent.objects.filter(event_id__lte=boundary[0]).delete()
+        return deleted
+
+
+_store = None
+
+
+def get_activity_store():
+    global _store
+    if _store is None:
+        url = getattr(settings, 'REDIS_URL', '')
+        _store = None
+        if url:
+            try:
+                _store = RedisActivityStore(url)
+            except ImportError:  # optional dependency
+                pass
+        if _store is None:
+            _store = DatabaseActivityStore()
+    return _store
+
+
+def push_event(event):
+    """Append an event; returns False when it was dropped as a duplicate."""
+    return get_activity_store().push(event)
+
+
+def read_events(cursor=None, limit=20):
+    """Return up to `limit` events newer-first, older than `cursor` (an event id)."""
+    return get_activity_store().read(cursor=cursor, limit=limit)
+
+
+def clear_events():
+    get_activity_store().clear()
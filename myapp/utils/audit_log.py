@@ -0,0 +1,239 @@
+"""
+Buffered writer for the append-only audit log (AuditLog model).
+
+Views call `log_action(request, ...)`; entries are queued in-process and
+written with a single bulk_create once AUDIT_LOG_BATCH_SIZE entries are
+queued or AUDIT_LOG_FLUSH_SECONDS have passed (checked by a background
+thread), and on interpreter exit. A flush triggered inside the caller's
+transaction waits for it to commit, so queued entries from other requests
+are never written, or rolled back, as part of an unrelated transaction.
+Readers call `recent_entries()`, which flushes this process's queue first
+(after commit, likewise) so the dashboard sees its own writes.
+Entries whose actor has been deleted meanwhile keep the actor only in their
+label. If the database is unavailable the batch goes back on the queue (up
+to MAX_QUEUED entries); if the insert fails otherwise, entries are written
+one at a time, so one bad entry loses only itself.
+
+Creations of appointments, lab results and booked services are recorded
+through post_save signals so every booking/upload path is covered, once
+their transaction commits.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from myapp.models import AuditLog, Appointment, LabResult, BookedService, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LINKS = {
+    'Appointment': 'mod_consultations',
+    'LabResult': 'mod_records',
+    'ServiceBooking': 'mod_records',
+    'Patient': 'mod_records',
+    'Prescription': 'mod_records',
+    'Notification': 'mod_records',
+    'Doctor': 'mod_doctors',
+}
+
+
+# Entries kept queued while the database is unavailable; the oldest go first
+MAX_QUEUED = 10000
+
+
+class BufferedAuditWriter:
+    def __init__(self, batch_size=50, flush_interval=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._thread = None
+
+    def add(self, entry):
+        with self._lock:
+            self._buffer.append(entry)
+            due = len(self._buffer) >= self.batch_size or (
+                self.flush_interval > 0
+                and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        self._start_timer()
+        if due:
+            self.flush_after_commit()
+
+    def flush_after_commit(self):
+        if connection.in_atomic_block:
+            transaction.on_commit(self.flush)
+        else:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not batch:
+            return 0
+        try:
+            self._detach_deleted_actors(batch)
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(batch, batch_size=self.batch_size)
+        except OperationalError:
+            with self._lock:
+                self._buffer[:0] = batch
+                dropped = len(self._buffer) - MAX_QUEUED
+                if dropped > 0:
+                    del self._buffer[:dropped]
+            logger.warning("Audit log unavailable; %d entries stay queued", len(batch), exc_info=True)
+            if dropped > 0:
+                logger.error("Dropped %d queued audit log entries", dropped)
+            return 0
+        except Exception:
+            logger.warning("Failed to write %d audit log entries at once; writing them one by one",
+                           len(batch), exc_info=True)
+            return self._write_each(batch)
+        return len(batch)
+
+    @staticmethod
+    def _detach_deleted_actors(batch):
+        actor_ids = {entry.actor_id for entry in batch if entry.actor_id}
+        if not actor_ids:
+            return
+        existing = set(User.objects.filter(user_id__in=actor_ids).values_list('user_id', flat=True))
+        for entry in batch:
+            if entry.actor_id and entry.actor_id not in existing:
+                entry.actor_label = (entry.actor_label or f"User #{entry.actor_id} (deleted)")[:100]
+                entry.actor_id = None
+
+    @staticmethod
+    def _write_each(batch):
+        written = 0
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+                written += 1
+            except Exception:
+                logger.exception("Failed to write audit log entry %s %s#%s",
+                                 entry.action, entry.target_type, entry.target_id)
+        return written
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _start_timer(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                if self.pending():
+                    self.flush()
+            finally:
+                # The timer thread owns its own DB connection
+                connection.close()
+
+
+writer = BufferedAuditWriter(
+    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 50),
+    flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', 5.0),
+)
+atexit.register(writer.flush)
+
+
+def _resolve_actor(request):
+    """Return (actor_id, actor_label) for the user behind `request`."""
+    if request is None:
+        return None, 'System'
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and getattr(user, 'user_id', None):
+        return user.user_id, user.username
+    session = getattr(request, 'session', {})
+    user_id = session.get('user_id') or session.get('user')
+    try:
+        user_id = int(user_id) if user_id else None
+    except (TypeError, ValueError):
+        user_id = None
+    if user_id:
+        return user_id, ''
+    if session.get('is_admin'):
+        return None, 'Administrator'
+    return None, 'Anonymous'
+
+
+def log_action(request, action, target_type, target_id='', summary='', detail='', link=None):
+    """Queue an audit entry; never raises into the calling view."""
+    try:
+        actor_id, actor_label = _resolve_actor(request)
+        writer.add(AuditLog(
+            actor_id=actor_id,
+            actor_label=actor_label[:100],
+            action=action,
+            target_type=target_type,
+            target_id=str(target_id or ''),
+            summary=(summary or f"{target_type} {action}")[:255],
+            detail=detail or '',
+            link=link or DEFAULT_LINKS.get(target_type, ''),
+        ))
+    except Exception:
+        logger.exception("Failed to queue audit log entry")
+
+
+def flush_audit_log():
+    return writer.flush()
+
+
+def recent_entries(limit=20, since=None, actor_id=None):
+    """Newest audit entries, optionally filtered by time range start and actor."""
+    writer.flush_after_commit()
+    qs = AuditLog.objects.order_by('-created_at')
+    if since is not None:
+        qs = qs.filter(created_at__gte=since)
+    if actor_id is not None:
+        qs = qs.filter(actor_id=actor_id)
+    return list(qs[:limit])
+
+
+@receiver(post_save, sender=Appointment)
+def on_appointment_created(sender, instance, created, **kwargs):
+    if created:
+        # Booking can still roll back on a slot conflict
+        transaction.on_commit(lambda: log_action(
+            None, 'create', 'Appointment', instance.consultation_id,
+            summary=f"Appointment booked for {instance.consultation_date}",
+            detail=instance.consultation_type,
+        ))
+
+
+@receiver(post_save, sender=LabResult)
+def on_lab_result_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: log_action(
+            None, 'create', 'LabResult', instance.lab_result_id,
+            summary=f"Lab: {instance.lab_type}",
+            detail=instance.file_name,
+        ))
+
+
+@receiver(post_save, sender=BookedService)
+def on_booked_service_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: log_action(
+            None, 'create', 'ServiceBooking', instance.booking_id,
+            summary=f"Service: {instance.service_name}",
+            detail=instance.status,
+        ))
@@ -0,0 +1,195 @@
+"""
+Slot availability engine built on `Doctor.availability`.
+
+A doctor's weekly schedule (the `availability` JSON set in mod_doctors,
+either {"days", "start", "end"} or {"schedules": [{"days", "start",
+"end"}, ...]}) is expanded into fixed SLOT_MINUTES slots for each date in a
+range. Booked appointments are subtracted using their `duration_minutes`.
+
+Booked time is kept as one integer bitmap per doctor per day (bit i set =
+slot i of the day is taken), cached under
+`doctor_slots:{doctor_id}:{version}:{date}`. A range query for any number
+of doctors is one cache.get_many plus, for the missing days only, a single
+Appointment query. Saving or deleting an appointment bumps its doctor's
+CacheVersion (myapp.utils.cache_versions) in the same transaction, so every
+worker stops using that doctor's bitmaps within CACHE_VERSION_TTL seconds.
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from myapp.models import Appointment
+from .cache_versions import bump, get_versions
+from .doctor_directory import get_doctor_cards
+from .metrics import record_cache
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_VERSION = 'doctor_slots:{}'
+BITMAP_CACHE_KEY = 'doctor_slots:{}:{}:{}'
+BITMAP_TIMEOUT = 60 * 60 * 24
+MAX_RANGE_DAYS = 62
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(str(value), fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def _slot_index(value):
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def _slot_time(index):
+    minutes = index * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def weekly_masks(availability):
+    """Turn an availability blob into {weekday (0=Mon): bitmap of open slots}."""
+    availability = availability or {}
+    schedules = availability.get('schedules')
+    if schedules is None:
+        schedules = [availability]
+
+    masks = {}
+    for schedule in schedules:
+        start = _parse_time(schedule.get('start'))
+        end = _parse_time(schedule.get('end'))
+        if not start or not end or end <= start:
+            continue
+        # Only whole slots that fit inside [start, end)
+        first = -(-(start.hour * 60 + start.minute) // SLOT_MINUTES)
+        last = (end.hour * 60 + end.minute) // SLOT_MINUTES
+        if last <= first:
+            continue
+        mask = ((1 << (last - first)) - 1) << first
+        for day in schedule.get('days') or []:
+            day = str(day).strip().lower()
+            if day in WEEKDAYS:
+                weekday = WEEKDAYS.index(day)
+                masks[weekday] = masks.get(weekday, 0) | mask
+    return masks
+
+
+def appointment_mask(start_time, duration_minutes):
+    """Bitmap of the slots covered by an appointment starting at `start_time`."""
+    start = start_time.hour * 60 + start_time.minute
+    end = min(start + max(duration_minutes or SLOT_MINUTES, 1), 24 * 60)
+    first = start // SLOT_MINUTES
+    last = -(-end // SLOT_MINUTES)
+    return ((1 << (last - first)) - 1) << first
+
+
+def blocking_appointments():
+    """Appointments that occupy their doctor's time."""
+    return Appointment.objects.exclude(status='Cancelled').exclude(approval_status='Rejected')
+
+
+def _daterange(start, end):
+    for offset in range((end - start).days + 1):
+        yield start + timedelta(days=offset)
+
+
+def booked_bitmaps(doctor_ids, start, end):
+    """Return {(doctor_id, date): bitmap of booked slots} for the range."""
+    days = list(_daterange(start, end))
+    names = {doctor_id: BITMAP_VERSION.format(doctor_id) for doctor_id in doctor_ids}
+    versions = get_versions(list(names.values()))
+    keys = {
+        BITMAP_CACHE_KEY.format(doctor_id, versions[names[doctor_id]], day.isoformat()): (doctor_id, day)
+        for doctor_id in doctor_ids
+        for day in days
+    }
+    key_of = {pair: key for key, pair in keys.items()}
+    cached = cache.get_many(keys)
+    bitmaps = {keys[key]: value for key, value in cached.items()}
+
+    missing = [pair for key, pair in keys.items() if key not in cached]
+    record_cache('doctor_slots', hits=len(cached), misses=len(missing))
+    if missing:
+        missing_doctors = {doctor_id for doctor_id, _ in missing}
+        missing_days = [day for _, day in missing]
+        fresh = {pair: 0 for pair in missing}
+        rows = blocking_appointments().filter(
+            doctor_id__in=missing_doctors,
+            consultation_date__gte=min(missing_days),
+            consultation_date__lte=max(missing_days),
+        ).values_list('doctor_id', 'consultation_date', 'consultation_time', 'duration_minutes')
+        for doctor_id, day, start_time, duration in rows:
+            if (doctor_id, day) in fresh:
+                fresh[(doctor_id, day)] |= appointment_mask(start_time, duration)
+        cache.set_many({key_of[pair]: mask for pair, mask in fresh.items()}, BITMAP_TIMEOUT)
+        bitmaps.update(fresh)
+    return bitmaps
+
+
+def free_slots(start, end, doctor_ids=None):
+    """Free slot start times per doctor per day.
+
+    Returns {doctor_id: {'YYYY-MM-DD': ['09:00', '09:30', ...]}} covering
+    every doctor in the directory (or just `doctor_ids`). Slots that have
+    already started today are not offered.
+    """
+    cards = get_doctor_cards()
+    if doctor_ids is not None:
+        wanted = set(doctor_ids)
+        cards = [card for card in cards if card['doctor_id'] in wanted]
+    schedules = {card['doctor_id']: weekly_masks(card['availability']) for card in cards}
+    booked = booked_bitmaps(list(schedules), start, end)
+
+    now = timezone.localtime()
+    today = now.date()
+    # Slots starting before "now" are gone
+    past_today = (1 << (-(-(now.hour * 60 + now.minute) // SLOT_MINUTES))) - 1
+
+    result = {}
+    for doctor_id, masks in schedules.items():
+        days = {}
+        for day in _daterange(start, end):
+            if day < today:
+                continue
+            free = masks.get(day.weekday(), 0) & ~booked.get((doctor_id, day), 0)
+            if day == today:
+                free &= ~past_today
+            days[day.isoformat()] = [_slot_time(i) for i in range(SLOTS_PER_DAY) if free >> i & 1]
+        result[doctor_id] = days
+    return result
+
+
+def invalidate_doctor(doctor_id):
+    if doctor_id:
+        bump(BITMAP_VERSION.format(doctor_id))
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_doctor(sender, instance, **kwargs):
+    # Lets post_save also invalidate the old doctor when an appointment is
+    # reassigned. Read through __dict__ so deferred fields don't trigger a query.
+    instance._slot_origin = instance.__dict__.get('doctor_id')
+
+
+@receiver(post_save, sender=Appointment)
+def on_appointment_saved(sender, instance, **kwargs):
+    origin = getattr(instance, '_slot_origin', None)
+    if origin and origin != instance.doctor_id:
+        invalidate_doctor(origin)
+    invalidate_doctor(instance.doctor_id)
+    instance._slot_origin = instance.doctor_id
+
+
+@receiver(post_delete, sender=Appointment)
+def on_appointment_deleted(sender, instance, **kwargs):
+    invalidate_doctor(instance.doctor_id)
@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks for the CPU-bound helpers that run on request paths.
+
+Each benchmark is a setup function registered with @benchmark(name, cases).
+For every case it builds fixed inputs and returns the zero-argument callable
+to time, so input construction is never measured. Results are keyed
+"<name>[<case>]".
+
+Timing follows timeit: the loop count is raised until one round takes at
+least `min_time` seconds, then `rounds` rounds are run. Per-call statistics
+are kept (min, median, mean, stddev, ops/s). Regressions compare medians
+against a stored baseline file (see `manage.py bench`).
+
+Inputs are unsaved model instances and in-memory data, so no benchmark
+touches the database.
+"""
+
+import json
+import statistics
+import time
+from datetime import date
+
+BENCHMARKS = {}
+
+DEFAULT_THRESHOLD = 0.25  # fail when the median is more than 25% slower
+
+
+def benchmark(name, cases):
+    """Register `setup(case) -> callable` to be timed for each of `cases`."""
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, tuple(cases))
+        return setup
+    return decorator
+
+
+def _medicines(count):
+    names = ['Paracetamol', 'Amoxicillin', 'Losartan', 'Metformin', 'Cetirizine', 'Omeprazole']
+    return [
+        {'name': f'{names[i % len(names)]} {i}', 'dosage': '500mg', 'frequency': 'Every 8 hours',
+         'duration': '7 days'}
+        for i in range(count)
+    ]
+
+
+def _prescription(medicines):
+    from myapp.models import Appointment, Doctor, LiveAppointment, Prescription, User
+
+    patient = User(username='bench_patient', role='patient')
+    doctor = Doctor(user=User(username='bench_doctor', role='doctor'), specialization='General Medicine')
+    appointment = Appointment(patient=patient, doctor=doctor, consultation_date=date(2025, 1, 6))
+    return Prescription(
+        live_appointment=LiveAppointment(appointment=appointment),
+        prescription_number='RXBENCH01',
+        medicines=medicines,
+        instructions='Take after meals. ' * 4,
+    )
+
+
+@benchmark('analytics.calculate_stats', cases=(10, 100, 1000))
+def _calculate_stats(size):
+    from myapp.features.admin.analytics_views import calculate_stats
+
+    values = [(i * 37) % 101 for i in range(size)]
+    return lambda: calculate_stats(values)
+
+
+@benchmark('analytics.generate_caption', cases=('roles', 'counts'))
+def _generate_caption(case):
+    from myapp.features.admin.analytics_views import calculate_stats, generate_caption
+
+    if case == 'roles':
+        roles = {'admin': 3, 'doctor': 40, 'nurse': 12, 'lab_tech': 5, 'patient': 4200}
+        stats = calculate_stats(list(roles.values()))
+        return lambda: generate_caption(stats, 'User Roles', roles)
+    stats = calculate_stats([120, 98, 143, 110, 87, 131])
+    stats.update(total_doctors=6, most_common='Completed')
+    return lambda: generate_caption(stats, 'Monthly Consultations')
+
+
+@benchmark('prescription.medicines_summary', cases=(1, 10, 100))
+def _medicines_summary(size):
+    prescription = _prescription(_medicines(size))
+    return prescription.medicines_summary
+
+
+@benchmark('prescription.pdf', cases=(1, 10, 50))
+def _prescription_pdf(size):
+    from myapp.utils.prescription_pdf import generate_prescription_pdf
+
+    prescription = _prescription(_medicines(size))
+    return lambda: generate_prescription_pdf(prescription)
+
+
+@benchmark('activity.dedupe', cases=(1, 16, 256))
+def _activity_dedupe(distinct):
+    """DatabaseActivityStore.push() dropping duplicates, over a stream cycling
+    through `distinct` events. Every event is marked as recently pushed
+    first, so push() stops at its duplicate check and never writes."""
+    from django.core.cache import cache
+    from myapp.utils.activity_store import DatabaseActivityStore, _dedupe_key
+
+    store = DatabaseActivityStore()
+    events = [
+        {'type': 'Bench', 'action': 'login', 'summary': f'Bench: user{i}', 'detail': f'user{i}@example.com'}
+        for i in range(distinct)
+    ]
+    cache.set_many({_dedupe_key(event): 1 for event in events}, 3600)
+    position = [0]
+
+    def push():
+        event = events[position[0] % distinct]
+        position[0] += 1
+        return store.push(event)
+    return push
+
+
+def measure(func, rounds=5, min_time=0.05):
+    """Per-call timing statistics of func() in seconds."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 10 ** 7:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    timings = [elapsed / loops]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    median = statistics.median(timings)
+    return {
+        'min': min(timings),
+        'median': median,
+        'mean': statistics.mean(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'ops': 1 / median if median else 0.0,
+        'rounds': len(timings),
+        'loops': loops,
+    }
+
+
+def run(pattern=None, rounds=5, min_time=0.05):
+    """{'name[case]': stats} for every registered benchmark whose key
+    contains `pattern`."""
+    results = {}
+    for name, (setup, cases) in BENCHMARKS.items():
+        for case in cases:
+            key = f'{name}[{case}]'
+            if pattern and pattern not in key:
+                continue
+            results[key] = measure(setup(case), rounds=rounds, min_time=min_time)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """(key, baseline median, current median, ratio) for every benchmark whose
+    median grew by more than `threshold` over the baseline's."""
+    regressions = []
+    for key, stats in results.items():
+        before = baseline.get(key)
+        if not before or not before.get('median'):
+            continue
+        ratio = stats['median'] / before['median']
+        if ratio > 1 + threshold:
+            regressions.append((key, before['median'], stats['median'], ratio))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)['benchmarks']
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as handle:
+        json.dump({'benchmarks': results}, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,354 @@
+"""
+Streaming import of patients and lab results for clinic onboarding.
+
+Input is either a patients CSV or a ZIP holding `patients.csv`, optionally
+`lab_results.csv`, and the lab files that CSV refers to.
+
+patients.csv columns (first_name and last_name required):
+    first_name, last_name, sex (male/female/other), date_of_birth
+    (YYYY-MM-DD), blood_type, allergies, conditions,
+    emergency_contact_name, emergency_contact_phone, external_id
+
+lab_results.csv columns (all but notes required):
+    patient (an external_id from patients.csv, an MRN or a username),
+    lab_type, file (path inside the ZIP), notes
+
+Rows are read and validated one at a time and written in chunks: each chunk
+of patients goes through patient_accounts.create_patients (a few bulk
+inserts in one transaction), each chunk of lab results is one bulk insert
+after its files have been written to storage on a thread pool. Invalid
+rows are skipped and reported with their line number; they never abort
+the import. Memory use depends on the chunk size, not the file size.
+
+`import_file()` is used by the `import_patients` command and, through
+`start_import()`, by the admin upload endpoint. That runs the import on a
+background thread of the web worker and keeps its progress in an ImportJob
+row, so import_status works from any worker. The thread dies with its
+worker (deploys, max_requests, RSS recycling); a running job not updated
+for STALE_SECONDS is reported as 'interrupted'. Run large imports with the
+command instead.
+"""
+
+import csv
+import io
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from myapp.models import User, Patient, LabResult, ImportJob
+from myapp.utils.patient_accounts import create_patients
+
+logger = logging.getLogger(__name__)
+
+PATIENTS_CSV = 'patients.csv'
+LAB_RESULTS_CSV = 'lab_results.csv'
+SEXES = {'male', 'female', 'other'}
+BLOOD_TYPES = {'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'}
+PATIENT_FIELDS = (
+    'first_name', 'last_name', 'sex', 'date_of_birth', 'blood_type', 'allergies',
+    'conditions', 'emergency_contact_name', 'emergency_contact_phone',
+)
+MAX_REPORTED_ERRORS = 1000
+# Running jobs publish at most every PUBLISH_SECONDS; one silent for
+# STALE_SECONDS lost its thread. Jobs are kept for KEEP_DAYS.
+PUBLISH_SECONDS = 1
+STALE_SECONDS = 5 * 60
+KEEP_DAYS = 7
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    """Counts, throughput and per-row errors of one import."""
+
+    def __init__(self, on_progress=None):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.patients = 0
+        self.lab_results = 0
+        self.error_count = 0
+        self.errors = []  # (file, line, message), the first MAX_REPORTED_ERRORS
+        self.state = 'running'
+        self.on_progress = on_progress
+
+    def error(self, source, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((source, line, str(message)))
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rate(self, count):
+        return count / self.elapsed if self.elapsed else float(count)
+
+    def progress(self):
+        if self.on_progress:
+            self.on_progress(self)
+
+    def as_dict(self):
+        return {
+            'state': self.state,
+            'patients': self.patients,
+            'lab_results': self.lab_results,
+            'errors': self.error_count,
+            'error_rows': [{'file': f, 'line': line, 'error': msg} for f, line, msg in self.errors],
+            'seconds': round(self.elapsed, 1),
+            'patients_per_second': round(self.rate(self.patients), 1),
+            'lab_results_per_second': round(self.rate(self.lab_results), 1),
+        }
+
+
+def _clean(row):
+    return {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def validate_patient(row):
+    """Normalised create_patients() row, or RowError."""
+    row = _clean(row)
+    if not row.get('first_name') or not row.get('last_name'):
+        raise RowError('first_name and last_name are required')
+    sex = row.get('sex', '').lower()
+    if sex and sex not in SEXES:
+        raise RowError(f"sex must be one of {', '.join(sorted(SEXES))}")
+    if row.get('date_of_birth'):
+        try:
+            date.fromisoformat(row['date_of_birth'])
+        except ValueError:
+            raise RowError('date_of_birth must be YYYY-MM-DD')
+    blood_type = row.get('blood_type', '').upper()
+    if blood_type and blood_type not in BLOOD_TYPES:
+        raise RowError(f"unknown blood_type {row['blood_type']!r}")
+    cleaned = {field: row.get(field, '') for field in PATIENT_FIELDS}
+    cleaned.update(sex=sex, blood_type=blood_type)
+    return cleaned, row.get('external_id', '')
+
+
+def validate_lab_result(row):
+    row = _clean(row)
+    missing = [field for field in ('patient', 'lab_type', 'file') if not row.get(field)]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    return row
+
+
+def _read_csv(handle):
+    """Yield (line number, row dict) from a binary CSV stream."""
+    reader = csv.DictReader(io.TextIOWrapper(handle, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Importer:
+    def __init__(self, report, client=None, uploaded_by=None, chunk_size=1000, workers=8,
+                 set_passwords=True, dry_run=False):
+        self.report = report
+        self.client = client
+        self.uploaded_by = uploaded_by
+        self.chunk_size = max(chunk_size, 1)
+        self.workers = max(workers, 1)
+        self.set_passwords = set_passwords
+        self.dry_run = dry_run
+        self.external_ids = {}  # external_id -> user_id, for lab_results.csv
+
+    def _valid_patients(self, handle):
+        for line, row in _read_csv(handle):
+            try:
+                yield line, validate_patient(row)
+            except RowError as exc:
+                self.report.error(PATIENTS_CSV, line, exc)
+
+    def import_patients(self, handle):
+        for chunk in _chunks(self._valid_patients(handle), self.chunk_size):
+            if self.dry_run:
+                self.external_ids.update((external_id, None) for _, (_, external_id) in chunk if external_id)
+            else:
+                rows = [row for _, (row, _) in chunk]
+                try:
+                    created = create_patients(rows, client=self.client, workers=self.workers,
+                                              set_passwords=self.set_passwords)
+                except IntegrityError as exc:
+                    # The chunk was rolled back as a whole
+                    for line, _ in chunk:
+                        self.report.error(PATIENTS_CSV, line, f"not imported: {exc}")
+                    self.report.progress()
+                    continue
+                for (_, (_, external_id)), (user, _, _) in zip(chunk, created):
+                    if external_id:
+                        self.external_ids[external_id] = user.user_id
+            self.report.patients += len(chunk)
+            self.report.progress()
+
+    def _resolve(self, references):
+        """Map patient references (external id, MRN or username) to user ids."""
+        resolved = {ref: self.external_ids[ref] for ref in references if ref in self.external_ids}
+        rest = [ref for ref in references if ref not in resolved]
+        if rest:
+            resolved.update(Patient.objects.filter(medical_record_number__in=rest)
+                            .values_list('medical_record_number', 'user_id'))
+            rest = [ref for ref in rest if ref not in resolved]
+        if rest:
+            resolved.update(User.objects.filter(username__in=rest, role='patient')
+                            .values_list('username', 'user_id'))
+        return resolved
+
+    def _store(self, item):
+        name, content = item
+        path = f"{LabResult.STORAGE_DIR}/{uuid.uuid4().hex}/{get_valid_filename(os.path.basename(name)) or 'result'}"
+        return default_storage.save(path, ContentFile(content))
+
+    def import_lab_results(self, handle, archive, pool):
+        rows = []
+        for line, row in _read_csv(handle):
+            try:
+                rows.append((line, validate_lab_result(row)))
+            except RowError as exc:
+                self.report.error(LAB_RESULTS_CSV, line, exc)
+                continue
+            if len(rows) >= self.chunk_size:
+                self._lab_chunk(rows, archive, pool)
+                rows = []
+        if rows:
+            self._lab_chunk(rows, archive, pool)
+
+    def _lab_chunk(self, rows, archive, pool):
+        user_ids = self._resolve({row['patient'] for _, row in rows})
+        ready = []
+        for line, row in rows:
+            if row['patient'] not in user_ids:
+                self.report.error(LAB_RESULTS_CSV, line, f"unknown patient {row['patient']!r}")
+                continue
+            try:
+                content = archive.read(row['file'])
+            except KeyError:
+                self.report.error(LAB_RESULTS_CSV, line, f"file {row['file']!r} not in the archive")
+                continue
+            ready.append((row, user_ids[row['patient']], content))
+
+        if not self.dry_run and ready:
+            names = list(pool.map(self._store, [(row['file'], content) for row, _, content in ready]))
+            try:
+                with transaction.atomic():
+                    LabResult.objects.bulk_create([
+                        LabResult(
+                            user_id=user_id,
+                            lab_type=row['lab_type'][:100],
+                            result_file=name,
+                            file_type=_content_type(row['file']),
+                            file_name=os.path.basename(row['file'])[:255],
+                            uploaded_by=self.uploaded_by,
+                            notes=row.get('notes') or None,
+                        )
+                        for (row, user_id, _), name in zip(ready, names)
+                    ])
+            except Exception:
+                for name in names:
+                    default_storage.delete(name)
+                raise
+        self.report.lab_results += len(ready)
+        self.report.progress()
+
+
+def _content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def import_file(path, report=None, **options):
+    """Import a patients CSV or an onboarding ZIP; returns the ImportReport."""
+    report = report or ImportReport()
+    importer = Importer(report, **options)
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive, ThreadPoolExecutor(max_workers=importer.workers) as pool:
+                names = set(archive.namelist())
+                if PATIENTS_CSV in names:
+                    with archive.open(PATIENTS_CSV) as handle:
+                        importer.import_patients(handle)
+                if LAB_RESULTS_CSV in names:
+                    with archive.open(LAB_RESULTS_CSV) as handle:
+                        importer.import_lab_results(handle, archive, pool)
+                if not names & {PATIENTS_CSV, LAB_RESULTS_CSV}:
+                    report.error(os.path.basename(path), 0, f"ZIP has neither {PATIENTS_CSV} nor {LAB_RESULTS_CSV}")
+        else:
+            with open(path, 'rb') as handle:
+                importer.import_patients(handle)
+        report.state = 'done'
+    except Exception as exc:
+        report.state = 'failed'
+        report.error(os.path.basename(path), 0, f"import stopped: {exc}")
+        logger.exception("Bulk import of %s failed", path)
+    report.finished = time.perf_counter()
+    report.progress()
+    return report
+
+
+def get_progress(job_id):
+    job = ImportJob.objects.filter(job_id=job_id).first()
+    if job is None:
+        return None
+    progress = dict(job.progress, state=job.state)
+    if job.state == 'running' and (timezone.now() - job.updated_at).total_seconds() > STALE_SECONDS:
+        progress['state'] = 'interrupted'
+    return progress
+
+
+def start_import(upload, **options):
+    """Copy an uploaded file to disk and import it on a background thread.
+
+    Returns a job id whose progress get_progress() reports.
+    """
+    job_id = uuid.uuid4().hex
+    suffix = os.path.splitext(upload.name or '')[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        for chunk in upload.chunks():
+            tmp.write(chunk)
+    last_published = [0.0]
+
+    def publish(report):
+        now = time.monotonic()
+        if report.state != 'running' or now - last_published[0] >= PUBLISH_SECONDS:
+            last_published[0] = now
+            ImportJob.objects.filter(job_id=job_id).update(
+                state=report.state, progress=report.as_dict(), updated_at=timezone.now()
+            )
+
+    ImportJob.objects.filter(created_at__lt=timezone.now() - timedelta(days=KEEP_DAYS)).delete()
+    report = ImportReport(on_progress=publish)
+    ImportJob.objects.create(job_id=job_id, file_name=(upload.name or '')[:255], progress=report.as_dict())
+
+    def run():
+        try:
+            import_file(tmp.name, report, **options)
+        finally:
+            os.unlink(tmp.name)
+            connections.close_all()
+
+    threading.Thread(target=run, name=f'bulk-import-{job_id[:8]}', daemon=True).start()
+    return job_id
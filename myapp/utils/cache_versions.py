@@ -0,0 +1,59 @@
+"""
+Cache invalidation that reaches every worker.
+
+Without REDIS_URL each gunicorn worker has its own local-memory cache, so
+deleting a key only clears it in the worker that handled the write. Cached
+groups that must not go stale across workers (the doctor directory, slot
+bitmaps) put a version into their keys instead:
+
+    key = f"doctor_slots:{doctor_id}:{get_versions([name])[name]}:{day}"
+
+`bump(name)` advances the group's CacheVersion row in the writer's
+transaction. Readers take versions from the database, remembered locally
+for CACHE_VERSION_TTL seconds, so other workers switch to fresh keys at
+most that long after the write commits. Old entries are never read again
+and expire on their own.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from myapp.models import CacheVersion
+
+LOCAL_KEY = 'cache_version:{}'
+
+
+def get_versions(names):
+    """{name: version} for `names`, with one query for those not
+    remembered locally (0 for groups never bumped)."""
+    keys = {LOCAL_KEY.format(name): name for name in names}
+    cached = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in cached.items()}
+    missing = [name for key, name in keys.items() if key not in cached]
+    if missing:
+        fresh = dict.fromkeys(missing, 0)
+        fresh.update(CacheVersion.objects.filter(name__in=missing).values_list('name', 'version'))
+        cache.set_many(
+            {LOCAL_KEY.format(name): version for name, version in fresh.items()},
+            getattr(settings, 'CACHE_VERSION_TTL', 5),
+        )
+        versions.update(fresh)
+    return versions
+
+
+def bump(name):
+    """Start a new generation of `name` once the current transaction
+    commits."""
+    if not CacheVersion.objects.filter(name=name).update(version=F('version') + 1):
+        try:
+            with transaction.atomic():
+                CacheVersion.objects.create(name=name, version=1)
+        except IntegrityError:
+            # Created concurrently
+            CacheVersion.objects.filter(name=name).update(version=F('version') + 1)
+    key = LOCAL_KEY.format(name)
+    cache.delete(key)
+    # Forget it again after commit in case a reader remembered the old version
+    transaction.on_commit(lambda: cache.delete(key))
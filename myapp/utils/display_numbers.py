@@ -0,0 +1,92 @@
+"""
+Display numbers (LAP001, APT000123, MRN00000042) from counter rows.
+
+Each series has one DisplayCounter row. `allocate(series)` advances it with
+a single `UPDATE ... SET value = value + 1 RETURNING value`, so handing out
+a number costs one indexed statement no matter how many exist, and two
+concurrent callers can never get the same value: the row lock serialises
+them and each sees the other's increment.
+
+Prefix and minimum width per series come from SERIES, overridable through
+settings.DISPLAY_NUMBER_FORMATS, e.g.
+
+    DISPLAY_NUMBER_FORMATS = {'mrn': {'prefix': 'PT', 'width': 6}}
+
+Numbers that outgrow the width simply get longer (LAP999 -> LAP1000).
+Numbers are not reused when the surrounding transaction rolls back.
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from myapp.models import DisplayCounter
+
+SERIES = {
+    'live_appointment': {'prefix': 'LAP', 'width': 3},
+    'appointment': {'prefix': 'APT', 'width': 6},
+    'mrn': {'prefix': 'MRN', 'width': 8},
+}
+
+
+def get_format(series):
+    fmt = dict(SERIES.get(series, {'prefix': '', 'width': 1}))
+    fmt.update(getattr(settings, 'DISPLAY_NUMBER_FORMATS', {}).get(series, {}))
+    return fmt['prefix'], int(fmt['width'])
+
+
+def format_number(series, value):
+    prefix, width = get_format(series)
+    return f"{prefix}{value:0{width}d}"
+
+
+def _increment(series, count):
+    table = DisplayCounter._meta.db_table
+    if connection.features.can_return_columns_from_insert:
+        # PostgreSQL, and SQLite >= 3.35
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET value = value + %s WHERE name = %s RETURNING value", [count, series]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+    with transaction.atomic():
+        if not DisplayCounter.objects.filter(name=series).update(value=F('value') + count):
+            return None
+        return DisplayCounter.objects.values_list('value', flat=True).get(name=series)
+
+
+def allocate(series, count=1):
+    """Advance `series` by `count` and return the new (highest) value.
+
+    The block last - count + 1 .. last belongs to the caller alone.
+    """
+    value = _increment(series, count)
+    if value is None:
+        # First use of this series
+        try:
+            with transaction.atomic():
+                DisplayCounter.objects.create(name=series, value=0)
+        except IntegrityError:
+            pass  # created concurrently
+        value = _increment(series, count)
+    return value
+
+
+def next_number(series):
+    """Allocate and format the next display number of `series`."""
+    return format_number(series, allocate(series))
+
+
+def next_numbers(series, count):
+    """Allocate `count` consecutive display numbers of `series` at once."""
+    if count <= 0:
+        return []
+    last = allocate(series, count)
+    return [format_number(series, value) for value in range(last - count + 1, last + 1)]
+
+
+def seed(series, value):
+    """Make sure the next number of `series` is above `value` (e.g. after an import)."""
+    DisplayCounter.objects.get_or_create(name=series)
+    DisplayCounter.objects.filter(name=series, value__lt=value).update(value=value)
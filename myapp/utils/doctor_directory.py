@@ -0,0 +1,147 @@
+"""
+Cached doctor directory shared by the public consultations page, guest
+booking and the admin doctor list.
+
+Doctor cards (name, specialization, experience, photo and a few admin
+fields) are built with a single query and cached. Appointment counts are
+cached separately as one {doctor_id: count} map from a single GROUP BY, so
+booking or deleting an appointment only recounts instead of rebuilding the
+whole directory.
+
+Both are keyed by a CacheVersion (myapp.utils.cache_versions): editing a
+doctor bumps the cards' version and an appointment commit bumps the counts'
+version, so every worker, not only the one that saved, drops its copy
+within CACHE_VERSION_TTL seconds.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from myapp.models import User, UserProfile, Doctor, Appointment
+from .cache_versions import bump, get_versions
+from .metrics import record_cache
+
+CARDS_VERSION = 'doctor_directory'
+COUNTS_VERSION = 'doctor_directory:counts'
+CARDS_CACHE_KEY = 'doctor_directory_cards:{}'
+COUNTS_CACHE_KEY = 'doctor_directory_counts:{}'
+CARDS_TIMEOUT = 60 * 10
+
+
+def _build_card(doctor):
+    profile = getattr(doctor.user, 'userprofile', None)
+    photo_url = ''
+    if profile and profile.photo_url:
+        try:
+            photo_url = profile.photo_url.url
+        except Exception:
+            photo_url = str(profile.photo_url)
+    first_name = profile.first_name if profile else ''
+    last_name = profile.last_name if profile else ''
+    return {
+        'doctor_id': doctor.doctor_id,
+        'user_id': doctor.user_id,
+        'user__user_id': doctor.user_id,
+        'user__username': doctor.user.username,
+        'user__role': doctor.user.role,
+        'first_name': first_name,
+        'last_name': last_name,
+        'name': f"{first_name} {last_name}".strip() or doctor.user.username,
+        'specialization': doctor.specialization,
+        'years_of_experience': doctor.years_of_experience,
+        'license_number': doctor.license_number,
+        'contact_info': doctor.contact_info,
+        'availability': doctor.availability or {},
+        'photo_url': photo_url,
+    }
+
+
+def _load_cards():
+    doctors = Doctor.objects.select_related('user', 'user__userprofile').order_by('doctor_id')
+    return [_build_card(doctor) for doctor in doctors]
+
+
+def _load_counts():
+    rows = Appointment.objects.order_by().values('doctor_id').annotate(count=Count('pk')).values_list('doctor_id', 'count')
+    return dict(rows)
+
+
+def get_doctor_cards():
+    """Return the list of doctor cards with current appointment counts.
+
+    Cards are copies, so callers may annotate them freely without touching
+    the cached data.
+    """
+    versions = get_versions([CARDS_VERSION, COUNTS_VERSION])
+    cards_key = CARDS_CACHE_KEY.format(versions[CARDS_VERSION])
+    counts_key = COUNTS_CACHE_KEY.format(versions[COUNTS_VERSION])
+    cached = cache.get_many([cards_key, counts_key])
+
+    cards = cached.get(cards_key)
+    record_cache('doctor_cards', hits=int(cards is not None), misses=int(cards is None))
+    if cards is None:
+        cards = _load_cards()
+        cache.set(cards_key, cards, CARDS_TIMEOUT)
+    counts = cached.get(counts_key)
+    record_cache('doctor_counts', hits=int(counts is not None), misses=int(counts is None))
+    if counts is None:
+        counts = _load_counts()
+        cache.set(counts_key, counts, CARDS_TIMEOUT)
+
+    return [dict(card, appointment_count=counts.get(card['doctor_id'], 0)) for card in cards]
+
+
+def get_doctor_card(doctor_id):
+    """Return a single doctor card, or None if the doctor does not exist."""
+    try:
+        doctor_id = int(doctor_id)
+    except (TypeError, ValueError):
+        return None
+    for card in get_doctor_cards():
+        if card['doctor_id'] == doctor_id:
+            return card
+    return None
+
+
+def invalidate_doctor_directory(counts=False):
+    bump(CARDS_VERSION)
+    if counts:
+        bump(COUNTS_VERSION)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def on_doctor_changed(sender, instance, **kwargs):
+    invalidate_doctor_directory()
+
+
+@receiver(post_save, sender=User)
+def on_doctor_user_changed(sender, instance, update_fields=None, **kwargs):
+    # Cards show the username and role; a last_login update changes neither
+    if update_fields is not None and not {'username', 'role'} & set(update_fields):
+        return
+    if instance.role == 'doctor':
+        invalidate_doctor_directory()
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def on_doctor_profile_changed(sender, instance, **kwargs):
+    if Doctor.objects.filter(user_id=instance.user_id).exists():
+        invalidate_doctor_directory()
+
+
+@receiver(post_save, sender=Appointment)
+def on_appointment_saved(sender, instance, created, **kwargs):
+    if created:
+        # Booking can still roll back on a slot conflict. Once it has
+        # committed, a failed bump is logged rather than failing the booking.
+        transaction.on_commit(lambda: bump(COUNTS_VERSION), robust=True)
+
+
+@receiver(post_delete, sender=Appointment)
+def on_appointment_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump(COUNTS_VERSION), robust=True)
@@ -0,0 +1,99 @@
+"""
+Import-time profile of a cold start, read from `python -X importtime`.
+
+`profile_boot(target)` starts a fresh interpreter that boots like one of:
+
+    wsgi   a gunicorn worker: get_wsgi_application() plus loading the URLconf
+           (and with it every view module), which the first request does
+    setup  a management command: django.setup() only
+
+and returns its wall-clock boot time, resident memory afterwards, the
+modules it imported, and what each import cost. Each import has a `self`
+time (its own module body) and a `cumulative` time (with everything it
+imported first). Run it through `manage.py import_profile`.
+"""
+
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+
+BOOT_SCRIPTS = {
+    'wsgi': (
+        'from django.core.wsgi import get_wsgi_application\n'
+        'application = get_wsgi_application()\n'
+        'from django.urls import get_resolver\n'
+        'get_resolver().url_patterns\n'
+    ),
+    'setup': 'import django\ndjango.setup()\n',
+}
+
+_MEASURE = '''
+import json, sys, time
+started = time.perf_counter()
+{script}
+elapsed = time.perf_counter() - started
+rss_kb = None
+try:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.stdout.write(json.dumps({{'boot_ms': elapsed * 1000, 'rss_kb': rss_kb, 'modules': len(sys.modules)}}))
+'''
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(text):
+    """[(module, depth, self_us, cumulative_us)] from -X importtime output,
+    in the order the imports finished."""
+    imports = []
+    for line in text.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def _boot(target):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _MEASURE.format(script=BOOT_SCRIPTS[target])],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'{target} boot failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def profile_boot(target='wsgi', runs=3):
+    """Boot `target` `runs` times; medians of boot time and RSS, and the
+    import profile of the fastest run."""
+    boots = [_boot(target) for _ in range(runs)]
+    fastest, imports = min(boots, key=lambda boot: boot[0]['boot_ms'])
+    packages = {}
+    for module, _, self_us, _ in imports:
+        top = module.split('.')[0]
+        packages[top] = packages.get(top, 0) + self_us
+    return {
+        'target': target,
+        'runs': runs,
+        'boot_ms': round(statistics.median(boot['boot_ms'] for boot, _ in boots), 1),
+        'rss_kb': int(statistics.median(boot['rss_kb'] or 0 for boot, _ in boots)),
+        'modules': fastest['modules'],
+        'import_ms': round(sum(cumulative for _, depth, _, cumulative in imports if depth == 0) / 1000, 1),
+        'imports': [
+            {'module': module, 'depth': depth, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+            for module, depth, self_us, cumulative_us in imports
+        ],
+        'packages': {top: round(us / 1000, 2) for top, us in sorted(packages.items(), key=lambda item: -item[1])},
+    }
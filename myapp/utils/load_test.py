@@ -0,0 +1,287 @@
+"""
+HTTP load generator with scripted user journeys per role.
+
+Each virtual user (VU) logs in once with its own cookie jar and then repeats
+its role's journey until the run ends, pausing a random 0-2x `think`
+seconds between requests:
+
+    patient  dashboard, lab results, prescriptions, then `polls` polls of
+             the unread-notification endpoint
+    doctor   panel, patient search, then start (or restart), update and
+             complete a live consultation and write its prescription
+    admin    moddashboard, analytics page and API, patient records
+
+Requests are labelled with their URL name. The summary has, per label and
+overall, the request count, throughput, error rate and p50/p95/p99 latency.
+When the server sends the Server-Timing header, the summary also has the
+mean server-side time ("app") and database time ("db") next to the
+client-side latency. Any response that is not 2xx counts as an error. For
+pages this includes the redirect to the home page when a session is lost.
+
+Login is rate limited per IP (see myapp.utils.rate_limit), so start the
+server with RATE_LIMIT_ENABLED=False when running more than a handful of
+VUs. Run it through `manage.py load_test`.
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+import httpx
+from django.urls import reverse
+
+SEARCH_TERMS = ['ma', 'jo', 'an', 're', 'sa', 'cr', 'ga', 'to']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _server_timing(header):
+    phases = {}
+    for part in (header or '').split(','):
+        name, _, rest = part.strip().partition(';dur=')
+        if name and rest:
+            try:
+                phases[name] = float(rest.split(';')[0])
+            except ValueError:
+                pass
+    return phases
+
+
+class Results:
+    """Latencies and outcomes of every request in a run."""
+
+    def __init__(self):
+        self.samples = {}  # label -> list of (ms, status, app_ms, db_ms)
+        self.failures = {}  # label -> {reason: count}
+
+    def record(self, label, ms, status, timing=None):
+        timing = timing or {}
+        self.samples.setdefault(label, []).append((ms, status, timing.get('app'), timing.get('db')))
+
+    def fail(self, label, reason):
+        reasons = self.failures.setdefault(label, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    @staticmethod
+    def _summarize(samples, elapsed):
+        latencies = [ms for ms, _, _, _ in samples]
+        errors = sum(1 for _, status, _, _ in samples if not 200 <= status < 300)
+        statuses = {}
+        for _, status, _, _ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        row = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4),
+            'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(statistics.mean(latencies), 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies), 1),
+            'statuses': statuses,
+        }
+        for key, index in (('server_app_ms', 2), ('server_db_ms', 3)):
+            values = [sample[index] for sample in samples if sample[index] is not None]
+            if values:
+                row[key] = round(statistics.mean(values), 1)
+        return row
+
+    def summary(self, elapsed):
+        endpoints = {label: self._summarize(samples, elapsed) for label, samples in self.samples.items()}
+        for label, reasons in self.failures.items():
+            endpoints.setdefault(label, {'requests': 0, 'errors': 0})['failures'] = reasons
+        everything = [sample for samples in self.samples.values() for sample in samples]
+        total = self._summarize(everything, elapsed) if everything else {'requests': 0, 'errors': 0}
+        total['failures'] = sum(sum(reasons.values()) for reasons in self.failures.values())
+        return {'total': total, 'endpoints': endpoints}
+
+
+class VirtualUser:
+    def __init__(self, role, username, password, client, results, think, rng):
+        self.role = role
+        self.username = username
+        self.password = password
+        self.client = client
+        self.results = results
+        self.think = think
+        self.rng = rng
+        self.appointments = []
+        self.iteration = 0
+
+    async def pause(self):
+        if self.think > 0:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+
+    async def request(self, method, name, args=None, query=None, json_body=None):
+        """Send one request labelled `name`; the response, or None if it failed
+        before one arrived."""
+        url = reverse(name, args=args)
+        if query:
+            url += '?' + query
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, json=json_body)
+        except httpx.HTTPError as exc:
+            self.results.fail(name, type(exc).__name__)
+            return None
+        elapsed = (time.perf_counter() - started) * 1000
+        self.results.record(name, elapsed, response.status_code,
+                            _server_timing(response.headers.get('Server-Timing')))
+        await self.pause()
+        return response
+
+    async def login(self):
+        response = await self.request('POST', 'login', json_body={
+            'username': self.username, 'password': self.password,
+        })
+        if response is None or response.status_code != 200:
+            return False
+        # Later POSTs must carry the token of the cookie login set
+        token = response.json().get('csrftoken') or self.client.cookies.get('csrftoken')
+        self.client.headers['X-CSRFToken'] = token
+        return True
+
+    @staticmethod
+    def _json(response):
+        if response is None or not 200 <= response.status_code < 300:
+            return {}
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+
+async def patient_journey(vu, polls):
+    await vu.request('GET', 'dashboard')
+    await vu.request('GET', 'labresults')
+    await vu.request('GET', 'prescriptions')
+    for _ in range(polls):
+        await vu.request('GET', 'get_unread_notifications')
+
+
+async def doctor_journey(vu, polls):
+    await vu.request('GET', 'doctor_panel')
+    await vu.request('GET', 'search_patients', query=f'q={vu.rng.choice(SEARCH_TERMS)}')
+    if not vu.appointments:
+        return
+    appointment_id = vu.appointments[vu.iteration % len(vu.appointments)]
+    started = vu._json(await vu.request('POST', 'start_live_consultation', args=[appointment_id]))
+    live_session_id = started.get('live_session_id')
+    if not live_session_id:
+        return
+    if started.get('action') == 'restart':
+        # Second time round the appointment list: reopen the completed session
+        await vu.request('POST', 'restart_live_consultation', args=[appointment_id])
+    await vu.request('POST', 'update_consultation_data', args=[live_session_id], json_body={
+        'vital_signs': {'blood_pressure': '120/80', 'heart_rate': vu.rng.randint(60, 100)},
+        'symptoms': 'Cough and mild fever',
+        'diagnosis': 'Upper respiratory tract infection',
+    })
+    await vu.request('POST', 'complete_consultation', args=[live_session_id])
+    await vu.request('POST', 'create_prescription', args=[live_session_id], json_body={
+        'medicines': [{'name': 'Paracetamol', 'dosage': '500mg', 'frequency': 'Every 6 hours'}],
+        'instructions': 'Take after meals',
+    })
+
+
+async def admin_journey(vu, polls):
+    await vu.request('GET', 'moddashboard')
+    await vu.request('GET', 'mod_analytics')
+    await vu.request('GET', 'analytics_api')
+    await vu.request('GET', 'mod_records')
+
+
+JOURNEYS = {
+    'patient': patient_journey,
+    'doctor': doctor_journey,
+    'admin': admin_journey,
+}
+
+
+async def _run_user(vu, journey, deadline, start_delay, polls):
+    await asyncio.sleep(start_delay)
+    if time.monotonic() >= deadline:
+        return
+    if not await vu.login():
+        return
+    while time.monotonic() < deadline:
+        await journey(vu, polls)
+        vu.iteration += 1
+
+
+async def _run(base_url, users, duration, think, ramp_up, polls, timeout, seed):
+    results = Results()
+    deadline = time.monotonic() + ramp_up + duration
+    clients = []
+    tasks = []
+    try:
+        for index, user in enumerate(users):
+            client = httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False)
+            clients.append(client)
+            vu = VirtualUser(user['role'], user['username'], user['password'], client, results, think,
+                             random.Random(seed + index))
+            vu.appointments = list(user.get('appointments', ()))
+            delay = ramp_up * index / len(users) if ramp_up else 0
+            tasks.append(_run_user(vu, JOURNEYS[user['role']], deadline, delay, polls))
+        started = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+    finally:
+        for client in clients:
+            await client.aclose()
+    return results, elapsed
+
+
+def run_load_test(base_url, users, duration=60, think=1.0, ramp_up=0, polls=3, timeout=30, seed=42):
+    """Run the journeys of `users` (dicts with role, username, password and,
+    for doctors, appointments) against `base_url`; returns the result
+    document written by `manage.py load_test --output`."""
+    started_at = datetime.now(timezone.utc)
+    results, elapsed = asyncio.run(_run(base_url, users, duration, think, ramp_up, polls, timeout, seed))
+    roles = {}
+    for user in users:
+        roles[user['role']] = roles.get(user['role'], 0) + 1
+    document = {
+        'started_at': started_at.isoformat(),
+        'base_url': base_url,
+        'config': {
+            'users': roles,
+            'duration_s': duration,
+            'ramp_up_s': ramp_up,
+            'think_s': think,
+            'polls': polls,
+            'seed': seed,
+        },
+        'elapsed_s': round(elapsed, 2),
+    }
+    document.update(results.summary(elapsed))
+    return document
+
+
+def compare(current, baseline):
+    """Per-endpoint change in p95 latency, throughput and error rate between
+    two result documents, as {label: {metric: (before, after)}}."""
+    changes = {}
+    labels = set(current['endpoints']) | set(baseline['endpoints'])
+    for label in sorted(labels):
+        before = baseline['endpoints'].get(label, {})
+        after = current['endpoints'].get(label, {})
+        changes[label] = {
+            metric: (before.get(metric), after.get(metric))
+            for metric in ('p95_ms', 'rps', 'error_rate')
+        }
+    return changes
+
+
+def dumps(document):
+    """Stable JSON so two result files diff cleanly."""
+    return json.dumps(document, indent=2, sort_keys=True) + '\n'
@@ -6,7 +6,6 @@ Processes photo uploads and cleans up old files when users update profiles.
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from myapp.models import User, UserProfile
-from myapp.utils.supabase_storage import upload_profile_photo
 import os
 
 
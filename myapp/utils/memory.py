@@ -0,0 +1,178 @@
+"""
+Memory instrumentation for workers that grow over time.
+
+- `rss_kb()` reads this process's resident set size from /proc.
+- tracemalloc snapshots on demand (admin API `memory_profile`): start
+  tracing, take snapshots, and diff two of them grouped by line or file.
+  Snapshots are dumped to PROFILING_DIR/memory as <pid>-<n>.tracemalloc;
+  each worker keeps its newest MEMORY_SNAPSHOTS_KEEP. Tracing and
+  snapshots are per worker process, so the responses carry the pid; diff
+  snapshots from the same pid.
+- `measure_peak(func)`: peak bytes allocated while func() ran. The
+  MemoryMiddleware samples MEMORY_PEAK_SAMPLE_RATE of the requests to the
+  views in MEMORY_PEAK_VIEWS (downloads and PDF renders). It logs the peak
+  and records it in Prometheus. Under a threaded worker, the peak includes
+  whatever the other threads allocated at the same time. One request per
+  process is measured at a time, and none while an admin is tracing, so a
+  measurement never stops or resets someone else's tracing.
+- `recycle_if_bloated(worker, limit_mb)`: gunicorn's post_request hook
+  (gunicorn.conf.py) retires a worker once its RSS passes MEMORY_MAX_RSS_MB.
+  The worker finishes the request and exits, and the arbiter forks a fresh
+  one, which is what max_requests does on a request count.
+"""
+
+import itertools
+import os
+import re
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+from myapp.utils.profiling import profile_dir
+
+_PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+_NAME = re.compile(r'^\d+-\d+$')
+_sequence = itertools.count(1)
+_lock = threading.Lock()
+# Held while tracemalloc is started or stopped, and through a measure_peak()
+_tracing_lock = threading.Lock()
+
+
+def rss_kb():
+    """Resident set size of this process in KiB, or None without /proc."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def status():
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        'pid': os.getpid(),
+        'rss_kb': rss_kb(),
+        'tracing': tracemalloc.is_tracing(),
+        'traced_kb': round(current / 1024, 1),
+        'traced_peak_kb': round(peak / 1024, 1),
+        'snapshots': list_snapshots(),
+    }
+
+
+def start_tracing(frames=None):
+    """Start tracemalloc; False if it was already running."""
+    with _tracing_lock:
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames or getattr(settings, 'MEMORY_TRACEMALLOC_FRAMES', 1))
+        return True
+
+
+def stop_tracing():
+    """Stop tracemalloc, dropping its traces (snapshots on disk stay)."""
+    with _tracing_lock:
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        return True
+
+
+def snapshot_dir():
+    path = os.path.join(profile_dir(), 'memory')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def list_snapshots():
+    """Snapshot names, oldest first."""
+    names = [name[:-len('.tracemalloc')] for name in os.listdir(snapshot_dir()) if name.endswith('.tracemalloc')]
+    return sorted(names, key=lambda name: tuple(int(part) for part in name.split('-')))
+
+
+def take_snapshot():
+    """Dump a snapshot of the traced allocations; its name, or None when
+    tracemalloc isn't running."""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+    with _lock:
+        name = f'{os.getpid()}-{next(_sequence)}'
+        snapshot.dump(os.path.join(snapshot_dir(), f'{name}.tracemalloc'))
+        keep = getattr(settings, 'MEMORY_SNAPSHOTS_KEEP', 10)
+        # Other workers prune their own
+        mine = [old for old in list_snapshots() if old.startswith(f'{os.getpid()}-')]
+        for old in mine[:-keep]:
+            os.remove(os.path.join(snapshot_dir(), f'{old}.tracemalloc'))
+    return name
+
+
+def load_snapshot(name):
+    if not _NAME.match(name or ''):
+        raise ValueError(f'Invalid snapshot name: {name!r}')
+    path = os.path.join(snapshot_dir(), f'{name}.tracemalloc')
+    if not os.path.exists(path):
+        raise LookupError(f'No snapshot {name}')
+    return tracemalloc.Snapshot.load(path)
+
+
+def _where(filename, lineno=None):
+    root = str(settings.BASE_DIR)
+    if filename.startswith(root + os.sep):
+        filename = os.path.relpath(filename, root)
+    return f'{filename}:{lineno}' if lineno is not None else filename
+
+
+def diff_snapshots(base, target, group_by='lineno', limit=25):
+    """Biggest growths from snapshot `base` to `target`, grouped by
+    'lineno' or 'filename'."""
+    stats = load_snapshot(target).compare_to(load_snapshot(base), group_by)
+    rows = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        rows.append({
+            'where': _where(frame.filename, frame.lineno if group_by == 'lineno' else None),
+            'size_diff_kb': round(stat.size_diff / 1024, 1),
+            'size_kb': round(stat.size / 1024, 1),
+            'count_diff': stat.count_diff,
+            'count': stat.count,
+        })
+    return rows
+
+
+def measure_peak(func):
+    """(func(), peak bytes allocated while it ran), tracing just for the
+    call. The peak is None, and func() simply runs, while another call is
+    being measured or tracemalloc is already running."""
+    if not _tracing_lock.acquire(blocking=False):
+        return func(), None
+    if tracemalloc.is_tracing():
+        _tracing_lock.release()
+        return func(), None
+    try:
+        tracemalloc.start(1)
+        try:
+            result = func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        _tracing_lock.release()
+    return result, peak
+
+
+def recycle_if_bloated(worker, limit_mb):
+    """Tell a gunicorn worker to exit after this request if its RSS is over
+    `limit_mb`; returns whether it was told to."""
+    if not limit_mb or not worker.alive:
+        return False
+    rss = rss_kb()
+    if rss is None or rss <= limit_mb * 1024:
+        return False
+    worker.log.warning('Worker %s RSS %.0f MiB is over %s MiB; recycling', worker.pid, rss / 1024, limit_mb)
+    worker.alive = False
+    return True
@@ -0,0 +1,147 @@
+"""
+Prometheus metrics for the application's hot paths.
+
+Collected here (all prefixed medisafe_):
+    request_duration_seconds{view, method}   histogram, per URL name
+    request_db_queries{view}                 histogram of queries per request
+    cache_requests_total{cache, result}      hit/miss of the app's caches
+    pdf_render_seconds{document}             histogram
+    transfer_bytes_total{direction}          upload/download bytes
+    notification_polls_total{view}           notification polling endpoints
+    request_peak_alloc_bytes{view}           sampled peak allocation (myapp.utils.memory)
+
+Requests are recorded by myapp.middleware.RequestMetricsMiddleware; the
+other call sites record their own numbers. The text format is served at
+/metrics (see myapp.features.monitoring).
+
+Under gunicorn every worker is a separate process. With
+PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does this) prometheus_client
+keeps the values in memory-mapped files in that directory and the scrape
+merges all workers. Without it (runserver) the process registry is used.
+
+prometheus_client is optional: without it every function here is a no-op
+and /metrics answers 503.
+"""
+
+import os
+import time
+from functools import wraps
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 40, 80, 160)
+PDF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+ALLOC_BUCKETS = tuple(2 ** power * 1024 for power in range(6, 19, 2))  # 64 KiB .. 256 MiB
+
+# URL names of the endpoints the front end polls for notifications
+NOTIFICATION_POLL_VIEWS = {
+    'alertnotification',
+    'get_unread_notifications',
+    'get_password_reset_notifications',
+}
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        'medisafe_request_duration_seconds', 'Request latency by URL name',
+        ['view', 'method'], buckets=LATENCY_BUCKETS,
+    )
+    REQUEST_QUERIES = Histogram(
+        'medisafe_request_db_queries', 'Database queries per request',
+        ['view'], buckets=QUERY_BUCKETS,
+    )
+    CACHE_REQUESTS = Counter(
+        'medisafe_cache_requests', 'Cache lookups by cache and result',
+        ['cache', 'result'],
+    )
+    PDF_RENDER = Histogram(
+        'medisafe_pdf_render_seconds', 'PDF generation time',
+        ['document'], buckets=PDF_BUCKETS,
+    )
+    TRANSFER_BYTES = Counter(
+        'medisafe_transfer_bytes', 'File bytes uploaded and downloaded',
+        ['direction'],
+    )
+    NOTIFICATION_POLLS = Counter(
+        'medisafe_notification_polls', 'Notification polling requests',
+        ['view'],
+    )
+    PEAK_ALLOC = Histogram(
+        'medisafe_request_peak_alloc_bytes', 'Peak Python allocation of sampled requests',
+        ['view'], buckets=ALLOC_BUCKETS,
+    )
+
+
+def enabled():
+    return prometheus_client is not None
+
+
+def _is_download(response):
+    if 'attachment' in response.get('Content-Disposition', ''):
+        return True
+    content_type = response.get('Content-Type', '')
+    return not content_type.startswith(('text/', 'application/json'))
+
+
+def record_request(request, response, view, seconds, queries):
+    if prometheus_client is None:
+        return
+    REQUEST_LATENCY.labels(view, request.method).observe(seconds)
+    REQUEST_QUERIES.labels(view).observe(queries)
+    if view in NOTIFICATION_POLL_VIEWS:
+        NOTIFICATION_POLLS.labels(view).inc()
+    if request.META.get('CONTENT_TYPE', '').startswith('multipart/form-data'):
+        try:
+            TRANSFER_BYTES.labels('upload').inc(int(request.META.get('CONTENT_LENGTH') or 0))
+        except ValueError:
+            pass
+    if 200 <= response.status_code < 300 and _is_download(response):
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        TRANSFER_BYTES.labels('download').inc(size)
+
+
+def record_cache(cache, hits=0, misses=0):
+    if prometheus_client is None:
+        return
+    if hits:
+        CACHE_REQUESTS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, 'miss').inc(misses)
+
+
+def record_peak_alloc(view, peak_bytes):
+    if prometheus_client is None:
+        return
+    PEAK_ALLOC.labels(view).observe(peak_bytes)
+
+
+def time_pdf(document):
+    """Decorator recording how long a PDF generator function takes."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if prometheus_client is not None:
+                    PDF_RENDER.labels(document).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render_latest():
+    """(body, content type) of the current metrics in the text format."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,164 @@
+"""
+Monthly range partitions for the `notifications` table (PostgreSQL only).
+
+Migration 0021 turns `notifications` into a table partitioned by
+RANGE (created_at) with one partition per month, named
+notifications_pYYYYMM, plus a DEFAULT partition that only catches rows
+outside the pre-created range. The `notification_partitions` command
+creates partitions ahead of time and drops whole months for retention. It
+runs in the release step (Procfile) and should also run daily from a
+scheduler, so months get created without a deploy. A month that was
+missed, and whose rows landed in DEFAULT, is created by moving those rows
+out of DEFAULT first.
+
+Postgres requires unique indexes on a partitioned table to include the
+partition key, so the partial (user, event_key) unique indexes only hold
+within each partition, DEFAULT included. The uniqueness generated
+notifications rely on across months comes from NotificationEvent
+(notification_sync.claim_events).
+
+Migration 0021 keeps the pre-partitioning table as notifications_legacy.
+Once the partitioned table has been checked in production, drop it with
+`manage.py notification_partitions --drop-legacy` (drop_legacy_table()).
+
+On other databases (SQLite in development) `is_partitioned()` is False and
+everything here is a no-op.
+"""
+
+import re
+from datetime import date
+
+from django.db import connection, transaction
+
+TABLE = 'notifications'
+DEFAULT = 'notifications_default'
+LEGACY = 'notifications_legacy'
+PARTITION_RE = re.compile(r'^notifications_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(value):
+    return f"{TABLE}_p{value.year:04d}{value.month:02d}"
+
+
+def is_partitioned(cursor=None):
+    if connection.vendor != 'postgresql':
+        return False
+    own_cursor = cursor is None
+    cursor = cursor or connection.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        return cursor.fetchone() is not None
+    finally:
+        if own_cursor:
+            cursor.close()
+
+
+def create_month_partition(cursor, month):
+    """Create the partition for `month` (and its local indexes) if missing.
+
+    Postgres won't create a partition for a range the DEFAULT partition
+    holds rows in, so those rows are moved into a standalone table that is
+    then attached as the partition. DEFAULT is locked meanwhile so no new
+    rows for the month land in it.
+    """
+    start = month_start(month)
+    name = partition_name(start)
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{next_month(start).isoformat()}')"
+    range_params = [start, next_month(start)]
+    with transaction.atomic():
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f'LOCK TABLE "{DEFAULT}" IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(
+                f'SELECT 1 FROM "{DEFAULT}" WHERE created_at >= %s AND created_at < %s LIMIT 1', range_params
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" {bounds}')
+            else:
+                cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM "{DEFAULT}" WHERE created_at >= %s AND created_at < %s '
+                    f'RETURNING *) INSERT INTO "{name}" SELECT * FROM moved', range_params
+                )
+                cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" {bounds}')
+    # Unique per partition; see the module docstring
+    cursor.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_user_event" ON "{name}" (user_id, event_key) '
+        f"WHERE event_key IS NOT NULL"
+    )
+    return name
+
+
+def list_partitions(cursor):
+    """[(month, partition name)] for the monthly partitions, oldest first."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s)", [TABLE]
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Create partitions from the current month through `months_ahead` months."""
+    if not is_partitioned():
+        return []
+    month = month_start(today or date.today())
+    created = []
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            created.append(create_month_partition(cursor, month))
+            month = next_month(month)
+    return created
+
+
+def drop_partitions_before(cutoff):
+    """Drop every monthly partition that ends on or before `cutoff`.
+
+    Returns ([dropped partition names], [attachment file names they held]) so
+    the caller can remove files that are no longer referenced.
+    """
+    if not is_partitioned():
+        return [], []
+    dropped, files = [], []
+    with connection.cursor() as cursor:
+        for month, name in list_partitions(cursor):
+            if next_month(month) > cutoff:
+                break
+            cursor.execute(f'SELECT DISTINCT file FROM "{name}" WHERE file IS NOT NULL AND file <> %s', [''])
+            files.extend(row[0] for row in cursor.fetchall())
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+    return dropped, files
+
+
+def drop_legacy_table():
+    """Drop the copy of the unpartitioned table left by migration 0021.
+    Returns False if there was none."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [LEGACY])
+        if cursor.fetchone()[0] is None:
+            return False
+        cursor.execute(f'DROP TABLE "{LEGACY}"')
+    return True
+
+
+def explain(queryset):
+    """EXPLAIN output for a queryset, to check which partitions it touches."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return "\n".join(row[0] for row in cursor.fetchall())
@@ -0,0 +1,198 @@
+"""
+Materialises the notifications a patient should see from their data
+(appointment status, recent lab results, account state).
+
+`sync_notifications(user_id)` computes the desired set, each item
+identified by an `event_key` such as "appointment:42:approved", claims the
+keys the user has not been notified about yet (`claim_events`) and writes
+their notifications with a single bulk_create in the same transaction, so
+a repeated run writes nothing. Claims are rows of NotificationEvent, whose
+unique (user, event_key) constraint holds across the monthly partitions of
+the notifications table: of two runs racing for the same user, only one
+claims a key.
+
+It runs off the request path: `schedule_sync(user_id)` hands the work to a
+single background thread (coalescing repeated requests for the same user),
+and appointment / lab result changes schedule it through signals once their
+transaction commits. Set NOTIFICATION_SYNC_ASYNC = False to run inline.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from myapp.models import User, Appointment, LabResult, Notification, NotificationEvent
+
+logger = logging.getLogger(__name__)
+
+RECENT_APPOINTMENTS = 5
+RECENT_LAB_RESULTS = 5
+LAB_RESULT_DAYS = 7
+INACTIVE_DAYS = 30
+THROTTLE_KEY = 'notification_sync:{}'
+# Opening the notifications page re-syncs at most this often per user
+PAGE_SYNC_INTERVAL = 60 * 5
+CLAIM_ATTEMPTS = 3
+
+
+def event_key(kind, related_id, stage):
+    return f"{kind}:{related_id}:{stage}"
+
+
+def claim_events(pairs):
+    """Record (user_id, event_key) pairs as notified and return the set of
+    those nobody had claimed before. Call it in the transaction that inserts
+    their notifications, so a rollback releases the claims."""
+    pairs = set(pairs)
+    for attempt in range(CLAIM_ATTEMPTS):
+        taken = set(NotificationEvent.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            event_key__in={key for _, key in pairs},
+        ).values_list('user_id', 'event_key'))
+        new = pairs - taken
+        if not new:
+            return new
+        try:
+            with transaction.atomic():
+                NotificationEvent.objects.bulk_create(
+                    [NotificationEvent(user_id=user_id, event_key=key) for user_id, key in new]
+                )
+            return new
+        except IntegrityError:
+            # Another transaction claimed some of them since the lookup
+            if attempt == CLAIM_ATTEMPTS - 1:
+                raise
+
+
+def desired_notifications(user, appointments, lab_results, user_profile=None, now=None):
+    """Notifications `user` should have, as unsaved Notification objects."""
+    now = now or timezone.now()
+    wanted = []
+
+    def add(key, title, message, notification_type, priority, related_id=None):
+        wanted.append(Notification(
+            user=user, event_key=key, title=title, message=message,
+            notification_type=notification_type, priority=priority, related_id=related_id,
+        ))
+
+    for appointment in appointments:
+        doctor_name = appointment.doctor.user.get_full_name()
+        appointment_id = appointment.consultation_id
+        if appointment.approval_status == 'Pending':
+            add(event_key('appointment', appointment_id, 'pending'), "Appointment Pending Approval",
+                f"Your {appointment.consultation_type} appointment with Dr. {doctor_name} on {appointment.consultation_date} is pending approval.",
+                'appointment', 'medium', appointment_id)
+        if appointment.approval_status == 'Approved':
+            add(event_key('appointment', appointment_id, 'approved'), "Appointment Approved",
+                f"Your appointment with Dr. {doctor_name} on {appointment.consultation_date} at {appointment.consultation_time} has been approved.",
+                'appointment', 'medium', appointment_id)
+        if appointment.approval_status == 'Approved' and appointment.status == 'Scheduled':
+            days_until = (appointment.consultation_date - now.date()).days
+            if days_until == 0:
+                add(event_key('appointment', appointment_id, 'today'), "Appointment Today",
+                    f"Your appointment with Dr. {doctor_name} is scheduled for today at {appointment.consultation_time}.",
+                    'urgent', 'high', appointment_id)
+            elif days_until == 1:
+                add(event_key('appointment', appointment_id, 'tomorrow'), "Appointment Tomorrow",
+                    f"Your appointment with Dr. {doctor_name} is scheduled for tomorrow at {appointment.consultation_time}.",
+                    'appointment', 'medium', appointment_id)
+
+    for lab_result in lab_results:
+        if (now - lab_result.upload_date).days <= LAB_RESULT_DAYS:
+            add(event_key('lab_result', lab_result.lab_result_id, 'available'), "New Lab Results Available",
+                f"Your {lab_result.lab_type} results are now available for review.",
+                'lab_result', 'medium', lab_result.lab_result_id)
+
+    if user.last_login and (now - user.last_login).days > INACTIVE_DAYS:
+        add('account:inactive', "Account Security Alert",
+            "Your account hasn't been accessed in over 30 days. Please verify your account security.",
+            'account', 'high')
+
+    if user_profile and (not user_profile.contact_person or not user_profile.contact_number):
+        add('account:profile_incomplete', "Profile Update Required",
+            "Please complete your emergency contact information for better care coordination.",
+            'account', 'medium')
+
+    return wanted
+
+
+def sync_notifications(user_id):
+    """Create any missing generated notifications for one user; returns how many."""
+    user = User.objects.select_related('userprofile').filter(user_id=user_id).first()
+    if user is None:
+        return 0
+    appointments = (Appointment.objects
+                    .select_related('doctor__user__userprofile')
+                    .filter(patient_id=user_id)
+                    .order_by('-created_at')[:RECENT_APPOINTMENTS])
+    lab_results = LabResult.objects.filter(user_id=user_id).order_by('-upload_date')[:RECENT_LAB_RESULTS]
+
+    wanted = desired_notifications(user, appointments, lab_results, getattr(user, 'userprofile', None))
+    if not wanted:
+        return 0
+    with transaction.atomic():
+        claimed = claim_events((user.user_id, n.event_key) for n in wanted)
+        missing = [n for n in wanted if (user.user_id, n.event_key) in claimed]
+        if missing:
+            Notification.objects.bulk_create(missing)
+    return len(missing)
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notification-sync')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _sync(user_id):
+    # Runs after the triggering write committed; never fail that request
+    try:
+        sync_notifications(user_id)
+    except Exception:
+        logger.exception("Notification sync failed for user %s", user_id)
+
+
+def _run(user_id):
+    with _pending_lock:
+        _pending.discard(user_id)
+    try:
+        _sync(user_id)
+    finally:
+        # The worker thread owns its own DB connection
+        connection.close()
+
+
+def schedule_sync(user_id, min_interval=0):
+    """Queue a sync for `user_id` unless one is already queued.
+
+    With `min_interval`, skip it if this user was synced that many seconds ago.
+    """
+    if not user_id:
+        return
+    if min_interval and not cache.add(THROTTLE_KEY.format(user_id), 1, min_interval):
+        return
+    if not getattr(settings, 'NOTIFICATION_SYNC_ASYNC', True):
+        _sync(user_id)
+        return
+    with _pending_lock:
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+    _executor.submit(_run, user_id)
+
+
+@receiver(post_save, sender=Appointment)
+def on_appointment_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: schedule_sync(instance.patient_id))
+
+
+@receiver(post_save, sender=LabResult)
+def on_lab_result_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: schedule_sync(instance.user_id))
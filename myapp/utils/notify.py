@@ -0,0 +1,157 @@
+"""
+Central fan-out for notifications.
+
+`notify(recipients, title, message, ...)` writes one Notification row per
+recipient with a single bulk_create. An attachment is stored once, under a
+content-hash path, and every row points at that same file, so the cost of
+a fan-out does not grow with the size of the attachment times the number of
+recipients. The retention purge removes a file only when no notification
+points at it, checked again right before each delete; a fan-out that reused
+the file while it was being removed saves it again once it commits.
+
+After the rows are committed they are handed to each push channel listed in
+settings.NOTIFICATION_CHANNELS (dotted paths to callables taking the list of
+notifications). A failing channel is logged and never affects the caller.
+"""
+
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+
+from myapp.models import Notification
+from myapp.utils.notification_sync import claim_events
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DIR = 'notifications'
+
+_channels = None
+
+
+def get_channels():
+    global _channels
+    if _channels is None:
+        _channels = []
+        for path in getattr(settings, 'NOTIFICATION_CHANNELS', []):
+            try:
+                _channels.append(import_string(path))
+            except ImportError:
+                logger.exception("Could not load notification channel %s", path)
+    return _channels
+
+
+def store_attachment(content, filename):
+    """Save attachment bytes once per content hash; returns the storage name."""
+    digest = hashlib.sha256(content).hexdigest()
+    name = f"{ATTACHMENT_DIR}/{digest}/{get_valid_filename(os.path.basename(filename or 'attachment'))}"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def _restore_attachment(name, content):
+    """Save a shared attachment again if a purge removed it between
+    store_attachment() and the commit of the rows pointing at it."""
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+
+
+def _publish(notifications):
+    for channel in get_channels():
+        try:
+            channel(notifications)
+        except Exception:
+            logger.exception("Notification channel %r failed", channel)
+
+
+@transaction.atomic
+def notify(recipients, title, message, notification_type='system', priority='medium',
+           related_id=None, attachment=None, attachment_name=None, event_key=None):
+    """Notify every recipient (User objects or user ids) with one insert.
+
+    `attachment` may be bytes or a file object (e.g. an UploadedFile).
+    With `event_key`, recipients who already got that event are skipped.
+    Returns the created Notification objects.
+    """
+    user_ids = []
+    for recipient in recipients:
+        user_id = getattr(recipient, 'user_id', recipient)
+        if user_id is not None and user_id not in user_ids:
+            user_ids.append(user_id)
+    if event_key is not None:
+        claimed = claim_events((user_id, event_key) for user_id in user_ids)
+        user_ids = [user_id for user_id in user_ids if (user_id, event_key) in claimed]
+    if not user_ids:
+        return []
+
+    file_name = None
+    if attachment is not None:
+        if not isinstance(attachment, (bytes, bytearray)):
+            attachment_name = attachment_name or getattr(attachment, 'name', None)
+            attachment.seek(0)
+            attachment = attachment.read()
+        content = bytes(attachment)
+        file_name = store_attachment(content, attachment_name)
+
+    rows = [
+        Notification(
+            user_id=user_id,
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            priority=priority,
+            related_id=related_id,
+            file=file_name,
+            event_key=event_key,
+        )
+        for user_id in user_ids
+    ]
+    created = Notification.objects.bulk_create(rows)
+    if file_name is not None:
+        transaction.on_commit(lambda: _restore_attachment(file_name, content))
+    if get_channels():
+        transaction.on_commit(lambda: _publish(created))
+    return created
+
+
+def unreferenced_files(names):
+    """The subset of attachment names that no notification points at any more."""
+    names = {name for name in names if name}
+    if not names:
+        return set()
+    still_used = set(Notification.objects.filter(file__in=names).values_list('file', flat=True))
+    return names - still_used
+
+
+def delete_attachment(name):
+    try:
+        default_storage.delete(name)
+        return True
+    except Exception:
+        logger.warning("Could not delete notification attachment %s", name, exc_info=True)
+        return False
+
+
+def delete_unreferenced_files(names, pool=None):
+    """Remove attachment files that no remaining notification points at.
+
+    A concurrent notify() may start pointing at one of them, so each file
+    is checked again right before it is deleted. `pool` (an Executor) runs
+    the deletes themselves, which are slow on remote storage; the checks
+    stay on this thread and its database connection.
+    """
+    deletes = []
+    for name in unreferenced_files(names):
+        if Notification.objects.filter(file=name).exists():
+            continue
+        deletes.append(pool.submit(delete_attachment, name) if pool else name)
+    if pool:
+        return sum(future.result() for future in deletes)
+    return sum(delete_attachment(name) for name in deletes)
@@ -0,0 +1,166 @@
+"""
+Patient account creation: unique usernames, MRNs and bulk onboarding.
+
+Usernames keep the historical shape (johnsmith, johnsmith1, johnsmith2, ...)
+but the suffix comes from a DisplayCounter row per base name instead of
+probing `exists()` until a free one turns up. A base that already has users
+from before the counter existed is seeded once from them. Candidate names
+are checked for stragglers (usernames typed in by hand at registration) in
+one query per batch. Allocation and insert share one transaction: if a
+straggler registers between the check and the insert, the unique
+constraint rejects the insert, the counters roll back and allocation runs
+again, up to ALLOCATION_ATTEMPTS times.
+
+MRNs come from the 'mrn' series of myapp.utils.display_numbers.
+
+`create_patients(rows)` creates thousands of patients in one transaction
+with a handful of statements: one counter update per distinct base name,
+one for the MRN block and one bulk insert each for users, profiles and
+patient records. Password hashing is spread over threads.
+"""
+
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from myapp.models import User, UserProfile, Patient
+from myapp.utils.display_numbers import allocate, next_numbers, seed
+
+EMAIL_DOMAIN = 'healthcareplus.com'  # placeholder address until the patient sets one
+BASE_MAX_LENGTH = 40  # leaves room for the numeric suffix in username (50)
+GENDERS = {'male': 'M', 'female': 'F', 'other': 'O'}
+ALLOCATION_ATTEMPTS = 3
+
+
+def username_base(first_name, last_name):
+    base = re.sub(r'[^a-z0-9]', '', f"{first_name}{last_name}".lower())
+    return (base or 'patient')[:BASE_MAX_LENGTH]
+
+
+def _series(base):
+    return f"username:{base}"
+
+
+def _seed_from_existing(base):
+    """Move the counter of `base` past usernames created before it existed."""
+    pattern = re.compile(rf'^{re.escape(base)}(\d*)$')
+    highest = 0
+    for username in User.objects.filter(username__startswith=base).values_list('username', flat=True).iterator():
+        match = pattern.match(username)
+        if match:
+            highest = max(highest, int(match.group(1) or 0) + 1)
+    seed(_series(base), highest)
+
+
+def allocate_usernames(bases):
+    """One unique username per entry of `bases` (repeats allowed), in order."""
+    names = [None] * len(bases)
+    pending = list(range(len(bases)))
+    seeded = set()
+    while pending:
+        by_base = defaultdict(list)
+        for index in pending:
+            by_base[bases[index]].append(index)
+        for base, indexes in by_base.items():
+            last = allocate(_series(base), len(indexes))
+            for index, value in zip(indexes, range(last - len(indexes) + 1, last + 1)):
+                names[index] = base if value == 1 else f"{base}{value - 1}"
+
+        candidates = [names[index] for index in pending]
+        emails = [f"{name}@{EMAIL_DOMAIN}" for name in candidates]
+        taken = set()
+        for username, email in User.objects.filter(
+            Q(username__in=candidates) | Q(email__in=emails)
+        ).values_list('username', 'email'):
+            taken.add(username)
+            if email.endswith(f"@{EMAIL_DOMAIN}"):
+                taken.add(email.rsplit('@', 1)[0])
+
+        retry = [index for index in pending if names[index] in taken]
+        for base in {bases[index] for index in retry} - seeded:
+            _seed_from_existing(base)
+            seeded.add(base)
+        pending = retry
+    return names
+
+
+def default_password(username):
+    return f"Patient@{username}"
+
+
+def create_patients(rows, client=None, workers=4, set_passwords=True):
+    """Create a patient account (User, UserProfile, Patient) per row.
+
+    Each row is a dict with first_name, last_name and optionally sex
+    (male/female/other), date_of_birth, blood_type, allergies, conditions,
+    emergency_contact_name, emergency_contact_phone and client (a User).
+    Everything happens in one transaction. Returns
+    [(user, patient, default password)] in row order. With
+    set_passwords=False the accounts get unusable passwords (and None is
+    returned for them), which skips the hashing for large imports.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _create_patients(rows, client, workers, set_passwords)
+        except IntegrityError:
+            # Taken by hand since the straggler check; the next pass sees it
+            if attempt == ALLOCATION_ATTEMPTS - 1:
+                raise
+
+
+def _create_patients(rows, client, workers, set_passwords):
+    usernames = allocate_usernames([username_base(row['first_name'], row['last_name']) for row in rows])
+    if set_passwords:
+        passwords = [default_password(username) for username in usernames]
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            hashes = list(pool.map(make_password, passwords))
+    else:
+        passwords = [None] * len(rows)
+        hashes = [make_password(None) for _ in rows]
+    # Last, so the shared 'mrn' counter row stays locked only for the inserts
+    mrns = next_numbers('mrn', len(rows))
+
+    users = User.objects.bulk_create([
+        User(username=username, email=f"{username}@{EMAIL_DOMAIN}", role='patient',
+             is_active=True, password=password_hash)
+        for username, password_hash in zip(usernames, hashes)
+    ])
+    UserProfile.objects.bulk_create([
+        UserProfile(
+            user=user,
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            sex=row.get('sex') or None,
+            birthday=row.get('date_of_birth') or None,
+        )
+        for user, row in zip(users, rows)
+    ])
+    patients = Patient.objects.bulk_create([
+        Patient(
+            user=user,
+            client=row.get('client', client),
+            medical_record_number=mrn,
+            date_of_birth=row.get('date_of_birth') or None,
+            gender=GENDERS.get((row.get('sex') or '').lower()),
+            blood_type=row.get('blood_type') or None,
+            allergies=row.get('allergies') or None,
+            conditions=row.get('conditions') or None,
+            emergency_contact_name=row.get('emergency_contact_name') or None,
+            emergency_contact_phone=row.get('emergency_contact_phone') or None,
+        )
+        for user, row, mrn in zip(users, rows, mrns)
+    ])
+    return list(zip(users, patients, passwords))
+
+
+def create_patient(client=None, **fields):
+    """Single-patient form of create_patients()."""
+    return create_patients([fields], client=client, workers=1)[0]
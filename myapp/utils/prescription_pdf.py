@@ -1,23 +1,28 @@
 """
 Prescription PDF generation for Render deployment.
 Generates PDFs on-the-fly instead of relying on stored files.
+ReportLab is imported on the first render, not when this module loads.
 """
 
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
 from io import BytesIO
 from datetime import datetime
 import json
 
+from myapp.utils.metrics import time_pdf
 
+
+@time_pdf('prescription')
 def generate_prescription_pdf(prescription):
     """
     Generate a prescription PDF from prescription object.
     Creates PDF in memory without relying on stored files.
     """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+
     try:
         # Create PDF in memory
         buffer = BytesIO()
@@ -140,9 +145,9 @@ def generate_prescription_pdf(prescription):
         content.append(Spacer(1, 0.2*inch))
         
         # Notes
-        if prescription.notes:
+        if prescription.instructions:
             content.append(Paragraph("Doctor's Notes", heading_style))
-            content.append(Paragraph(prescription.notes, styles['BodyText']))
+            content.append(Paragraph(prescription.instructions, styles['BodyText']))
             content.append(Spacer(1, 0.2*inch))
         
         # Footer
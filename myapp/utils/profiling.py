@@ -0,0 +1,176 @@
+"""
+Request profiling for super-admins and an optional always-on stack sampler.
+
+On demand (ProfilingMiddleware): a super-admin adds `?__profile=1` to a URL,
+or sends the header `X-Profile: 1`, and gets a cProfile report of that
+request instead of its response. `__profile=folded` samples the request's
+stack every PROFILING_SAMPLE_INTERVAL seconds instead and returns folded
+stacks ("frame;frame;frame count" lines), the input format of flamegraph.pl
+and speedscope. Either way the profile is also written to PROFILING_DIR
+(.prof files load into snakeviz or `python -m pstats`). For anyone else the
+parameter is ignored and the request runs normally.
+
+Always on (PROFILING_SAMPLER_ENABLED): one daemon thread per worker samples
+the threads that are serving a request every PROFILING_SAMPLER_INTERVAL
+seconds and rewrites PROFILING_DIR/stacks-<pid>.folded with the running
+totals every PROFILING_SAMPLER_FLUSH_SECONDS. Merge the workers with
+`cat stacks-*.folded | flamegraph.pl > flame.svg`.
+
+Settings:
+    PROFILING_ENABLED                on-demand profiling (default True)
+    PROFILING_DIR                    where profiles go (default <tmp>/medisafe-profiles)
+    PROFILING_SAMPLE_INTERVAL        on-demand sampling period (default 0.001)
+    PROFILING_SAMPLER_ENABLED        always-on sampler (default False)
+    PROFILING_SAMPLER_INTERVAL       its sampling period (default 0.01)
+    PROFILING_SAMPLER_FLUSH_SECONDS  how often it writes (default 60)
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+MAX_DEPTH = 128
+
+
+def profile_dir():
+    path = getattr(settings, 'PROFILING_DIR', None) or os.path.join(tempfile.gettempdir(), 'medisafe-profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+    return f'{module}:{code.co_qualname}'
+
+
+def fold(frame):
+    """The stack ending at `frame` as one "outer;...;inner" string."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """Counts the stacks of chosen threads, sampled from a daemon thread.
+
+    `threads` is a set of thread idents to sample; it may change while the
+    sampler runs (the always-on sampler's set holds the threads serving a
+    request at that moment).
+    """
+
+    def __init__(self, threads, interval=0.01):
+        self.threads = threads
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident in list(self.threads):
+            frame = frames.get(ident)
+            if frame is not None:
+                self.counts[fold(frame)] += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+            self.tick()
+
+    def tick(self):
+        """Called after every sample; subclasses hook periodic work here."""
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+
+class BackgroundSampler(StackSampler):
+    """The always-on sampler of one worker process."""
+
+    def __init__(self, interval, flush_seconds):
+        super().__init__(set(), interval)
+        self.flush_seconds = flush_seconds
+        self.pid = os.getpid()
+        self.path = os.path.join(profile_dir(), f'stacks-{self.pid}.folded')
+        self._last_flush = datetime.now()
+
+    def tick(self):
+        if (datetime.now() - self._last_flush).total_seconds() >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = datetime.now()
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as handle:
+            handle.write(self.folded())
+        os.replace(temporary, self.path)
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def background_sampler():
+    """This process's always-on sampler, started on first use."""
+    global _background
+    with _background_lock:
+        if _background is None or _background.pid != os.getpid():
+            # First call, or first call in a forked worker
+            _background = BackgroundSampler(
+                getattr(settings, 'PROFILING_SAMPLER_INTERVAL', 0.01),
+                getattr(settings, 'PROFILING_SAMPLER_FLUSH_SECONDS', 60),
+            ).start()
+        return _background
+
+
+def _output_name(view, suffix):
+    safe = ''.join(char if char.isalnum() or char in '-_' else '_' for char in view)
+    return os.path.join(profile_dir(), f'{safe}-{datetime.now():%Y%m%d-%H%M%S-%f}.{suffix}')
+
+
+def run_with_cprofile(view, func):
+    """Run func() under cProfile; (result, text report, .prof path)."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func)
+    path = _output_name(view, 'prof')
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats('cumulative').print_stats(60)
+    return result, report.getvalue(), path
+
+
+def run_with_sampler(view, func):
+    """Run func() while sampling this thread; (result, folded stacks, path)."""
+    sampler = StackSampler({threading.get_ident()}, getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.001))
+    sampler.start()
+    try:
+        result = func()
+    finally:
+        sampler.stop()
+    folded = sampler.folded()
+    path = _output_name(view, 'folded')
+    with open(path, 'w') as handle:
+        handle.write(folded)
+    return result, folded, path
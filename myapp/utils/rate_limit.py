@@ -0,0 +1,192 @@
+"""
+Rate limiting for abuse-prone endpoints (login, password reset, account
+lookup).
+
+Each request is counted against per-IP and, where the endpoint receives
+one, per-username buckets. Buckets use a sliding-window counter: the
+previous window's count is weighted by how much of it still overlaps the
+sliding window, which behaves like a token bucket of `limit` tokens that
+refills over `window` seconds, but needs only atomic increments. Counters
+live in the Django cache (shared between workers when REDIS_URL is set) and
+fall back to a process-local store if the cache is unavailable.
+
+Rates are written as "<count>/<period>" where period is a number of
+seconds or an optional multiplier with s, m or h (e.g. "5/m", "10/5m",
+"20/300"), and can be overridden per scope with settings.RATE_LIMITS.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+THROTTLED_KEY = 'rl_throttled:{}'
+
+
+def parse_rate(rate):
+    """'5/m' -> (5, 60); '10/5m' -> (10, 300); '20/90' -> (20, 90)."""
+    count, _, period = rate.partition('/')
+    unit = PERIODS.get(period[-1:], None)
+    if unit is None:
+        return int(count), int(period)
+    return int(count), int(period[:-1] or 1) * unit
+
+
+class _LocalCounters:
+    """Process-local fallback used only when the cache backend errors."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            value, expires = self._data.get(key, (0, 0))
+            if expires <= now:
+                value, expires = 0, now + ttl
+            value += 1
+            self._data[key] = (value, expires)
+            if len(self._data) > 10000:
+                self._data = {k: v for k, v in self._data.items() if v[1] > now}
+            return value
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (0, 0))
+            return value if expires > time.monotonic() else 0
+
+
+_local = _LocalCounters()
+# Per-process throttle counts; the cache copy aggregates across workers
+_throttled = {}
+_throttled_lock = threading.Lock()
+
+
+def _incr(key, ttl):
+    try:
+        if cache.add(key, 1, ttl):
+            return 1
+        return cache.incr(key)
+    except ValueError:
+        # Key expired between add() and incr()
+        cache.set(key, 1, ttl)
+        return 1
+    except Exception:
+        return _local.incr(key, ttl)
+
+
+def _get(key):
+    try:
+        return cache.get(key, 0)
+    except Exception:
+        return _local.get(key)
+
+
+def hit(scope, identity, limit, window):
+    """Count one request; return seconds to wait if over the limit, else 0."""
+    now = time.time()
+    window_start = int(now // window) * window
+    base = f"rl:{scope}:{identity}"
+    current = _incr(f"{base}:{window_start}", window * 2)
+    previous = _get(f"{base}:{window_start - window}")
+    elapsed = now - window_start
+    estimate = previous * (window - elapsed) / window + current
+    if estimate <= limit:
+        return 0
+    return max(1, math.ceil(window - elapsed))
+
+
+def _record_throttle(scope):
+    with _throttled_lock:
+        _throttled[scope] = _throttled.get(scope, 0) + 1
+    _incr(THROTTLED_KEY.format(scope), 60 * 60 * 24 * 30)
+
+
+def throttle_counters(scopes=None):
+    """Throttled-request counts per scope: {'scope': {'process': n, 'total': n}}."""
+    with _throttled_lock:
+        local = dict(_throttled)
+    scopes = scopes or local.keys()
+    return {
+        scope: {'process': local.get(scope, 0), 'total': _get(THROTTLED_KEY.format(scope))}
+        for scope in scopes
+    }
+
+
+def client_ip(request):
+    """
+    The client address. With RATE_LIMIT_TRUST_X_FORWARDED_FOR this is the
+    X-Forwarded-For entry appended by the outermost of
+    RATE_LIMIT_TRUSTED_PROXIES proxies; anything left of it is client-supplied.
+    """
+    if getattr(settings, 'RATE_LIMIT_TRUST_X_FORWARDED_FOR', False):
+        entries = [e.strip() for e in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if e.strip()]
+        if entries:
+            depth = max(1, getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 1))
+            return entries[-min(depth, len(entries))]
+    return request.META.get('REMOTE_ADDR', '') or 'unknown'
+
+
+def _request_value(request, field):
+    value = request.POST.get(field)
+    if value is None and request.content_type == 'application/json' and request.body:
+        try:
+            data = json.loads(request.body)
+            value = data.get(field) if isinstance(data, dict) else None
+        except (ValueError, UnicodeDecodeError):
+            value = None
+    return (str(value).strip().lower() if value else '')
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+def rate_limit(scope, ip_rate, username_rate=None, username_field=None):
+    """Throttle a view per client IP and optionally per submitted username.
+
+    Over-limit requests get a 429 JSON response with a Retry-After header.
+    Only POST requests are counted.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST' or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+                return view_func(request, *args, **kwargs)
+
+            overrides = getattr(settings, 'RATE_LIMITS', {}).get(scope, {})
+            checks = [('ip', _digest(client_ip(request)), overrides.get('ip', ip_rate))]
+            if username_field and (overrides.get('username') or username_rate):
+                username = _request_value(request, username_field)
+                if username:
+                    checks.append(('user', _digest(username), overrides.get('username', username_rate)))
+
+            retry_after = 0
+            for kind, identity, rate in checks:
+                limit, window = parse_rate(rate)
+                retry_after = max(retry_after, hit(f"{scope}:{kind}", identity, limit, window))
+
+            if retry_after:
+                _record_throttle(scope)
+                logger.warning("Rate limit hit for %s from %s", scope, client_ip(request))
+                response = JsonResponse({
+                    "message": "Too many attempts. Please wait a moment and try again.",
+                    "success": False,
+                    "retry_after": retry_after,
+                }, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
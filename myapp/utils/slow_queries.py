@@ -0,0 +1,217 @@
+"""
+Slow-statement archive (SlowQuery model).
+
+RequestMetricsMiddleware's execute wrapper hands every statement that took
+at least SLOW_QUERY_MS to `observe()`, with the view and the project line
+that issued it. Statements are grouped by fingerprint: the SQL with
+literals, placeholders and IN lists normalized, so `name ILIKE %s` with
+different search terms, or `IN (%s, %s)` and `IN (%s, %s, %s)`, count as
+one query. Totals are buffered in-process and added to the table every
+SLOW_QUERY_FLUSH_SECONDS by a background thread (and on exit).
+
+At flush time a fingerprint without a plan, or a sampled one
+(SLOW_QUERY_EXPLAIN_SAMPLE_RATE) whose plan is older than
+SLOW_QUERY_EXPLAIN_INTERVAL seconds, is explained with its latest
+parameters. Only read-only SELECTs get `EXPLAIN (ANALYZE, BUFFERS)` on
+PostgreSQL (inside a rolled back transaction). Row-locking reads (FOR
+UPDATE/SHARE) and statements that write, CTEs included, get plain EXPLAIN,
+which plans without running them, as does every other database. String
+literals in the plan (the parameters: usernames, emails, search terms) are
+replaced by '?' before it is stored, and plans older than
+SLOW_QUERY_PLAN_DAYS are cleared. `manage.py slow_queries` ranks the
+fingerprints by total time.
+"""
+
+import atexit
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from myapp.models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+# Anything that takes row locks or writes when run
+_NOT_READ_ONLY = re.compile(
+    r"\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(?:KEY\s+)?SHARE\b|\b(?:INSERT|UPDATE|DELETE|MERGE)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize(sql):
+    """`sql` with literals and placeholders as ?, IN lists as (...) and
+    whitespace collapsed."""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+class SlowQueryRecorder:
+    def __init__(self, flush_interval=30.0):
+        self.flush_interval = flush_interval
+        self._pending = {}  # fingerprint -> totals and the latest sample
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def observe(self, sql, params, many, seconds, view, call_site):
+        query = normalize(sql)
+        key = fingerprint(query)
+        ms = seconds * 1000
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'query': query, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry.update(sql=sql, params=None if many else params, view=view[:200], call_site=call_site[:255])
+        self._start_timer()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Add the buffered totals to the table; returns the number of
+        fingerprints written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        written = 0
+        self._expire_plans()
+        for key, entry in batch.items():
+            try:
+                row = self._save(key, entry)
+                if self._explain_due(row):
+                    row.plan = explain(entry['sql'], entry['params'])
+                    row.plan_at = timezone.now()
+                    row.save(update_fields=['plan', 'plan_at'])
+                written += 1
+            except Exception:
+                logger.exception("Failed to record slow query %s", key)
+        return written
+
+    @staticmethod
+    def _save(key, entry):
+        now = timezone.now()
+        changes = {
+            'count': F('count') + entry['count'],
+            'total_ms': F('total_ms') + entry['total_ms'],
+            'max_ms': Greatest(F('max_ms'), entry['max_ms']),
+            'view': entry['view'],
+            'call_site': entry['call_site'],
+            'last_seen': now,
+        }
+        if not SlowQuery.objects.filter(fingerprint=key).update(**changes):
+            try:
+                with transaction.atomic():
+                    return SlowQuery.objects.create(
+                        fingerprint=key, query=entry['query'], count=entry['count'],
+                        total_ms=entry['total_ms'], max_ms=entry['max_ms'], view=entry['view'],
+                        call_site=entry['call_site'], first_seen=now, last_seen=now,
+                    )
+            except IntegrityError:
+                # Another worker created it first
+                SlowQuery.objects.filter(fingerprint=key).update(**changes)
+        return SlowQuery.objects.get(fingerprint=key)
+
+    @staticmethod
+    def _expire_plans():
+        cutoff = timezone.now() - timedelta(days=getattr(settings, 'SLOW_QUERY_PLAN_DAYS', 7))
+        SlowQuery.objects.filter(plan_at__lt=cutoff).update(plan='', plan_at=None)
+
+    @staticmethod
+    def _explain_due(row):
+        if row.plan_at is None:
+            return True
+        interval = getattr(settings, 'SLOW_QUERY_EXPLAIN_INTERVAL', 3600)
+        if timezone.now() - row.plan_at < timedelta(seconds=interval):
+            return False
+        return random.random() < getattr(settings, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1)
+
+    def _start_timer(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='slow-query-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                if self.pending():
+                    self.flush()
+            finally:
+                connection.close()
+
+
+def is_read_only(sql):
+    """True for a SELECT (or WITH ... SELECT) that neither locks rows nor
+    writes, i.e. one that is safe to run again with EXPLAIN ANALYZE."""
+    stripped = _STRING.sub("''", sql).lstrip()
+    return stripped.upper().startswith(('SELECT', 'WITH')) and not _NOT_READ_ONLY.search(stripped)
+
+
+def redact(plan):
+    """`plan` with its string literals replaced by '?'."""
+    return _STRING.sub("'?'", plan)
+
+
+def explain(sql, params):
+    """The plan of `sql` on the default database as text, with string
+    literals redacted. Only read-only SELECTs are run (EXPLAIN ANALYZE,
+    PostgreSQL), inside a transaction that is rolled back."""
+    if params is None:
+        return '(not explained: executemany)'
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if is_read_only(sql) else 'EXPLAIN'
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        prefix = 'EXPLAIN'
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                rows = cursor.fetchall()
+            transaction.set_rollback(True)
+    except Exception as exc:
+        return redact(f'(not explained: {exc})')
+    if connection.vendor == 'sqlite':
+        return redact('\n'.join(str(row[-1]) for row in rows))
+    return redact('\n'.join('\t'.join(str(column) for column in row) for row in rows))
+
+
+recorder = SlowQueryRecorder(flush_interval=getattr(settings, 'SLOW_QUERY_FLUSH_SECONDS', 30.0))
+atexit.register(recorder.flush)
+
+
+def observe(sql, params, many, seconds, view, call_site):
+    recorder.observe(sql, params, many, seconds, view, call_site)
+
+
+def flush_slow_queries():
+    return recorder.flush()
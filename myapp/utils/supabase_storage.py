@@ -4,7 +4,6 @@ Provides functions to upload files to Supabase Storage and get public URLs.
 """
 
 import os
-from supabase import create_client
 from django.core.files.uploadedfile import UploadedFile
 import uuid
 from datetime import datetime